@@ -0,0 +1,87 @@
+"""
+Admin changelists and bulk actions on a big item table.
+
+    python -m benchmarks.bench_admin --items 300000
+
+Seeds a throwaway database, then times, as a logged-in superuser:
+- the unfiltered item changelist with an exact COUNT(*) against the
+  estimated count;
+- a search as the old admin ran it (icontains on name, description and the
+  joined seller__username) against the current one;
+- hiding 5000 selected items with the bulk action (one UPDATE) against
+  saving them one by one.
+"""
+import argparse
+import statistics
+import time
+
+from benchmarks.common import make_users, setup_django
+
+
+def median_ms(func, runs):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=300_000)
+    parser.add_argument('--selected', type=int, default=5_000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from decimal import Decimal
+    from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+    from django.db.models import Q
+    from django.test import Client, override_settings
+    from marketplace.models import CustomUser, Item
+
+    user_ids = make_users(500)
+    Item.objects.bulk_create([
+        Item(seller_id=user_ids[n % len(user_ids)], name=f"Item {n}", description="Second-hand item in good condition",
+             price=Decimal("10.00"), category="Books")
+        for n in range(args.items)
+    ], batch_size=5000)
+    CustomUser.objects.filter(pk=user_ids[0]).update(is_staff=True, is_superuser=True)
+
+    # A form post of thousands of checkboxes exceeds DATA_UPLOAD_MAX_NUMBER_FIELDS
+    with override_settings(ALLOWED_HOSTS=['testserver'], DATA_UPLOAD_MAX_NUMBER_FIELDS=None):
+        client = Client()
+        client.force_login(CustomUser.objects.get(pk=user_ids[0]))
+        url = '/admin/marketplace/item/'
+        with override_settings(ADMIN_EXACT_COUNT_LIMIT=10 ** 12):
+            exact = median_ms(lambda: client.get(url), args.runs)
+        estimated = median_ms(lambda: client.get(url), args.runs)
+
+        old_search = Q(name__icontains='bench9') | Q(description__icontains='bench9') \
+            | Q(seller__username__icontains='bench9')
+        joined = median_ms(lambda: Item.objects.filter(old_search).count(), args.runs)
+        own_columns = median_ms(lambda: Item.objects.filter(
+            Q(name__icontains='bench9') | Q(description__icontains='bench9')).count(), args.runs)
+        by_seller = median_ms(lambda: client.get(url, {'q': 'seller:bench9'}), args.runs)
+
+        selected = list(Item.objects.values_list('pk', flat=True)[:args.selected])
+        start = time.perf_counter()
+        client.post(url, {'action': 'hide_items', ACTION_CHECKBOX_NAME: selected})
+        bulk = time.perf_counter() - start
+        assert Item.objects.filter(status='Hidden').count() == len(selected)
+
+    start = time.perf_counter()
+    for item in Item.objects.filter(pk__in=selected):
+        item.status = 'Available'
+        item.save(update_fields=['status'])
+    one_by_one = time.perf_counter() - start
+
+    print(f"item changelist, {args.items} rows: exact count {exact:8.1f} ms, estimated {estimated:8.1f} ms")
+    print(f"search count: with seller join {joined:8.1f} ms, own columns {own_columns:8.1f} ms; "
+          f"seller:<username> changelist {by_seller:8.1f} ms")
+    print(f"hide {len(selected)} items: bulk action {bulk * 1e3:8.1f} ms, one save each {one_by_one * 1e3:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Space reclaimed and hot-query speedups from archiving.
+
+    python -m benchmarks.bench_archive --old 50000 --recent 5000
+
+Seeds a throwaway database with `--old` sold items, purchases and read
+messages from three years ago plus `--recent` current ones, then runs
+`manage.py archive_data --vacuum`, which prints the rows moved, the hot tables' and database
+size before/after and the hot-query timings before/after.
+"""
+import argparse
+from datetime import timedelta
+from decimal import Decimal
+
+from benchmarks.common import make_users, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--old', type=int, default=50_000)
+    parser.add_argument('--recent', type=int, default=5_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.core.management import call_command
+    from django.utils import timezone
+    from marketplace.models import Item, Message, Transaction
+
+    seller_id, buyer_id = make_users(2)
+    long_ago = timezone.now() - timedelta(days=3 * 365)
+
+    def seed(count, status, when):
+        first_new = (Item.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        Item.objects.bulk_create([
+            Item(seller_id=seller_id, name=f"Item {n}", description="Second-hand item in good condition " * 3,
+                 price=Decimal("12.00"), category="Books", status=status)
+            for n in range(count)
+        ], batch_size=2000)
+        items = Item.objects.filter(id__gte=first_new)
+        items.update(created_at=when)
+        if status == 'Sold':
+            Transaction.objects.bulk_create([
+                Transaction(buyer_id=buyer_id, item_id=item_id, total_price=Decimal("12.00"), status='Sold')
+                for item_id in items.values_list('id', flat=True)
+            ], batch_size=2000)
+            Transaction.objects.filter(item__in=items).update(date_initiated=when)
+        first_message = (Message.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        Message.objects.bulk_create([
+            Message(sender_id=buyer_id, receiver_id=seller_id, content=f"Is item {n} still available?", is_read=True)
+            for n in range(count)
+        ], batch_size=2000)
+        Message.objects.filter(id__gte=first_message).update(timestamp=when)
+
+    seed(args.old, 'Sold', long_ago)
+    seed(args.recent, 'Available', timezone.now())
+    call_command('archive_data', '--vacuum')
+
+
+if __name__ == '__main__':
+    main()
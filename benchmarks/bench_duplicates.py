@@ -0,0 +1,97 @@
+"""
+Duplicate-listing lookup: LSH buckets vs comparing against every listing.
+
+    python -m benchmarks.bench_duplicates --items 50000 --reposts 500
+
+Seeds a throwaway catalogue of `--items` listings from `--sellers` sellers,
+with `--reposts` lightly edited re-posts mixed in. It then:
+- backfills signatures with `index_duplicates --no-check` (listings/second);
+- times one re-post lookup through the bucket index (find_duplicates)
+  against a linear scan that compares the MinHash of every listing;
+- reports how many re-posts the index found (recall) and how many of the
+  other listings it flagged by mistake.
+"""
+import argparse
+import random
+import statistics
+import time
+from io import StringIO
+
+from benchmarks.common import make_users, setup_django
+
+WORDS = ("calculator textbook desk lamp chair bike jacket monitor kettle headphones guitar mattress "
+         "shelf printer backpack charger fan rug mirror blender novel laptop stand hoodie boots").split()
+
+
+def listing(rng):
+    name = ' '.join(rng.sample(WORDS, 3)).title()
+    description = ' '.join(rng.choice(WORDS) for _ in range(25)) + f". Collect from hall {rng.randint(1, 99)}."
+    return name, description
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=50_000)
+    parser.add_argument('--sellers', type=int, default=2_000)
+    parser.add_argument('--reposts', type=int, default=500)
+    args = parser.parse_args()
+
+    setup_django()
+    import numpy as np
+    from decimal import Decimal
+    from django.core.management import call_command
+    from marketplace import duplicates
+    from marketplace.models import Item, ItemSignature
+
+    rng = random.Random(3)
+    seller_ids = make_users(args.sellers)
+    originals = []
+    for n in range(args.items - args.reposts):
+        name, description = listing(rng)
+        originals.append(Item(seller_id=seller_ids[n % len(seller_ids)], name=name, description=description,
+                              price=Decimal("10.00"), category="Others"))
+    reposts = [Item(seller_id=original.seller_id, name=original.name.lower(),
+                    description=original.description + " Still available!",
+                    price=Decimal("9.00"), category="Others")
+               for original in rng.sample(originals, args.reposts)]
+    Item.objects.bulk_create(originals + reposts, batch_size=5000)
+
+    start = time.perf_counter()
+    call_command('index_duplicates', '--no-check', '--batch-size', '1000', stdout=StringIO())
+    backfill = time.perf_counter() - start
+
+    repost_items = list(Item.objects.filter(price=Decimal("9.00")).select_related('signature'))
+    lookup_times, found = [], 0
+    for item in repost_items:
+        start = time.perf_counter()
+        matches = duplicates.find_duplicates(item, item.signature)
+        lookup_times.append(time.perf_counter() - start)
+        found += bool(matches)
+
+    false_positives = 0
+    for item in Item.objects.filter(price=Decimal("10.00")).select_related('signature')[:args.reposts]:
+        matches = duplicates.find_duplicates(item, item.signature)
+        # An original legitimately matches its own re-post
+        false_positives += any(Item.objects.get(pk=pk).price != Decimal("9.00") for pk, _ in matches)
+
+    def linear_scan(item):
+        target = np.frombuffer(bytes(item.signature.minhash), dtype=np.uint32)
+        rows = ItemSignature.objects.exclude(item_id=item.pk).values_list('item_id', 'minhash')
+        return [pk for pk, value in rows.iterator(chunk_size=5000)
+                if duplicates.text_similarity(target, np.frombuffer(bytes(value), dtype=np.uint32)) >= 0.85]
+
+    scan_times = []
+    for item in repost_items[:5]:
+        start = time.perf_counter()
+        linear_scan(item)
+        scan_times.append(time.perf_counter() - start)
+
+    print(f"backfill {args.items} listings: {backfill:.1f} s ({args.items / backfill:.0f}/s)")
+    print(f"lookup per listing: LSH buckets {statistics.median(lookup_times) * 1e3:8.2f} ms, "
+          f"linear scan {statistics.median(scan_times) * 1e3:8.1f} ms")
+    print(f"re-posts found {found}/{len(repost_items)}; "
+          f"originals wrongly matched to another original {false_positives}/{args.reposts}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+"""
+Memory and time of exporting a year of transactions.
+
+    python -m benchmarks.bench_exports --transactions 200000
+
+Seeds a throwaway database with `--transactions` sold transactions spread
+over 2024, then compares, under tracemalloc:
+- loading the same rows in one go with select_related and writing them
+  with csv.writer into one string, which is what a non-streaming view does;
+- GET /export/transactions/?from=2024-01-01&to=2024-12-31, consuming the
+  streamed body chunk by chunk.
+"""
+import argparse
+import csv
+import io
+import time
+import tracemalloc
+
+from benchmarks.common import make_users, setup_django
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed, peak / 2 ** 20
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, default=200_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from datetime import datetime, timedelta, timezone as dt_timezone
+    from decimal import Decimal
+    from django.test import Client, override_settings
+    from marketplace import exports
+    from marketplace.models import CustomUser, Item, Transaction
+
+    seller_id, buyer_id, staff_id = make_users(3)
+    CustomUser.objects.filter(pk=staff_id).update(is_staff=True)
+    Item.objects.bulk_create([
+        Item(seller_id=seller_id, name=f"Item {n}", description="Pick up on campus", price=Decimal("5.00"),
+             category="Books", status='Sold')
+        for n in range(args.transactions)
+    ], batch_size=5000)
+    start_of_year = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+    step = timedelta(days=366) / args.transactions
+    Transaction.objects.bulk_create([
+        Transaction(buyer_id=buyer_id, item_id=item_id, total_price=Decimal("5.00"), status='Sold')
+        for item_id in Item.objects.values_list('id', flat=True)
+    ], batch_size=5000)
+    # date_initiated is auto_now_add, so spread the rows over the year afterwards
+    pks = list(Transaction.objects.order_by('pk').values_list('pk', flat=True))
+    for n in range(0, len(pks), 5000):
+        Transaction.objects.filter(pk__in=pks[n:n + 5000]).update(date_initiated=start_of_year + step * n)
+
+    def all_at_once():
+        rows = list(Transaction.objects.select_related('buyer', 'item__seller').order_by('date_initiated'))
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow([header for header, _ in exports.TRANSACTION_COLUMNS])
+        writer.writerows([value(row) for _, value in exports.TRANSACTION_COLUMNS] for row in rows)
+        return out.getvalue().count('\n') - 1
+
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        client.force_login(CustomUser.objects.get(pk=staff_id))
+
+        def streamed():
+            response = client.get('/export/transactions/', {'from': '2024-01-01', 'to': '2024-12-31'})
+            lines = 0
+            for chunk in response.streaming_content:
+                lines += chunk.count(b'\n')
+            return lines - 1
+
+        loaded_rows, loaded_time, loaded_peak = measure(all_at_once)
+        streamed_rows, streamed_time, streamed_peak = measure(streamed)
+
+    assert loaded_rows == streamed_rows == args.transactions, (loaded_rows, streamed_rows)
+    print(f"{args.transactions} transactions, all at once: {loaded_time:6.1f} s, peak {loaded_peak:7.1f} MiB")
+    print(f"{args.transactions} transactions, streamed:    {streamed_time:6.1f} s, peak {streamed_peak:7.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
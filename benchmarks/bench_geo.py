@@ -0,0 +1,73 @@
+"""
+"Items near me" lookups: grid-cell index vs computing every distance.
+
+    python -m benchmarks.bench_geo --users 20000 --items 100000
+
+Seeds a throwaway database with sellers spread over a 10 km square around
+campus (coordinates written directly, as if the gazetteer covered the whole
+city) and their items. It then times the first page of home's near-me
+listing (the nearest 50 Available items within each radius) two ways: with
+the geo_cell lookup, and by computing the distance for every Available item.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.common import make_users, setup_django
+
+PAGE = 50
+
+
+def median_ms(func, runs=20):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=20_000)
+    parser.add_argument('--items', type=int, default=100_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from decimal import Decimal
+    from marketplace import geo
+    from marketplace.models import CustomUser, Item
+
+    rng = random.Random(42)
+    library = geo.PLACES['library']
+    user_ids = make_users(args.users)
+    sellers = []
+    for user_id in user_ids:
+        lat = library.lat + rng.uniform(-0.045, 0.045)   # ±5 km
+        lon = library.lon + rng.uniform(-0.08, 0.08)
+        sellers.append(CustomUser(id=user_id, latitude=lat, longitude=lon, geo_cell=geo.grid_cell(lat, lon)))
+    CustomUser.objects.bulk_update(sellers, ['latitude', 'longitude', 'geo_cell'], batch_size=2000)
+    Item.objects.bulk_create([
+        Item(seller_id=rng.choice(user_ids), name=f"Item {n}", description="Pick up on campus",
+             price=Decimal("10.00"), category="Books", status=rng.choice(['Available'] * 4 + ['Sold']))
+        for n in range(args.items)
+    ], batch_size=5000)
+
+    available = Item.objects.filter(status='Available')
+    print(f"{args.users} sellers, {args.items} items; nearest {PAGE} Available items to {library.name}")
+    for radius in geo.RADIUS_CHOICES:
+        def indexed():
+            return list(geo.items_near(available, library.lat, library.lon, radius).order_by('distance')[:PAGE])
+
+        def scan():
+            return list(available.annotate(distance=geo.distance_expression(library.lat, library.lon, 'seller__'))
+                        .filter(distance__lte=radius).order_by('distance')[:PAGE])
+
+        assert [item.id for item in indexed()] == [item.id for item in scan()]
+        print(f"within {radius:>4} m   geo_cell index {median_ms(indexed):7.2f} ms   "
+              f"full scan {median_ms(scan):7.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
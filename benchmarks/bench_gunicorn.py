@@ -0,0 +1,166 @@
+"""
+Memory per worker and throughput under gunicorn.conf.py, with and without preloading.
+
+    python -m benchmarks.bench_gunicorn --workers 4 --clients 16 --seconds 20
+
+Seeds a throwaway database and collects static files into a temporary
+STATIC_ROOT. Then, for preload on and off, it starts gunicorn with the
+project config (DEBUG off) and replays a request mix over keep-alive
+connections:
+- home, plain and with a search and a category;
+- item detail pages;
+- the /healthz probe.
+All requests must return 200. It prints:
+- requests per second, with p50/p99 latency;
+- each worker's memory after the run: RSS, PSS (shared pages split between
+  the processes sharing them) and USS (pages only that worker has).
+
+Needs gunicorn (pinned in requirements.txt). Without REDIS_URL the workers
+run with per-process caches and event buses (DJANGO_LOCAL_STATE=1), which
+serves this request mix but is not how production runs.
+"""
+import argparse
+import http.client
+import os
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import BASE_DIR, make_users, setup_django
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def memory_kib(pid):
+    """{'rss', 'pss', 'uss'} in KiB from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    with open(f'/proc/{pid}/smaps_rollup') as rollup:
+        for line in rollup:
+            name, _, rest = line.partition(':')
+            if rest.strip().endswith('kB'):
+                fields[name] = int(rest.split()[0])
+    return {'rss': fields['Rss'], 'pss': fields['Pss'], 'uss': fields['Private_Clean'] + fields['Private_Dirty']}
+
+
+def children(pid):
+    with open(f'/proc/{pid}/task/{pid}/children') as listing:
+        return [int(child) for child in listing.read().split()]
+
+
+def get(connection, path):
+    connection.request('GET', path, headers={'Host': '127.0.0.1'})
+    response = connection.getresponse()
+    response.read()
+    return response.status
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            if get(connection, '/readyz') == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("gunicorn did not become ready")
+
+
+def replay(port, paths, clients, seconds):
+    """Send random paths from `clients` threads for `seconds`; returns the latencies in seconds."""
+    latencies, failures = [], []
+    deadline = time.monotonic() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        while time.monotonic() < deadline:
+            path = rng.choice(paths)
+            start = time.perf_counter()
+            status = get(connection, path)
+            latencies.append(time.perf_counter() - start)
+            if status != 200:
+                failures.append((path, status))
+        connection.close()
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures, failures[:5]
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--seconds', type=float, default=20)
+    parser.add_argument('--items', type=int, default=300)  # home lists every one
+    args = parser.parse_args()
+
+    db_path = setup_django()
+    from decimal import Decimal
+    from marketplace.models import Item
+
+    user_ids = make_users(50)
+    categories = ('Books', 'Electronics', 'Furniture')
+    Item.objects.bulk_create([
+        Item(seller_id=user_ids[n % len(user_ids)], name=f"Desk lamp {n}" if n % 10 == 0 else f"Item {n}",
+             description="Second-hand, collect on campus", price=Decimal("12.50"), category=categories[n % 3])
+        for n in range(args.items)
+    ], batch_size=1000)
+    item_ids = Item.objects.values_list('pk', flat=True)[:20]
+    paths = ['/', '/?q=lamp', '/?category=Books', '/healthz'] + [f'/item/{pk}/' for pk in item_ids]
+
+    static_root = tempfile.mkdtemp(prefix='bench-static-')
+    env = dict(os.environ, DJANGO_DEBUG='0', PRIMARY_DB=str(db_path), STATIC_ROOT=static_root,
+               DJANGO_ALLOWED_HOSTS='127.0.0.1', WEB_CONCURRENCY=str(args.workers),
+               GUNICORN_THREADS=str(args.threads))
+    if not env.get('REDIS_URL'):
+        env['DJANGO_LOCAL_STATE'] = '1'
+    subprocess.run([sys.executable, 'manage.py', 'collectstatic', '--noinput', '-v0'],
+                   cwd=BASE_DIR, env=env, check=True)
+
+    print(f"{args.workers} workers x {args.threads} threads, {args.clients} clients for {args.seconds:.0f}s")
+    for preload in ('1', '0'):
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--access-logfile', '/dev/null', '--error-logfile', '/dev/null'],
+            cwd=BASE_DIR, env=dict(env, GUNICORN_PRELOAD=preload, GUNICORN_BIND=f'127.0.0.1:{port}'),
+        )
+        try:
+            wait_ready(port)
+            time.sleep(1)  # let every worker finish booting
+            replay(port, paths, args.clients, 2)  # warm up: templates compiled, caches filled
+            latencies = replay(port, paths, args.clients, args.seconds)
+            workers = [memory_kib(pid) for pid in children(server.pid)]
+            master = memory_kib(server.pid)
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(timeout=60)
+
+        latencies.sort()
+        mean = {key: statistics.mean(worker[key] for worker in workers) / 1024 for key in ('rss', 'pss', 'uss')}
+        total_pss = (sum(worker['pss'] for worker in workers) + master['pss']) / 1024
+        print(f"preload={preload}: {len(latencies) / args.seconds:7.0f} req/s, "
+              f"p50 {latencies[len(latencies) // 2] * 1e3:6.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1e3:6.1f} ms")
+        print(f"           per worker RSS {mean['rss']:6.1f} MiB, PSS {mean['pss']:6.1f} MiB, USS {mean['uss']:6.1f} MiB; "
+              f"all processes PSS {total_pss:6.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Cost of keeping home current: refreshing the page vs the live event feed.
+
+    python -m benchmarks.bench_live --items 2000 --listeners 200
+
+Seeds a throwaway database, then compares:
+- one full home request (queries plus render, all bytes), which is what
+  each refresh costs;
+- one Item save published to `--listeners` threads blocked on the
+  in-process broadcaster: the time until every listener has the event, and
+  its size on the wire.
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from benchmarks.common import make_users, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=2_000)
+    parser.add_argument('--listeners', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    setup_django()
+    from decimal import Decimal
+    from django.db import transaction
+    from django.test import Client, override_settings
+    from marketplace import live
+    from marketplace.models import Item
+
+    (seller_id,) = make_users(1)
+    Item.objects.bulk_create([
+        Item(seller_id=seller_id, name=f"Item {n}", description="Second-hand item in good condition",
+             price=Decimal("10.00"), category="Books")
+        for n in range(args.items)
+    ], batch_size=2000)
+
+    page_times, page_bytes = [], 0
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        client.get('/')
+        for _ in range(args.runs):
+            start = time.perf_counter()
+            page_bytes = len(b''.join(client.get('/').streaming_content))
+            page_times.append(time.perf_counter() - start)
+
+    broadcaster = live.get_broadcaster()
+    item = Item.objects.first()
+    fan_out_times, event_bytes = [], 0
+    for run in range(args.runs):
+        after = broadcaster.latest_id()
+        received = []
+        listeners = [threading.Thread(target=lambda: received.append(broadcaster.read(after, timeout=10)))
+                     for _ in range(args.listeners)]
+        for listener in listeners:
+            listener.start()
+        time.sleep(0.2)  # let every listener block
+        start = time.perf_counter()
+        with transaction.atomic():
+            item.price = Decimal(20 + run)
+            item.save(update_fields=['price'])
+        for listener in listeners:
+            listener.join()
+        fan_out_times.append(time.perf_counter() - start)
+        assert len(received) == args.listeners and all(received)
+        event_bytes = len(live.format_event(*received[0][0]))
+
+    print(f"home with {args.items} items: {statistics.median(page_times) * 1e3:8.1f} ms, "
+          f"{page_bytes / 1024:8.1f} kB per refresh")
+    print(f"one price change to {args.listeners} listeners: {statistics.median(fan_out_times) * 1e3:8.1f} ms "
+          f"(save + delivery), {event_bytes} bytes per listener")
+
+
+if __name__ == '__main__':
+    main()
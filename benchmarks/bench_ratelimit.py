@@ -0,0 +1,55 @@
+"""
+Happy-path overhead of @rate_limit.
+
+    python -m benchmarks.bench_ratelimit --calls 100000
+
+Times a trivial POST view with and without the decorator, for many distinct
+users so every call finds a bucket with tokens left. Uses the Redis store when
+REDIS_URL is set, the per-process store otherwise.
+"""
+import argparse
+
+from benchmarks.common import setup_django, time_per_call
+
+
+class FakeUser:
+    is_authenticated = True
+
+    def __init__(self, pk):
+        self.pk = pk
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=100_000)
+    parser.add_argument('--users', type=int, default=5_000)
+    args = parser.parse_args()
+
+    setup_django(temp_db=False)
+    from django.conf import settings
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from marketplace.ratelimit import rate_limit
+
+    requests = []
+    for n in range(args.users):
+        request = RequestFactory().post('/offer/')
+        request.user = FakeUser(n)
+        requests.append(request)
+
+    def view(request):
+        return HttpResponse()
+
+    # Generous enough that nothing is ever limited: this measures the bookkeeping only
+    limited = rate_limit('1000000/s')(view)
+
+    store = 'redis' if getattr(settings, 'REDIS_URL', None) else 'memory'
+    plain = time_per_call(lambda i: view(requests[i % args.users]), args.calls)
+    decorated = time_per_call(lambda i: limited(requests[i % args.users]), args.calls)
+    print(f"{args.calls} POSTs across {args.users} users ({store} buckets)")
+    print(f"undecorated view     {plain:8.2f} us/request")
+    print(f"@rate_limit view     {decorated:8.2f} us/request  (+{decorated - plain:.2f} us)")
+
+
+if __name__ == '__main__':
+    main()
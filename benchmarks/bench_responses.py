@@ -0,0 +1,93 @@
+"""
+Time to first byte and payload size for the long list pages.
+
+    python -m benchmarks.bench_responses --items 5000 --purchases 2000 --runs 5
+
+Pages are fetched through the full middleware stack; home also with the
+trending sort, after one ranking run. "first byte" is when the
+first chunk that decodes to page content is ready; a compressed stream's
+header alone does not count. "last byte" is when the whole page is done,
+which is also when the first byte went out before streaming, since the page
+used to be rendered fully in memory. Sizes are measured without compression,
+with gzip and with brotli (pinned in requirements.txt; skipped if missing).
+"""
+import argparse
+import statistics
+import time
+import zlib
+from decimal import Decimal
+
+from benchmarks.common import make_users, setup_django
+
+
+def decoder(encoding):
+    """A function from a chunk as sent to the page bytes it decodes to so far."""
+    if encoding == 'gzip':
+        return zlib.decompressobj(16 + zlib.MAX_WBITS).decompress
+    if encoding == 'br':
+        from marketplace.storage import load_brotli
+        return load_brotli().Decompressor().process
+    return bytes
+
+
+def fetch(client, url, encoding):
+    """Return (seconds to first content, seconds to last chunk, body bytes)."""
+    start = time.perf_counter()
+    response = client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+    if not response.streaming:
+        elapsed = time.perf_counter() - start
+        return elapsed, elapsed, len(response.content)
+    decode = decoder(response.get('Content-Encoding', 'identity'))
+    first = None
+    size = 0
+    for chunk in response.streaming_content:
+        if first is None and decode(chunk):
+            first = time.perf_counter() - start
+        size += len(chunk)
+    return first, time.perf_counter() - start, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--items', type=int, default=5_000)
+    parser.add_argument('--purchases', type=int, default=2_000)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.test import Client
+    from django.test.utils import override_settings
+    from marketplace import trending
+    from marketplace.models import CustomUser, Item, Transaction
+    from marketplace.storage import load_brotli
+
+    seller_id, buyer_id = make_users(2)
+    Item.objects.bulk_create([
+        Item(seller_id=seller_id, name=f"Item {n}", description="A well kept second-hand item " * 4,
+             price=Decimal("9.99"), category="Books")
+        for n in range(args.items)
+    ], batch_size=1000)
+    item_ids = list(Item.objects.values_list('id', flat=True)[:args.purchases])
+    Transaction.objects.bulk_create([
+        Transaction(buyer_id=buyer_id, item_id=item_id, total_price=Decimal("9.99"), status='Sold')
+        for item_id in item_ids
+    ], batch_size=1000)
+    CustomUser.objects.filter(pk=buyer_id).update(is_staff=True)
+    trending.refresh_trending()
+
+    encodings = ['identity', 'gzip'] + (['br'] if load_brotli() else [])
+    with override_settings(ALLOWED_HOSTS=['testserver']):
+        client = Client()
+        client.force_login(CustomUser.objects.get(pk=buyer_id))
+        print(f"{args.items} items, {args.purchases} purchases, median of {args.runs} runs")
+        for url in ['/', '/?sort=trending', '/admin_dashboard/', '/purchase_history/']:
+            for encoding in encodings:
+                runs = [fetch(client, url, encoding) for _ in range(args.runs)]
+                first = statistics.median(r[0] for r in runs) * 1e3
+                last = statistics.median(r[1] for r in runs) * 1e3
+                print(f"{url:<20} {encoding:<9} first byte {first:8.1f} ms   "
+                      f"last byte {last:8.1f} ms   {runs[0][2]:>10,} B")
+
+
+if __name__ == '__main__':
+    main()
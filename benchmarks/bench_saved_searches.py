@@ -0,0 +1,105 @@
+"""
+Matching new listings against saved searches.
+
+    python -m benchmarks.bench_saved_searches --searches 50000 --items 200
+
+Saves `--searches` queries, some with a category. Each query has two to four
+words from a vocabulary: ~90 common product words plus `--vocabulary` made-up
+ones standing in for brands, models and course codes. Then posts `--items` listings from the same
+vocabulary and times two matchers per listing:
+- the term index (saved_searches.match_item);
+- a full pass over every saved search, checking each one.
+Both must notify the same users. Also prints how many candidates the index
+returned per listing, and the cost of creating a listing (what add_item pays),
+which is the same with or without saved searches.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.common import make_users, setup_django
+
+WORDS = (
+    "desk lamp chair table sofa bed mattress shelf bookcase wardrobe mirror rug kettle toaster microwave "
+    "fridge fan heater monitor keyboard mouse laptop charger headphones speaker phone tablet camera printer "
+    "calculator textbook novel notes calculus physics chemistry biology economics law history guitar bike "
+    "helmet jacket coat hoodie jeans trainers boots dress scarf backpack bag wooden black white red blue "
+    "small large vintage new used ikea apple samsung casio canon sony dell hp lenovo nike adidas"
+).split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--searches', type=int, default=50_000)
+    parser.add_argument('--items', type=int, default=200)
+    parser.add_argument('--vocabulary', type=int, default=3000)
+    args = parser.parse_args()
+
+    setup_django()
+    from decimal import Decimal
+    from django.test import override_settings
+    from marketplace import saved_searches
+    from marketplace.models import Item, Notification, SavedSearch
+
+    rng = random.Random(48)
+    words = WORDS + [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(rng.randint(4, 8)))
+                     for _ in range(args.vocabulary)]
+    categories = [choice for choice, _ in Item.CATEGORY_CHOICES]
+    user_ids = make_users(2000)
+    seller_id, buyer_ids = user_ids[0], user_ids[1:]
+    searches, seen = [], set()
+    while len(searches) < args.searches:
+        query = ' '.join(rng.sample(words, rng.randint(2, 4)))
+        category = rng.choice(categories) if rng.random() < 0.3 else ''
+        user_id = rng.choice(buyer_ids)
+        if (user_id, query, category) not in seen:
+            seen.add((user_id, query, category))
+            searches.append(SavedSearch(user_id=user_id, query=query, category=category,
+                                        term=saved_searches.search_term(query, category)))
+    SavedSearch.objects.bulk_create(searches, batch_size=5000)
+
+    def listing(n):
+        text = rng.sample(words, 20)
+        return Item(seller_id=seller_id, name=' '.join(text[:3]), description=' '.join(text[3:]) + '. Collect on campus.',
+                    price=Decimal("10.00"), category=rng.choice(categories))
+
+    def full_pass(item):
+        users = set()
+        rows = SavedSearch.objects.exclude(user_id=item.seller_id).values_list('user_id', 'query', 'category')
+        for user_id, query, category in rows.iterator(chunk_size=2000):
+            if user_id not in users and saved_searches.matches(query, category, item):
+                users.add(user_id)
+        return users
+
+    # add_item's cost: the INSERT plus queueing the match on the database task queue
+    with override_settings(TASK_BACKEND='database'):
+        start = time.perf_counter()
+        items = [listing(n) for n in range(args.items)]
+        for item in items:
+            item.save()
+        create_ms = (time.perf_counter() - start) / args.items * 1e3
+
+    indexed, scanned, candidates = [], [], []
+    for item in items:
+        start = time.perf_counter()
+        saved_searches.match_item(item)
+        indexed.append(time.perf_counter() - start)
+        candidates.append(sum(1 for _ in saved_searches.candidates(item)))
+
+        start = time.perf_counter()
+        expected = full_pass(item)
+        scanned.append(time.perf_counter() - start)
+        notified = set(Notification.objects.filter(item=item, kind='saved_search').values_list('user_id', flat=True))
+        assert notified == expected, (item.name, notified ^ expected)
+
+    total = Notification.objects.filter(kind='saved_search').count()
+    print(f"{args.searches} saved searches, {args.items} new listings, {total} notifications")
+    print(f"per listing: term index {statistics.median(indexed) * 1e3:8.2f} ms "
+          f"({statistics.median(candidates):.0f} candidates), "
+          f"full pass {statistics.median(scanned) * 1e3:8.2f} ms")
+    print(f"creating a listing: {create_ms:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
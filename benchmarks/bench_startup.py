@@ -0,0 +1,121 @@
+"""
+Worker startup time and where it goes.
+
+    python -m benchmarks.bench_startup --runs 7
+
+Each target runs in `--runs` fresh interpreters, and the median wall time is
+reported:
+- wsgi: import the WSGI application, which is what a gunicorn worker does
+  before it can accept a request;
+- urls: wsgi plus loading the URLconf and every view module, which the
+  first request does;
+- reverse: urls plus the first reverse('home'), which builds the URL index
+  that every page rendering a link needs. It is printed in the time it adds
+  to the urls target;
+- check: `manage.py check`.
+
+Then the reverse target runs once more under `python -X importtime`. The
+self time of every imported module is summed by package, Django by
+subpackage and this project by module, and the `--top` costliest are
+printed.
+
+Regression gates, for CI:
+- the exit status is 1 when the wsgi, urls or reverse median exceeds
+  `--budget-ms`;
+- it is also 1 when the reverse target imports any module in LAZY_MODULES.
+  Those are loaded on first use: NumPy by the task worker, the admin
+  ModelAdmins by the first admin request or admin reverse() (see
+  student_trading.apps).
+"""
+import argparse
+import collections
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.common import BASE_DIR
+
+# Most of the budget is the interpreter and Django; it leaves room for CI machines slower than a laptop
+STARTUP_BUDGET_MS = 1500
+LAZY_MODULES = ('numpy', 'marketplace.admin', 'marketplace.duplicates', 'rest_framework', 'crispy_forms')
+
+SETUP = "import os; os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'student_trading.settings'); "
+TARGETS = {
+    'wsgi': [sys.executable, '-c', SETUP + "import student_trading.wsgi"],
+    'urls': [sys.executable, '-c', SETUP + "import student_trading.wsgi; "
+             "from django.urls import get_resolver; get_resolver().url_patterns"],
+    'reverse': [sys.executable, '-c', SETUP + "import student_trading.wsgi; "
+                "from django.urls import get_resolver, reverse; get_resolver().url_patterns; "
+                "import sys, time; start = time.perf_counter(); reverse('home'); "
+                "print((time.perf_counter() - start) * 1e3); print(' '.join(sys.modules))"],
+    'check': [sys.executable, 'manage.py', 'check'],
+}
+
+
+def run(command, extra_args=()):
+    env = dict(os.environ, PYTHONDONTWRITEBYTECODE='1')
+    start = time.perf_counter()
+    result = subprocess.run([command[0], *extra_args, *command[1:]], cwd=BASE_DIR, env=env,
+                            capture_output=True, text=True, check=True)
+    return time.perf_counter() - start, result
+
+
+def package_of(module):
+    parts = module.split('.')
+    if parts[0] == 'django':
+        return '.'.join(parts[:3])
+    if parts[0] in ('marketplace', 'student_trading'):
+        return module
+    return parts[0]
+
+
+def import_costs(stderr):
+    """Self time in ms of the modules in `-X importtime` output, summed by package_of()."""
+    costs = collections.Counter()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, module = line[len('import time:'):].split('|')
+        costs[package_of(module.strip())] += int(self_us) / 1000
+    return costs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--budget-ms', type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args()
+
+    medians = {}
+    for name, command in TARGETS.items():
+        run(command)  # warm the OS file cache
+        results = [run(command) for _ in range(args.runs)]
+        times = [elapsed for elapsed, _ in results]
+        medians[name] = statistics.median(times) * 1e3
+        print(f"{name:7} median {medians[name]:7.1f} ms  (min {min(times) * 1e3:.1f}, max {max(times) * 1e3:.1f})")
+        if name == 'reverse':
+            first = statistics.median(float(result.stdout.split()[0]) for _, result in results)
+            print(f"        of which the first reverse('home'): {first:.1f} ms")
+    baseline = statistics.median(run([sys.executable, '-c', 'pass'])[0] for _ in range(args.runs)) * 1e3
+    print(f"(a bare interpreter: {baseline:.1f} ms)")
+
+    _, result = run(TARGETS['reverse'], ['-X', 'importtime'])
+    costs = import_costs(result.stderr)
+    print(f"\nimport self time by package, reverse target: {sum(costs.values()):.1f} ms in all")
+    for package, ms in costs.most_common(args.top):
+        print(f"{ms:8.1f} ms  {package}")
+
+    failures = [f"{name} took {medians[name]:.0f} ms, over the {args.budget_ms:.0f} ms budget"
+                for name in ('wsgi', 'urls', 'reverse') if medians[name] > args.budget_ms]
+    loaded = set(result.stdout.split()[1:])
+    failures += [f"{module} is imported at startup" for module in LAZY_MODULES if module in loaded]
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
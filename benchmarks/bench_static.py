@@ -0,0 +1,75 @@
+"""
+Static bytes transferred per page view, before and after the static pipeline.
+
+    python -m benchmarks.bench_static --page /admin/login/
+
+Collects static files into a temporary STATIC_ROOT with the compressing
+manifest storage, renders the page, and fetches every /static/ asset it
+references through StaticFilesMiddleware.
+
+  before  plain names, no compression; the browser cannot cache across deploys,
+          so every view downloads every asset again
+  after   first view downloads the br/gzip variant; repeat views send no request
+          for hashed (immutable) assets and revalidate the rest with a 304
+"""
+import argparse
+import re
+import shutil
+import tempfile
+
+from benchmarks.common import setup_django
+
+ASSET_RE = re.compile(r'(?:href|src)="(/static/[^"]+)"')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--page', action='append', help="Page to measure (repeatable). Default: /admin/login/ and /")
+    args = parser.parse_args()
+    pages = args.page or ['/admin/login/', '/']
+
+    setup_django()
+    from django.core.management import call_command
+    from django.test import Client
+    from django.test.utils import override_settings
+
+    static_root = tempfile.mkdtemp(prefix='bench-static-')
+    storages = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'marketplace.storage.CompressedManifestStaticFilesStorage'},
+    }
+    try:
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver'], STATIC_ROOT=static_root, STORAGES=storages):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            client = Client()
+            for page in pages:
+                html = client.get(page).content.decode()
+                assets = sorted(set(ASSET_RE.findall(html)))
+                measure(client, page, assets)
+    finally:
+        shutil.rmtree(static_root)
+
+
+def body_size(response):
+    return len(b''.join(response.streaming_content)) if response.streaming else len(response.content)
+
+
+def measure(client, page, assets):
+    plain = compressed = repeat = 0
+    revalidations = 0
+    for url in assets:
+        plain += body_size(client.get(url, HTTP_ACCEPT_ENCODING='identity'))
+        first = client.get(url, HTTP_ACCEPT_ENCODING='br, gzip')
+        compressed += body_size(first)
+        if 'immutable' not in first.get('Cache-Control', ''):
+            revalidations += 1
+            again = client.get(url, HTTP_ACCEPT_ENCODING='br, gzip', HTTP_IF_NONE_MATCH=first['ETag'])
+            repeat += body_size(again)
+
+    print(f"{page}: {len(assets)} static assets")
+    print(f"  before  first view {plain:>9,} B   repeat view {plain:>9,} B ({len(assets)} requests)")
+    print(f"  after   first view {compressed:>9,} B   repeat view {repeat:>9,} B ({revalidations} requests)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Render cost of the two heaviest templates under each template engine profile.
+
+    python -m benchmarks.bench_templates --cards 1000 --reviews 1000 --renders 50
+
+Profiles:
+  uncached loader   templates are read and compiled again on every render
+  cached loader     compiled once per process (the TEMPLATES setting)
+"""
+import argparse
+import statistics
+import time
+from decimal import Decimal
+
+from benchmarks.common import make_users, setup_django
+
+
+def median_ms(render, renders):
+    samples = []
+    for _ in range(renders):
+        start = time.perf_counter()
+        render()
+        samples.append((time.perf_counter() - start) * 1e3)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cards', type=int, default=1_000)
+    parser.add_argument('--reviews', type=int, default=1_000)
+    parser.add_argument('--renders', type=int, default=50)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.conf import settings
+    from django.template import RequestContext
+    from django.template.backends.django import DjangoTemplates
+    from django.test import RequestFactory
+    from marketplace.models import CustomUser, Item, Review
+
+    seller_id, viewer_id = make_users(2)
+    viewer = CustomUser.objects.get(pk=viewer_id)
+    item = Item.objects.create(seller_id=seller_id, name="Desk lamp", description="Barely used",
+                               price=Decimal("12.50"), category="Others")
+    # Cards and reviews are never saved: the benchmark measures rendering, not queries
+    cards = [Item(id=n + 1, seller_id=seller_id, name=f"Item {n}", description="word " * 30,
+                  price=Decimal("9.99"), category="Books") for n in range(args.cards)]
+    reviews = [Review(item=item, reviewer=viewer, rating=4, comment="Great seller " * 5)
+               for _ in range(args.reviews)]
+
+    request = RequestFactory().get('/')
+    request.user = viewer
+    request.session = {}
+    pages = [
+        ('home.html', 'marketplace/home.html',
+         {'items': cards, 'featured_items': cards[:5], 'unread_messages_count': 3}),
+        ('item_detail.html', 'items/item_detail.html', {'item': item, 'reviews': reviews}),
+    ]
+
+    configured = {key: value for key, value in settings.TEMPLATES[0].items() if key != 'BACKEND'}
+    configured['APP_DIRS'] = False
+    uncached_options = {**configured['OPTIONS'], 'loaders': [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]}
+    engines = [
+        ('uncached loader', DjangoTemplates({**configured, 'NAME': 'uncached', 'OPTIONS': uncached_options})),
+        ('cached loader', DjangoTemplates({**configured, 'NAME': 'cached'})),
+    ]
+
+    print(f"{args.cards} item cards, {args.reviews} reviews, median of {args.renders} renders")
+    for page, name, context in pages:
+        for label, backend in engines:
+            def render():
+                template = backend.engine.get_template(name)
+                return template.render(RequestContext(request, context))
+            print(f"{page:<18} {label:<22} {median_ms(render, args.renders):8.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
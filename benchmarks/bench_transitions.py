@@ -0,0 +1,74 @@
+"""
+Concurrent transaction confirmations: throughput and no lost updates.
+
+    python -m benchmarks.bench_transitions --transactions 2000 --threads 16
+
+Opens `--transactions` pending purchases. Then `--threads` threads send
+every buyer and seller confirmation twice, in random order (a double submit
+each). Prints confirmations per second and checks the end state:
+- every sale completed exactly once;
+- one audit row per step;
+- the seller rollup counting each sale once.
+"""
+import argparse
+import random
+import threading
+import time
+
+from benchmarks.common import make_users, setup_django
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--transactions', type=int, default=2_000)
+    parser.add_argument('--threads', type=int, default=16)
+    args = parser.parse_args()
+
+    setup_django()
+    from decimal import Decimal
+    from django.db import connection
+    from marketplace import transitions
+    from marketplace.models import CustomUser, Item, SellerDailyStats, Transaction, TransactionEvent
+
+    seller_id, buyer_id = make_users(2)
+    seller, buyer = CustomUser.objects.get(pk=seller_id), CustomUser.objects.get(pk=buyer_id)
+    buyer.deposit(Decimal(5 * args.transactions))
+    Item.objects.bulk_create([
+        Item(seller=seller, name=f"Item {n}", description="Pick up on campus", price=Decimal("5.00"), category="Books")
+        for n in range(args.transactions)
+    ], batch_size=2000)
+    purchases = [transitions.request_purchase(item, buyer) for item in Item.objects.all()]
+
+    calls = [(purchase.id, user, f"{user.pk}-{purchase.id}")
+             for purchase in purchases for user in (buyer, seller) for _ in range(2)]
+    random.Random(1).shuffle(calls)
+    errors = []
+
+    def worker(chunk):
+        try:
+            for transaction_id, user, key in chunk:
+                transitions.confirm(Transaction.objects.get(pk=transaction_id), user, key)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(calls[n::args.threads],)) for n in range(args.threads)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = SellerDailyStats.objects.get(seller=seller)
+    completed = TransactionEvent.objects.filter(action='completed').count()
+    print(f"{len(calls)} confirmations ({args.transactions} sales) on {args.threads} threads in {elapsed:.1f}s: "
+          f"{len(calls) / elapsed:.0f}/s")
+    print(f"errors {len(errors)}; sold {Transaction.objects.filter(status='Sold').count()}; "
+          f"completed events {completed}; rollup sales {stats.sales}, revenue {stats.revenue}")
+    assert not errors and completed == stats.sales == args.transactions
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,59 @@
+"""
+Per-update cost of CustomUser writes, before and after the lean write path.
+
+    python -m benchmarks.bench_user_writes --users 100000 --updates 5000
+
+"before" replays the old CustomUser.save(): the email regex run from its
+pattern string on every save, followed by a full-row UPDATE.
+"""
+import argparse
+import random
+import re
+from decimal import Decimal
+
+from benchmarks.common import setup_django, time_per_call, make_users
+
+LEGACY_EMAIL_PATTERN = r"^\d{7}[A-Z]@student\.gla\.ac\.uk$"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=100_000)
+    parser.add_argument('--updates', type=int, default=5_000)
+    args = parser.parse_args()
+
+    setup_django()
+    from django.db import models
+    from marketplace.models import CustomUser
+
+    user_ids = make_users(args.users)
+    sample = random.Random(0).sample(user_ids, min(args.updates, len(user_ids)))
+    users = {user.pk: user for user in CustomUser.objects.filter(pk__in=sample)}
+    amount = Decimal("1.00")
+
+    def legacy_full_save(i):
+        user = users[sample[i]]
+        user.balance = Decimal(str(user.balance)) + amount
+        if not re.match(LEGACY_EMAIL_PATTERN, user.email):
+            raise ValueError(user.email)
+        models.Model.save(user)
+
+    def update_fields_save(i):
+        user = users[sample[i]]
+        user.balance = Decimal(str(user.balance)) + amount
+        user.save(update_fields=['balance'])
+
+    def f_expression_deposit(i):
+        users[sample[i]].deposit(amount)
+
+    print(f"{args.users} users, {len(sample)} updates each")
+    for label, func in [
+        ("before: regex + full-row save", legacy_full_save),
+        ("after:  save(update_fields=['balance'])", update_fields_save),
+        ("after:  deposit() with F() UPDATE", f_expression_deposit),
+    ]:
+        print(f"{label:<42} {time_per_call(func, len(sample)):8.1f} us/update")
+
+
+if __name__ == '__main__':
+    main()
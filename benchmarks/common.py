@@ -0,0 +1,56 @@
+"""
+Shared setup for the benchmark scripts.
+
+Each benchmark runs against a throwaway, freshly migrated SQLite database in a
+temporary directory so it never touches db.sqlite3. Run them from the project
+root, e.g. ``python -m benchmarks.bench_user_writes``.
+"""
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def setup_django(temp_db=True):
+    """Configure Django for a benchmark run and return the temporary DB path (if any)."""
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'student_trading.settings')
+
+    import django
+    from django.conf import settings
+
+    db_path = None
+    if temp_db:
+        db_path = Path(tempfile.mkdtemp(prefix='bench-')) / 'bench.sqlite3'
+        settings.DATABASES['default']['NAME'] = db_path
+    django.setup()
+
+    if temp_db:
+        from django.core.management import call_command
+        call_command('migrate', verbosity=0)
+    return db_path
+
+
+def time_per_call(func, calls):
+    """Run func(i) for i in range(calls) and return the mean cost per call in microseconds."""
+    start = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def make_users(count, prefix='bench'):
+    """Bulk-insert `count` users with valid university emails and return their ids."""
+    from django.contrib.auth.hashers import make_password
+    from marketplace.models import CustomUser
+
+    password = make_password('benchmark')
+    users = [
+        CustomUser(username=f"{prefix}{n}", email=f"{n:07d}A@student.gla.ac.uk", password=password)
+        for n in range(count)
+    ]
+    CustomUser.objects.bulk_create(users, batch_size=5000)
+    return list(CustomUser.objects.filter(username__startswith=prefix).values_list('id', flat=True))
@@ -0,0 +1,76 @@
+"""
+Production serving profile; gunicorn reads it from the working directory:
+
+    DJANGO_SECRET_KEY=... DJANGO_ALLOWED_HOSTS=market.example.ac.uk REDIS_URL=redis://... gunicorn student_trading.wsgi
+
+- The app is loaded once in the master (preload_app) along with the URLconf
+  and every view module (when_ready), and the objects are frozen out of the
+  garbage collector's reach. Forked workers share those pages copy-on-write
+  instead of each importing Django and the project again.
+- gthread workers: one process per CPU and GUNICORN_THREADS threads each.
+  Threads cover requests that wait rather than compute, above all the
+  server-sent event streams on home (marketplace.live). Each stream holds a
+  thread for up to LIVE_STREAM_SECONDS, and a worker holds at most
+  LIVE_MAX_STREAMS (default 4); browsers past that poll every
+  LIVE_POLL_SECONDS instead. Size it as
+      GUNICORN_THREADS = LIVE_MAX_STREAMS + threads for page requests
+  With the defaults, 8 threads leave 4 for pages, and workers x 4 home tabs
+  get a live stream at once. To give more tabs a stream, raise both numbers
+  together; threads that only wait cost a little memory each, not CPU.
+- Workers are replaced after max_requests, with jitter, so slow leaks are
+  bounded and workers do not all restart at the same moment.
+- Load balancers probe /healthz and /readyz (marketplace.middleware.HealthCheckMiddleware).
+- REDIS_URL is required: the workers share the cache, rate limits, view
+  counters and live events through it (student_trading.settings).
+
+Reloading: `kill -HUP <master>` replaces the workers gracefully but, with
+preloading, keeps the code the master loaded. To deploy new code without
+dropping connections, start a new master with `kill -USR2 <master>`, then stop
+the old one with `kill -QUIT <old master>` once the new workers answer
+/readyz. Alternatively, set GUNICORN_PRELOAD=0 and HUP picks up new code.
+
+Environment: GUNICORN_BIND (default 0.0.0.0:8000), WEB_CONCURRENCY (workers,
+default the CPUs available to the process), GUNICORN_THREADS (default 8),
+GUNICORN_PRELOAD (default 1), LIVE_MAX_STREAMS (default 4). DJANGO_DEBUG
+defaults to 0 here.
+"""
+import gc
+import os
+
+os.environ.setdefault('DJANGO_DEBUG', '0')
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'student_trading.settings')
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:8000')
+wsgi_app = 'student_trading.wsgi:application'
+
+worker_class = 'gthread'
+# sched_getaffinity counts the CPUs this process may use (a container's cpuset), not the host's
+workers = int(os.environ.get('WEB_CONCURRENCY', len(os.sched_getaffinity(0))))
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+max_requests = 2000
+max_requests_jitter = 200
+timeout = 30  # a worker missing heartbeats this long is killed; threads may run longer requests
+graceful_timeout = 30
+keepalive = 5
+# Heartbeat files on tmpfs: a container's overlay disk can stall them
+worker_tmp_dir = '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    """In the master, before the first fork: load what every request needs, then freeze it."""
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+    from django.urls import get_resolver, reverse
+
+    get_resolver().url_patterns  # the URLconf imports every view module
+    reverse('home')  # builds the URL index every link needs; the admin's stays unbuilt (student_trading.apps)
+    # Workers must not inherit the master's database connections
+    connections.close_all()
+    # Keep the collector from writing to shared objects (their GC headers), which would copy their pages
+    gc.freeze()
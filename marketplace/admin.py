@@ -1,10 +1,140 @@
+"""
+Django admin, set up for tables with millions of rows.
+
+- Changelists join their foreign keys up front (list_select_related) and edit
+  them with raw id widgets, so no page renders a <select> of every user.
+- Unfiltered changelists of big tables show an estimated count (see
+  EstimatedCountPaginator), and filtered ones skip the second, unfiltered
+  COUNT(*) (show_full_result_count = False).
+- Searches only look at the model's own columns. "seller:alice" style
+  prefixes (user_search_fields) find one user's rows through the username
+  index instead of joining the user table on every search.
+- Bulk actions are a single UPDATE over the selection. Deleting a large
+  selection shows a summary instead of listing every object it takes with it.
+- "Export to CSV" hands the filtered result set to the task worker
+  (marketplace.exports), which notifies the staff member when the file is ready.
+"""
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections, models, router, transaction
+from django.db.models import Max, QuerySet
+from django.utils.functional import cached_property
 from django.utils.html import format_html
-from .models import CustomUser, Item, ItemImage, Transaction, Review, Report
+
+from . import exports, saved_searches, tasks
+from .caching import invalidate_cached_users
+from .models import (
+    Cart, CustomUser, Item, ItemImage, ItemSignature, Message, Offer, Report, Review, SavedSearch, Transaction,
+    Wishlist,
+)
+from .moderation import apply_action, move_items
+
+
+def estimated_row_count(model):
+    """
+    The table's row count from the planner statistics: pg_class on PostgreSQL,
+    sqlite_stat1 (written by ANALYZE) on SQLite. Without statistics it falls
+    back to the highest primary key, an upper bound read off the index.
+    """
+    using = router.db_for_read(model)
+    connection = connections[using]
+    table = model._meta.db_table
+    try:
+        with transaction.atomic(using=using), connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+                row = cursor.fetchone()
+                if row and row[0] >= 0:
+                    return row[0]
+            elif connection.vendor == 'sqlite':
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s", [table])
+                # The first number of each index's stat is the rows it covers; partial indexes cover fewer
+                counts = [int(stat.split()[0]) for (stat,) in cursor.fetchall()]
+                if counts:
+                    return max(counts)
+    except DatabaseError:
+        pass  # no statistics table yet
+    return model._base_manager.using(using).aggregate(top=Max('pk'))['top'] or 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    COUNT(*) over a whole table reads every row. An unfiltered changelist of a
+    table past ADMIN_EXACT_COUNT_LIMIT rows is paginated on the estimate
+    instead; filtered changelists and small tables still count exactly.
+    """
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimated_row_count(self.object_list.model)
+            if estimate > getattr(settings, 'ADMIN_EXACT_COUNT_LIMIT', 10_000):
+                return estimate
+        return super().count
+
+
+def _cascade_models(model, seen=None):
+    """Every model whose rows are deleted along with `model`'s."""
+    seen = set() if seen is None else seen
+    for relation in model._meta.related_objects:
+        related = relation.related_model
+        if getattr(relation, 'on_delete', None) is models.CASCADE and related not in seen:
+            seen.add(related)
+            _cascade_models(related, seen)
+    return seen
+
+
+class LargeTableAdminMixin:
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+    # Search prefix -> user foreign key, e.g. {'seller': 'seller'} for "seller:alice".
+    # The '' entry, if any, takes searches without a prefix.
+    user_search_fields = {}
+    # Columns written by "Export to CSV"; every concrete column by default
+    export_fields = None
+
+    def get_search_results(self, request, queryset, search_term):
+        prefix, colon, username = search_term.partition(':')
+        if not colon:
+            prefix, username = '', search_term
+        field = self.user_search_fields.get(prefix.strip().lower())
+        if field is None or not username.strip():
+            return super().get_search_results(request, queryset, search_term)
+        users = CustomUser.objects.filter(username=username.strip()).values('pk')
+        return queryset.filter(**{f'{field}__in': users}), False
+
+    def get_deleted_objects(self, objs, request):
+        """Past ADMIN_DELETE_PREVIEW_LIMIT rows, summarise instead of collecting every related object."""
+        if not isinstance(objs, QuerySet):
+            return super().get_deleted_objects(objs, request)
+        count = objs.count()
+        if count <= getattr(settings, 'ADMIN_DELETE_PREVIEW_LIMIT', 100):
+            return super().get_deleted_objects(objs, request)
+        registry = self.admin_site._registry
+        cascades = [model for model in _cascade_models(self.model) if model in registry]
+        perms_needed = {model._meta.verbose_name for model in cascades
+                        if not registry[model].has_delete_permission(request)}
+        summary = f"{count} {self.opts.verbose_name_plural}"
+        if cascades:
+            summary += ", with their " + ", ".join(sorted(str(model._meta.verbose_name_plural) for model in cascades))
+        return [summary], {self.opts.verbose_name_plural: count}, perms_needed, []
+
+    def get_export_fields(self):
+        return self.export_fields or [field.attname for field in self.model._meta.concrete_fields]
+
+    @admin.action(description="Export to CSV (in the background)")
+    def export_csv(self, request, queryset):
+        tasks.export_csv.delay(self.model._meta.label, exports.dump_queryset(queryset),
+                               self.get_export_fields(), request.user.pk)
+        self.message_user(request, "The export has been queued. You will get a notification with the download link.")
+
 
 # Custom User Admin
-class CustomUserAdmin(UserAdmin):
+class CustomUserAdmin(LargeTableAdminMixin, UserAdmin):
     model = CustomUser
     list_display = ['username', 'email', 'is_verified', 'is_staff', 'is_active']
     list_filter = ['is_verified', 'is_staff', 'is_active']
@@ -12,6 +142,31 @@ class CustomUserAdmin(UserAdmin):
     fieldsets = UserAdmin.fieldsets + (
         ('Custom Fields', {'fields': ('is_verified',)}),
     )
+    actions = ['activate_users', 'deactivate_users', 'verify_users', 'export_csv']
+    export_fields = ['id', 'username', 'email', 'first_name', 'last_name', 'is_verified', 'is_staff',
+                     'is_active', 'date_joined', 'last_login']
+
+    def _update_users(self, queryset, **values):
+        user_ids = list(queryset.values_list('pk', flat=True))
+        updated = queryset.update(**values)
+        # update() sends no post_save, so drop the cached request users here
+        invalidate_cached_users(user_ids)
+        return updated
+
+    @admin.action(description="Activate selected users")
+    def activate_users(self, request, queryset):
+        updated = self._update_users(queryset.filter(is_active=False), is_active=True)
+        self.message_user(request, f"{updated} users activated.")
+
+    @admin.action(description="Deactivate selected users")
+    def deactivate_users(self, request, queryset):
+        updated = self._update_users(queryset.filter(is_active=True).exclude(pk=request.user.pk), is_active=False)
+        self.message_user(request, f"{updated} users deactivated.")
+
+    @admin.action(description="Mark selected users as verified")
+    def verify_users(self, request, queryset):
+        updated = self._update_users(queryset.filter(is_verified=False), is_verified=True)
+        self.message_user(request, f"{updated} users verified.")
 
 # Inline display for multiple item images
 class ItemImageInline(admin.TabularInline):
@@ -19,11 +174,16 @@ class ItemImageInline(admin.TabularInline):
     extra = 1  # Allows adding multiple images
 
 # Item Admin with preview functionality
-class ItemAdmin(admin.ModelAdmin):
+class ItemAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['name', 'seller', 'price', 'category', 'status', 'created_at', 'image_preview']
     list_filter = ['category', 'status']
-    search_fields = ['name', 'description', 'seller__username']
+    list_select_related = ['seller']
+    raw_id_fields = ['seller']
+    search_fields = ['name', 'description']
+    user_search_fields = {'seller': 'seller'}
+    search_help_text = "Name or description, or seller:<username> for one seller's items."
     inlines = [ItemImageInline]
+    actions = ['hide_items', 'relist_items', 'export_csv']
 
     def image_preview(self, obj):
         if obj.image:
@@ -31,26 +191,152 @@ class ItemAdmin(admin.ModelAdmin):
         return "No Image"
     image_preview.short_description = "Preview"
 
-# Transaction Admin
-class TransactionAdmin(admin.ModelAdmin):
+    def _move_items(self, queryset, from_status, to_status):
+        moved = move_items(queryset, from_status, to_status)
+        tasks.notify_wishlist_watchers.delay()
+        return len(moved)
+
+    @admin.action(description="Hide selected available items")
+    def hide_items(self, request, queryset):
+        self.message_user(request, f"{self._move_items(queryset, 'Available', 'Hidden')} items hidden.")
+
+    @admin.action(description="Relist selected hidden items")
+    def relist_items(self, request, queryset):
+        self.message_user(request, f"{self._move_items(queryset, 'Hidden', 'Available')} items relisted.")
+
+# Transaction Admin. Status changes move money, so they go through
+# marketplace.transitions one transaction at a time rather than a bulk action.
+class TransactionAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['buyer', 'item', 'total_price', 'status', 'date_initiated', 'date_completed']
     list_filter = ['status']
-    search_fields = ['buyer__username', 'item__name']
+    list_select_related = ['buyer', 'item']
+    raw_id_fields = ['buyer', 'item']
+    search_fields = ['buyer__username']  # exact match, via user_search_fields
+    user_search_fields = {'': 'buyer', 'buyer': 'buyer', 'seller': 'item__seller'}
+    search_help_text = "Buyer's username, or seller:<username>."
+    actions = ['export_csv']
 
 # Review Admin
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ['reviewer', 'item', 'rating', 'created_at']
     list_filter = ['rating']
-    search_fields = ['reviewer__username', 'item__name']
+    list_select_related = ['reviewer', 'item']
+    raw_id_fields = ['reviewer', 'item']
+    search_fields = ['comment']
+    user_search_fields = {'reviewer': 'reviewer', 'seller': 'item__seller'}
+    search_help_text = "Comment text, or reviewer:<username> / seller:<username>."
+    actions = ['export_csv']
 
-class ReportAdmin(admin.ModelAdmin):
+class ReportAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = ('reported_item', 'reported_by', 'status', 'reported_at')
     list_filter = ('status',)
-    search_fields = ('reported_item__name', 'reported_by__username')
+    list_select_related = ('reported_item', 'reported_by')
+    raw_id_fields = ('reported_item', 'reported_by')
+    search_fields = ('reason',)
+    user_search_fields = {'by': 'reported_by', 'seller': 'reported_item__seller'}
+    search_help_text = "Reason, or by:<username> / seller:<username>."
+    actions = ('dismiss_reports', 'hide_reported_items', 'export_csv')
+
+    def _moderate(self, request, queryset, action):
+        # Same decision as the moderation queue: every pending report on the selected reports' items
+        item_ids = list(queryset.values_list('reported_item_id', flat=True).distinct())
+        closed = apply_action(item_ids, action)
+        tasks.notify_wishlist_watchers.delay()
+        self.message_user(request, f"{closed} reports closed.")
+
+    @admin.action(description="Dismiss: close the reports and relist the items")
+    def dismiss_reports(self, request, queryset):
+        self._moderate(request, queryset, 'dismiss')
+
+    @admin.action(description="Hide the reported items and resolve their reports")
+    def hide_reported_items(self, request, queryset):
+        self._moderate(request, queryset, 'hide')
+
+class OfferAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['buyer', 'item', 'price', 'status', 'created_at']
+    list_filter = ['status']
+    list_select_related = ['buyer', 'item']
+    raw_id_fields = ['buyer', 'item']
+    search_fields = ['buyer__username']  # exact match, via user_search_fields
+    user_search_fields = {'': 'buyer', 'seller': 'item__seller'}
+    search_help_text = "Buyer's username, or seller:<username>."
+    actions = ['reject_offers', 'export_csv']
+
+    @admin.action(description="Reject selected pending offers")
+    def reject_offers(self, request, queryset):
+        rejected = queryset.filter(status='Pending').update(status='Rejected')
+        self.message_user(request, f"{rejected} offers rejected.")
+
+class MessageAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['sender', 'receiver', 'timestamp', 'is_read']
+    list_filter = ['is_read']
+    list_select_related = ['sender', 'receiver']
+    raw_id_fields = ['sender', 'receiver']
+    search_fields = ['content']
+    user_search_fields = {'from': 'sender', 'to': 'receiver'}
+    search_help_text = "Message text, or from:<username> / to:<username>."
+    actions = ['mark_read', 'export_csv']
+
+    @admin.action(description="Mark selected messages as read")
+    def mark_read(self, request, queryset):
+        self.message_user(request, f"{queryset.filter(is_read=False).update(is_read=True)} messages marked as read.")
+
+class CartAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['user', 'item', 'quantity']
+    list_select_related = ['user', 'item']
+    raw_id_fields = ['user', 'item']
+    search_fields = ['user__username']  # exact match, via user_search_fields
+    user_search_fields = {'': 'user'}
+    search_help_text = "Username."
+    actions = ['export_csv']
+
+class WishlistAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['user', 'item', 'added_at']
+    list_select_related = ['user', 'item']
+    raw_id_fields = ['user', 'item']
+    search_fields = ['user__username']  # exact match, via user_search_fields
+    user_search_fields = {'': 'user'}
+    search_help_text = "Username."
+    actions = ['export_csv']
+
+class SavedSearchAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['user', 'query', 'category', 'term', 'created_at']
+    list_select_related = ['user']
+    list_filter = ['category']
+    raw_id_fields = ['user']
+    readonly_fields = ['term']
+    search_fields = ['user__username']  # exact match, via user_search_fields
+    user_search_fields = {'': 'user'}
+    search_help_text = "Username."
+    actions = ['export_csv']
+
+    def save_model(self, request, obj, form, change):
+        obj.term = saved_searches.search_term(obj.query, obj.category)
+        super().save_model(request, obj, form, change)
+
+# Re-posts found by marketplace.duplicates; relist false positives from ItemAdmin
+class ItemSignatureAdmin(LargeTableAdminMixin, admin.ModelAdmin):
+    list_display = ['item', 'duplicate_of', 'similarity', 'updated_at']
+    list_select_related = ['item', 'duplicate_of']
+    raw_id_fields = ['item', 'duplicate_of']
+    exclude = ['minhash']
+    readonly_fields = ['image_hash']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).filter(duplicate_of__isnull=False)
+
+    def has_add_permission(self, request):
+        return False
 
 # Register models in Django admin
 admin.site.register(CustomUser, CustomUserAdmin)
 admin.site.register(Item, ItemAdmin)
 admin.site.register(Transaction, TransactionAdmin)
 admin.site.register(Review, ReviewAdmin)
-admin.site.register(Report, ReportAdmin)
\ No newline at end of file
+admin.site.register(Report, ReportAdmin)
+admin.site.register(Offer, OfferAdmin)
+admin.site.register(Message, MessageAdmin)
+admin.site.register(Cart, CartAdmin)
+admin.site.register(Wishlist, WishlistAdmin)
+admin.site.register(SavedSearch, SavedSearchAdmin)
+admin.site.register(ItemSignature, ItemSignatureAdmin)
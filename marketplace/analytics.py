@@ -0,0 +1,107 @@
+"""
+Seller analytics served from the SellerDailyStats rollup.
+
+Rows are bumped incrementally as events happen: offers and sales through
+signals, item views through apply_view_counts() when the view-counter
+buffer flushes (marketplace.viewcounts). Nothing scans Offer or
+Transaction history at request time; rebuild_seller_stats exists only for
+the initial backfill.
+"""
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from .models import Item, SellerDailyStats
+
+ROLLUP_FIELDS = ('views', 'offers', 'sales', 'revenue')
+
+
+def bump(seller_id, category, day=None, **deltas):
+    """Add `deltas` (views=, offers=, sales=, revenue=) to one rollup row, creating it if needed."""
+    deltas = {field: amount for field, amount in deltas.items() if amount}
+    if not deltas:
+        return
+    day = day or timezone.localdate()
+    row = SellerDailyStats.objects.filter(seller_id=seller_id, day=day, category=category)
+    updates = {field: F(field) + amount for field, amount in deltas.items()}
+    if row.update(**updates) or any(amount < 0 for amount in deltas.values()):
+        # A decrement undoes an earlier bump, so its row already exists
+        return
+    try:
+        with transaction.atomic():
+            SellerDailyStats.objects.create(seller_id=seller_id, day=day, category=category, **deltas)
+    except IntegrityError:
+        # Another request created the row first
+        row.update(**updates)
+
+
+def apply_view_counts(counts, day=None):
+    """Fold a batch of {item_id: views} into the rollup with one lookup and one UPDATE per seller/category."""
+    if not counts:
+        return
+    per_bucket = Counter()
+    for item_id, seller_id, category in Item.objects.filter(id__in=counts).values_list('id', 'seller_id', 'category'):
+        per_bucket[seller_id, category] += counts[item_id]
+    for (seller_id, category), views in per_bucket.items():
+        bump(seller_id, category, day=day, views=views)
+
+
+def record_offer(offer):
+    bump(offer.item.seller_id, offer.item.category, offers=1)
+
+
+def record_sale(transaction_row):
+    bump(transaction_row.item.seller_id, transaction_row.item.category,
+         sales=1, revenue=Decimal(str(transaction_row.total_price)))
+
+
+def sale_day(transaction_row):
+    """The day a sale is rolled up under: the day it completed."""
+    return timezone.localdate(transaction_row.date_completed or transaction_row.date_initiated)
+
+
+def record_refund(transaction_row):
+    # Taken off the sale's own row, which may be days old, not today's
+    bump(transaction_row.item.seller_id, transaction_row.item.category, day=sale_day(transaction_row),
+         sales=-1, revenue=-Decimal(str(transaction_row.total_price)))
+
+
+def seller_summary(seller, days=30):
+    """Daily and per-category totals for the dashboard, read from the rollup only."""
+    since = timezone.localdate() - timedelta(days=days - 1)
+    rows = SellerDailyStats.objects.filter(seller=seller, day__gte=since)
+    sums = {f'total_{field}': Sum(field) for field in ROLLUP_FIELDS}
+
+    by_day = list(rows.values('day').annotate(**sums).order_by('-day'))
+    by_category = list(rows.values('category').annotate(**sums).order_by('-total_revenue'))
+    totals = {key: value or 0 for key, value in rows.aggregate(**sums).items()}
+    for group in [totals, *by_day, *by_category]:
+        group['conversion'] = conversion_rate(group['total_sales'], group['total_views'])
+    return {'since': since, 'totals': totals, 'by_day': by_day, 'by_category': by_category}
+
+
+def conversion_rate(sales, views):
+    return round(100 * sales / views, 1) if views else None
+
+
+def seller_stats_frame(seller_id=None, start=None, end=None):
+    """The rollup as a pandas DataFrame for reporting jobs (pandas is imported only when needed)."""
+    import pandas as pd
+
+    rows = SellerDailyStats.objects.all()
+    if seller_id is not None:
+        rows = rows.filter(seller_id=seller_id)
+    if start is not None:
+        rows = rows.filter(day__gte=start)
+    if end is not None:
+        rows = rows.filter(day__lte=end)
+    columns = ['seller_id', 'day', 'category', *ROLLUP_FIELDS]
+    frame = pd.DataFrame.from_records(rows.order_by('day', 'seller_id', 'category').values_list(*columns),
+                                      columns=columns)
+    frame['day'] = pd.to_datetime(frame['day'])
+    frame['revenue'] = frame['revenue'].astype(float)
+    return frame
@@ -0,0 +1,230 @@
+"""
+Data lifecycle: move rows past their retention window out of the hot tables.
+
+    manage.py archive_data [--vacuum]
+
+- Finished transactions (sold, cancelled or refunded) older than
+  ARCHIVE_TRANSACTIONS_AFTER_DAYS go to ArchivedTransaction, with the item
+  name copied onto the row. Pending ones stay until they finish.
+- Sold items older than ARCHIVE_SOLD_ITEMS_AFTER_DAYS go to ArchivedItem.
+  An item moves only when no hot transaction, review or open report points
+  at it any more. Its notifications are detached (item set to NULL) and stay
+  in their users' inboxes. The other rows that reference the item are
+  deleted with it and are not archived: cart and wishlist entries, offers,
+  images, resolved reports, and its change-log, trending and duplicate-index
+  rows. Its offer counts survive only in the seller rollup (SellerDailyStats).
+- Read messages older than ARCHIVE_MESSAGES_AFTER_DAYS go to ArchivedMessage.
+
+Rows move in primary-key batches. Each batch is first copied with its
+original ids (ignore_conflicts, so a rerun after a crash is harmless), then
+deleted from the hot table. The archive can be a separate SQLite file (see
+ARCHIVE_DATABASE and PrimaryReplicaRouter).
+
+Reads stay transparent. purchase_history() and message_thread() merge the
+hot table and its archive in date order, and recent_senders() covers
+conversations that only exist in the archive.
+"""
+import heapq
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import OperationalError, connections, router, transaction
+from django.db.models import Exists, Max, OuterRef, Q
+from django.utils import timezone
+
+from .models import (
+    ArchivedItem, ArchivedMessage, ArchivedTransaction, CustomUser, Item, Message, Notification, Report, Review,
+    Transaction,
+)
+
+BATCH_SIZE = 1000
+# Transaction states that no longer change
+FINISHED_TRANSACTION_STATUSES = ('Sold', 'Cancelled', 'Refunded')
+
+
+def _move_in_batches(queryset, to_archived, batch_size, before_delete=None):
+    """
+    Copy rows to the archive and delete them from `queryset`'s table, batch by
+    batch. `before_delete(ids)`, if given, runs in the delete's transaction.
+    """
+    archive_model = None
+    moved = 0
+    while True:
+        batch = list(queryset.order_by('pk')[:batch_size])
+        if not batch:
+            return moved
+        archived = [to_archived(row) for row in batch]
+        archive_model = archive_model or type(archived[0])
+        archive_model.objects.bulk_create(archived, ignore_conflicts=True)
+        ids = [row.pk for row in batch]
+        with transaction.atomic():
+            if before_delete is not None:
+                before_delete(ids)
+            queryset.model.objects.filter(pk__in=ids).delete()
+        moved += len(batch)
+
+
+def _cutoff(days, now=None):
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def archivable_transactions(now=None):
+    before = _cutoff(settings.ARCHIVE_TRANSACTIONS_AFTER_DAYS, now)
+    return Transaction.objects.filter(status__in=FINISHED_TRANSACTION_STATUSES, date_initiated__lt=before)
+
+
+def archivable_items(now=None):
+    before = _cutoff(settings.ARCHIVE_SOLD_ITEMS_AFTER_DAYS, now)
+    return Item.objects.filter(status='Sold', created_at__lt=before).exclude(
+        Exists(Transaction.objects.filter(item=OuterRef('pk')))
+    ).exclude(
+        Exists(Review.objects.filter(item=OuterRef('pk')))
+    ).exclude(
+        # A moderator still has to see the listing
+        Exists(Report.objects.filter(reported_item=OuterRef('pk')).exclude(status='Resolved'))
+    )
+
+
+def archivable_messages(now=None):
+    before = _cutoff(settings.ARCHIVE_MESSAGES_AFTER_DAYS, now)
+    return Message.objects.filter(is_read=True, timestamp__lt=before)
+
+
+def archive_transactions(now=None, batch_size=BATCH_SIZE):
+    return _move_in_batches(
+        archivable_transactions(now).select_related('item'),
+        lambda t: ArchivedTransaction(
+            id=t.id, buyer_id=t.buyer_id, item_id=t.item_id, item_name=t.item.name, status=t.status,
+            total_price=t.total_price, date_initiated=t.date_initiated, date_completed=t.date_completed,
+        ),
+        batch_size,
+    )
+
+
+def archive_items(now=None, batch_size=BATCH_SIZE):
+    return _move_in_batches(
+        archivable_items(now),
+        lambda i: ArchivedItem(
+            id=i.id, seller_id=i.seller_id, name=i.name, description=i.description, category=i.category,
+            price=i.price, image=i.image.name or None, status=i.status, created_at=i.created_at, views=i.views,
+        ),
+        batch_size,
+        before_delete=_detach_notifications,
+    )
+
+
+def _detach_notifications(item_ids):
+    # Deleting the item would cascade to them; the message text does not need it
+    Notification.objects.filter(item_id__in=item_ids).update(item=None)
+
+
+def archive_messages(now=None, batch_size=BATCH_SIZE):
+    return _move_in_batches(
+        archivable_messages(now),
+        lambda m: ArchivedMessage(
+            id=m.id, sender_id=m.sender_id, receiver_id=m.receiver_id, content=m.content,
+            timestamp=m.timestamp, is_read=m.is_read,
+        ),
+        batch_size,
+    )
+
+
+def archive_all(now=None, batch_size=BATCH_SIZE):
+    """Run every policy. Transactions go first so their items become archivable in the same run."""
+    return {
+        'transactions': archive_transactions(now, batch_size),
+        'items': archive_items(now, batch_size),
+        'messages': archive_messages(now, batch_size),
+    }
+
+
+class MergedRows:
+    """Hot rows and archived rows as one sequence, merged on `key` (each queryset already ordered by it)."""
+
+    def __init__(self, querysets, key, reverse=False):
+        self.querysets = querysets
+        self.key = attrgetter(key)
+        self.reverse = reverse
+
+    def __bool__(self):
+        return any(queryset.exists() for queryset in self.querysets)
+
+    def __iter__(self):
+        return heapq.merge(*(queryset.iterator(chunk_size=BATCH_SIZE) for queryset in self.querysets),
+                           key=self.key, reverse=self.reverse)
+
+
+def purchase_history(user, start=None, end=None):
+    """The user's purchases, newest first, across Transaction and ArchivedTransaction; optionally start <= date < end."""
+    querysets = [
+        Transaction.objects.filter(buyer=user).select_related('item').order_by('-date_initiated'),
+        ArchivedTransaction.objects.filter(buyer_id=user.pk).order_by('-date_initiated'),
+    ]
+    if start is not None:
+        querysets = [queryset.filter(date_initiated__gte=start) for queryset in querysets]
+    if end is not None:
+        querysets = [queryset.filter(date_initiated__lt=end) for queryset in querysets]
+    return MergedRows(querysets, key='date_initiated', reverse=True)
+
+
+def message_thread(user, other):
+    """All messages between two users, oldest first, across Message and ArchivedMessage."""
+    between = Q(sender_id=user.pk, receiver_id=other.pk) | Q(sender_id=other.pk, receiver_id=user.pk)
+    participants = {user.pk: user, other.pk: other}
+    messages = list(MergedRows([
+        Message.objects.filter(between).order_by('timestamp'),
+        ArchivedMessage.objects.filter(between).order_by('timestamp'),
+    ], key='timestamp'))
+    for message in messages:
+        # Both senders are already loaded (and the archive may be a separate database)
+        message.sender = participants[message.sender_id]
+    return messages
+
+
+def recent_senders(user):
+    """Users who have messaged `user`, most recent first, including conversations now only in the archive."""
+    latest = {}
+    for model in (Message, ArchivedMessage):
+        rows = model.objects.filter(receiver_id=user.pk).order_by().values('sender').annotate(last=Max('timestamp'))
+        for row in rows:
+            if row['sender'] not in latest or row['last'] > latest[row['sender']]:
+                latest[row['sender']] = row['last']
+    users = CustomUser.objects.in_bulk(list(latest))
+    return [users[sender_id] for sender_id in sorted(latest, key=latest.get, reverse=True) if sender_id in users]
+
+
+def table_size(model):
+    """Bytes used by `model`'s table and its indexes (SQLite dbstat), or None where unavailable."""
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = %s)",
+                [model._meta.db_table],
+            )
+            return cursor.fetchone()[0] or 0
+    except OperationalError:  # SQLite built without SQLITE_ENABLE_DBSTAT_VTAB
+        return None
+
+
+def database_size(model):
+    """(file bytes, reclaimable free-list bytes) of the SQLite database holding `model`'s table."""
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor != 'sqlite':
+        return None, None
+    with connection.cursor() as cursor:
+        page_size = cursor.execute('PRAGMA page_size').fetchone()[0]
+        page_count = cursor.execute('PRAGMA page_count').fetchone()[0]
+        free_pages = cursor.execute('PRAGMA freelist_count').fetchone()[0]
+    return page_size * page_count, page_size * free_pages
+
+
+def vacuum(model):
+    """Return free pages to the filesystem (SQLite only; rewrites the whole file)."""
+    connection = connections[router.db_for_write(model)]
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('VACUUM')
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+from .caching import user_cache_key
+
+# Large free-text columns that no page outside the profile needs on every request
+USER_CACHE_DEFERRED_FIELDS = ('bio', 'address')
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user() (called by AuthenticationMiddleware on every
+    authenticated request) is served from the cache. The cached instance defers
+    bio/address; they are loaded on first access like any deferred field.
+
+    Only with USER_CACHE on, which settings ties to a shared (Redis) cache: a
+    save invalidates the entry in the cache the saving process sees, so with
+    a per-process cache the other workers would keep serving the old user.
+    """
+
+    def get_user(self, user_id):
+        if not getattr(settings, 'USER_CACHE', False):
+            return super().get_user(user_id)
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            UserModel = get_user_model()
+            try:
+                user = UserModel._default_manager.defer(*USER_CACHE_DEFERRED_FIELDS).get(pk=user_id)
+            except UserModel.DoesNotExist:
+                return None
+            cache.set(key, user, getattr(settings, 'USER_CACHE_TIMEOUT', 300))
+        return user if self.user_can_authenticate(user) else None
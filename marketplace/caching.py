@@ -0,0 +1,14 @@
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f"auth_user:{user_id}"
+
+
+def invalidate_cached_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def invalidate_cached_users(user_ids):
+    """For QuerySet.update() on users, which sends no post_save."""
+    cache.delete_many([user_cache_key(user_id) for user_id in user_ids])
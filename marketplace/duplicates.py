@@ -0,0 +1,227 @@
+"""
+Near-duplicate listings: the same item posted again by the same seller.
+
+Every item gets an ItemSignature when it is saved (tasks.index_item_signature,
+queued from signals.py):
+
+- a MinHash of its name and description: MINHASH_PERMUTATIONS minimums over
+  the hashed character shingles, each under its own seeded hash, computed
+  with numpy in one vectorized pass. The share of positions two signatures agree on estimates the
+  Jaccard similarity of their shingle sets;
+- a 64-bit difference hash (dHash) of its primary image. Re-encoded or
+  resized copies of one photo land within a few bits of each other.
+
+Lookup is locality-sensitive hashing over an ordinary indexed column.
+SignatureBucket holds one row per (bucket key, item). Keys include the
+seller, so a seller's buckets never fill up with other people's listings:
+
+- the MinHash is cut into MINHASH_BANDS bands, and each band's values hash
+  to one key. A pair at 0.8 similarity shares at least one band all but
+  certainly (1 - (1 - 0.8**4)**16 > 0.999); unrelated texts at 0.1 do
+  about once in 600 pairs;
+- the image hash is cut into IMAGE_BANDS 8-bit bands. Two hashes at most
+  IMAGE_BANDS - 1 bits apart always share a band exactly, which covers
+  DUPLICATE_IMAGE_DISTANCE.
+
+Finding candidates is therefore one `key IN (...)` index lookup, whatever
+the size of the catalogue. Only the candidates' signatures are compared.
+
+A re-post is a newer listing whose text similarity reaches
+DUPLICATE_TEXT_SIMILARITY, or whose image is within DUPLICATE_IMAGE_DISTANCE
+bits, of an older Available or Pending listing by the same seller.
+DUPLICATE_ACTION decides what happens:
+- 'flag' records ItemSignature.duplicate_of for moderators;
+- 'hide' also takes the re-post off the site (status Hidden) and tells the
+  seller. A moderator can relist it from the admin.
+
+`manage.py index_duplicates` backfills signatures for the existing catalogue
+and runs the same check over it, oldest listings first.
+"""
+import hashlib
+import re
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+
+from .models import Item, ItemImage, ItemSignature, Notification, SignatureBucket
+from .moderation import move_items
+
+SHINGLE_SIZE = 5  # characters
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16  # of 4 values each
+IMAGE_BANDS = 8  # of 8 bits
+MAX_CANDIDATES = 200
+
+_rng = np.random.RandomState(20240901)  # fixed, so stored signatures stay comparable
+_SEEDS = _rng.randint(0, 1 << 62, size=MINHASH_PERMUTATIONS, dtype=np.int64).astype(np.uint64)
+
+
+def _mix(values):
+    """splitmix64's finalizer, elementwise: each seed XORed in gives an independent-looking permutation."""
+    with np.errstate(over='ignore'):
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xbf58476d1ce4e5b9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94d049bb133111eb)
+        return values ^ (values >> np.uint64(31))
+
+
+def _normalize(text):
+    return ' '.join(re.findall(r'[a-z0-9]+', (text or '').lower()))
+
+
+def shingles(text):
+    """The distinct SHINGLE_SIZE-character substrings of the normalized text (the text itself if shorter)."""
+    text = _normalize(text)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[n:n + SHINGLE_SIZE] for n in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """The MinHash signature as a uint32 array, or None for text without letters or digits."""
+    grams = shingles(text)
+    if not grams:
+        return None
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(gram.encode(), digest_size=8).digest(), 'little') for gram in grams),
+        dtype=np.uint64, count=len(grams),
+    )
+    # Every permutation of every shingle at once: a (permutations x shingles) matrix
+    permuted = _mix(_SEEDS[:, None] ^ hashes[None, :]) >> np.uint64(32)
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def text_similarity(signature, other):
+    return float(np.count_nonzero(signature == other)) / MINHASH_PERMUTATIONS
+
+
+def item_text(item):
+    return f"{item.name} {item.description}"
+
+
+def image_hash(image_file):
+    """64-bit dHash of an image file, as a signed integer (it is stored in a BigIntegerField), or None."""
+    from PIL import Image
+
+    try:
+        with image_file.open('rb') as handle, Image.open(handle) as image:
+            pixels = np.asarray(image.convert('L').resize((9, 8), Image.Resampling.LANCZOS), dtype=np.int16)
+    except (OSError, ValueError):
+        return None  # missing or unreadable file
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    value = int(np.packbits(bits).view('>u8')[0])
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def image_distance(value, other):
+    return bin((value ^ other) & ((1 << 64) - 1)).count('1')
+
+
+def primary_image(item):
+    if item.image:
+        return item.image
+    # item.images may be prefetched (index_duplicates does so for each batch)
+    images = list(item.images.all())
+    return min(images, key=lambda image: image.pk).image if images else None
+
+
+def _key(*parts):
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') >> 1  # fits a signed 64-bit column
+
+
+def bucket_keys(seller_id, text_signature, image_value):
+    keys = []
+    if text_signature is not None:
+        rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+        keys += [_key(seller_id, 'text', band, text_signature[band * rows:(band + 1) * rows].tobytes())
+                 for band in range(MINHASH_BANDS)]
+    if image_value is not None:
+        width = 64 // IMAGE_BANDS
+        keys += [_key(seller_id, 'image', band, (image_value >> (band * width)) & ((1 << width) - 1))
+                 for band in range(IMAGE_BANDS)]
+    return keys
+
+
+def _decode(signature):
+    return np.frombuffer(bytes(signature.minhash), dtype=np.uint32) if signature.minhash is not None else None
+
+
+def index_items(items):
+    """Compute and store the items' signatures and LSH buckets, replacing any earlier ones."""
+    signatures, buckets = [], []
+    for item in items:
+        text_signature = minhash(item_text(item))
+        image_file = primary_image(item)
+        image_value = image_hash(image_file) if image_file else None
+        signatures.append(ItemSignature(
+            item_id=item.pk, image_hash=image_value,
+            minhash=text_signature.tobytes() if text_signature is not None else None,
+        ))
+        buckets += [SignatureBucket(key=key, item_id=item.pk)
+                    for key in bucket_keys(item.seller_id, text_signature, image_value)]
+    item_ids = [signature.item_id for signature in signatures]
+    with transaction.atomic():
+        SignatureBucket.objects.filter(item_id__in=item_ids).delete()
+        ItemSignature.objects.filter(item_id__in=item_ids).delete()
+        ItemSignature.objects.bulk_create(signatures)
+        SignatureBucket.objects.bulk_create(buckets)
+    return signatures
+
+
+def index_item(item):
+    return index_items([item])[0]
+
+
+def find_duplicates(item, signature):
+    """
+    [(item id, similarity)] of the seller's other listings that match `item`,
+    best match first. Candidates come from the bucket index; only they are
+    compared.
+    """
+    keys = bucket_keys(item.seller_id, _decode(signature), signature.image_hash)
+    if not keys:
+        return []
+    candidate_ids = SignatureBucket.objects.filter(key__in=keys).exclude(item_id=item.pk) \
+        .values_list('item_id', flat=True).distinct()[:MAX_CANDIDATES]
+    candidates = ItemSignature.objects.filter(item_id__in=list(candidate_ids))
+    text_signature = _decode(signature)
+    text_threshold = getattr(settings, 'DUPLICATE_TEXT_SIMILARITY', 0.8)
+    image_threshold = getattr(settings, 'DUPLICATE_IMAGE_DISTANCE', 6)
+    matches = []
+    for candidate in candidates:
+        scores = []
+        other_text = _decode(candidate)
+        if text_signature is not None and other_text is not None:
+            similarity = text_similarity(text_signature, other_text)
+            if similarity >= text_threshold:
+                scores.append(similarity)
+        if signature.image_hash is not None and candidate.image_hash is not None:
+            distance = image_distance(signature.image_hash, candidate.image_hash)
+            if distance <= image_threshold:
+                scores.append(1 - distance / 64)
+        if scores:
+            matches.append((candidate.item_id, max(scores)))
+    return sorted(matches, key=lambda match: (-match[1], match[0]))
+
+
+def check_item(item, signature=None):
+    """
+    Index `item` (unless its signature is given) and act on it if it re-posts
+    an older live listing. Returns the original's id, or None.
+    """
+    signature = signature or index_item(item)
+    matches = dict(find_duplicates(item, signature))
+    original = Item.objects.filter(pk__in=list(matches), pk__lt=item.pk, status__in=('Available', 'Pending')) \
+        .order_by('pk').first()
+    if original is None:
+        return None
+    ItemSignature.objects.filter(pk=signature.pk).update(duplicate_of=original, similarity=matches[original.pk])
+    # move_items logs the hide for the listing's wishlist watchers, as Item.save() would
+    if getattr(settings, 'DUPLICATE_ACTION', 'hide') == 'hide' and \
+            move_items(Item.objects.filter(pk=item.pk), 'Available', 'Hidden'):
+        Notification.objects.create(
+            user_id=item.seller_id, item_id=item.pk, kind='duplicate',
+            message=f'"{item.name}" looks like a re-post of your listing "{original.name}" and has been hidden.'[:255],
+        )
+    return original.pk
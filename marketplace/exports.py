@@ -0,0 +1,258 @@
+"""
+CSV (and XLSX) exports of large result sets.
+
+Streamed downloads, for staff (export/<kind>/) and for a user's own
+purchase history (purchase_history/export/):
+
+    GET /export/transactions/?from=2024-01-01&to=2024-12-31&format=csv
+
+Rows come from iterator(chunk_size=EXPORT_CHUNK_SIZE) with their foreign keys
+joined in (select_related). The CSV goes out EXPORT_CHUNK_SIZE rows at a time
+while the query is still being read, so a year of transactions never sits in
+memory. The date range is on an indexed column (see STREAMED_EXPORTS) and
+returns rows in that order. XLSX needs the optional `openpyxl` package. A
+workbook is a zip archive and cannot be sent before it is finished, so it is
+written in write-only mode to a temporary file, which is then streamed.
+
+Names, descriptions and usernames are user input, and a spreadsheet runs a
+cell that starts with = + - @ as a formula. Every text value goes through
+spreadsheet_safe(), which prefixes such cells with an apostrophe.
+
+Background exports, for the admin's "Export to CSV" action: the action
+queues tasks.export_csv with the filtered queryset. The worker writes the
+file to the 'exports' storage (EXPORT_ROOT, outside MEDIA_ROOT, so the file
+has no public URL) and notifies the staff member with the download link,
+which views.download_export serves to staff only. A
+queryset reaches the worker as its pickled Query, signed with SECRET_KEY, so
+a tampered Task row cannot make the worker unpickle anything.
+"""
+import base64
+import csv
+import datetime
+import io
+import pickle
+import tempfile
+import uuid
+from collections import namedtuple
+from functools import lru_cache
+from operator import attrgetter
+
+from django.apps import apps
+from django.core import signing
+from django.core.files import File
+from django.core.files.storage import storages
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Item, Offer, Transaction
+from .streaming import in_view_context
+
+EXPORT_CHUNK_SIZE = 2000
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+_signer = signing.Signer(salt='marketplace.exports')
+
+
+@lru_cache(maxsize=None)
+def load_openpyxl():
+    """The optional openpyxl module, or None when it is not installed."""
+    try:
+        import openpyxl
+    except ImportError:
+        return None
+    return openpyxl
+
+
+# A cell starting with one of these is read as a formula (tab and CR by some importers)
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def spreadsheet_safe(value):
+    """`value`, with a leading apostrophe if it is text a spreadsheet would run as a formula."""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def formats():
+    return ('csv', 'xlsx') if load_openpyxl() is not None else ('csv',)
+
+
+def _item_name(transaction):
+    # Archived transactions carry a copy of the name; their item may be gone
+    return transaction.item_name if getattr(transaction, 'is_archived', False) else transaction.item.name
+
+
+# (header, value of a row)
+PURCHASE_COLUMNS = [
+    ('id', attrgetter('id')),
+    ('item', _item_name),
+    ('total_price', attrgetter('total_price')),
+    ('status', attrgetter('status')),
+    ('date_initiated', attrgetter('date_initiated')),
+    ('date_completed', attrgetter('date_completed')),
+]
+TRANSACTION_COLUMNS = PURCHASE_COLUMNS + [
+    ('item_id', attrgetter('item_id')),
+    ('buyer', attrgetter('buyer.username')),
+    ('seller', attrgetter('item.seller.username')),
+]
+OFFER_COLUMNS = [
+    ('id', attrgetter('id')),
+    ('item_id', attrgetter('item_id')),
+    ('item', attrgetter('item.name')),
+    ('seller', attrgetter('item.seller.username')),
+    ('buyer', attrgetter('buyer.username')),
+    ('price', attrgetter('price')),
+    ('status', attrgetter('status')),
+    ('created_at', attrgetter('created_at')),
+]
+ITEM_COLUMNS = [
+    ('id', attrgetter('id')),
+    ('name', attrgetter('name')),
+    ('category', attrgetter('category')),
+    ('price', attrgetter('price')),
+    ('status', attrgetter('status')),
+    ('seller', attrgetter('seller.username')),
+    ('views', attrgetter('views')),
+    ('created_at', attrgetter('created_at')),
+]
+
+ExportSpec = namedtuple('ExportSpec', 'model related date_field columns')
+
+# Staff exports by URL name; date_field is indexed (see the models' Meta.indexes)
+STREAMED_EXPORTS = {
+    'transactions': ExportSpec(Transaction, ('buyer', 'item__seller'), 'date_initiated', TRANSACTION_COLUMNS),
+    'offers': ExportSpec(Offer, ('buyer', 'item__seller'), 'created_at', OFFER_COLUMNS),
+    'items': ExportSpec(Item, ('seller',), 'created_at', ITEM_COLUMNS),
+}
+
+
+def date_range(params):
+    """
+    ?from= and ?to= (YYYY-MM-DD, both inclusive) as aware datetimes
+    (start, end), end exclusive; None for a missing bound. Raises ValueError.
+    """
+    bounds = []
+    for name, days_after in (('from', 0), ('to', 1)):
+        value = params.get(name, '')
+        if not value:
+            bounds.append(None)
+            continue
+        day = datetime.date.fromisoformat(value) + datetime.timedelta(days=days_after)
+        bounds.append(timezone.make_aware(datetime.datetime.combine(day, datetime.time.min)))
+    return tuple(bounds)
+
+
+def in_date_range(queryset, date_field, start, end):
+    if start is not None:
+        queryset = queryset.filter(**{f'{date_field}__gte': start})
+    if end is not None:
+        queryset = queryset.filter(**{f'{date_field}__lt': end})
+    return queryset
+
+
+def streamed_rows(kind, start=None, end=None):
+    spec = STREAMED_EXPORTS[kind]
+    queryset = spec.model.objects.select_related(*spec.related).order_by(spec.date_field, 'pk')
+    return in_date_range(queryset, spec.date_field, start, end).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+class _Echo:
+    """csv.writer target that hands each formatted line back instead of storing it."""
+
+    def write(self, line):
+        return line
+
+
+def csv_chunks(rows, columns):
+    """The CSV text: a header line, then rows EXPORT_CHUNK_SIZE at a time."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow([header for header, _ in columns])
+    chunk = []
+    for row in rows:
+        chunk.append(writer.writerow([spreadsheet_safe(value(row)) for _, value in columns]))
+        if len(chunk) == EXPORT_CHUNK_SIZE:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+def _xlsx_cell(value):
+    # Excel has no time zones
+    if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+        return timezone.make_naive(value, datetime.timezone.utc)
+    return spreadsheet_safe(value)
+
+
+def xlsx_file(rows, columns):
+    """A write-only workbook of the rows, as an open temporary file positioned at the start."""
+    workbook = load_openpyxl().Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    sheet.append([header for header, _ in columns])
+    for row in rows:
+        sheet.append([_xlsx_cell(value(row)) for _, value in columns])
+    buffer = tempfile.TemporaryFile()
+    workbook.save(buffer)
+    buffer.seek(0)
+    return buffer
+
+
+def export_response(rows, columns, filename, file_format='csv'):
+    """The download response; call it from inside the view so the rows are read in the view's context."""
+    if file_format == 'xlsx':
+        return FileResponse(xlsx_file(rows, columns), as_attachment=True, filename=f'{filename}.xlsx',
+                            content_type=XLSX_CONTENT_TYPE)
+    response = StreamingHttpResponse(in_view_context(csv_chunks(rows, columns)), content_type='text/csv; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.csv"'
+    return response
+
+
+def dump_queryset(queryset):
+    """A signed string the worker can turn back into `queryset`."""
+    return _signer.sign(base64.b64encode(pickle.dumps(queryset.query)).decode())
+
+
+def load_queryset(model_label, dumped):
+    """The queryset dump_queryset() was given. Raises signing.BadSignature if `dumped` was altered."""
+    query = pickle.loads(base64.b64decode(_signer.unsign(dumped)))
+    queryset = apps.get_model(model_label)._default_manager.all()
+    queryset.query = query
+    return queryset
+
+
+def write_csv(queryset, fields, stream):
+    """A header row, then one row per object; returns the number of objects written."""
+    writer = csv.writer(stream)
+    writer.writerow(fields)
+    count = 0
+    for row in queryset.values_list(*fields).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        writer.writerow([spreadsheet_safe(value) for value in row])
+        count += 1
+    return count
+
+
+def export_storage():
+    return storages['exports']
+
+
+def save_export(queryset, fields):
+    """Write the CSV to the export storage; returns (file name, row count)."""
+    label = queryset.model._meta.model_name
+    name = f"{label}-{timezone.now():%Y%m%d-%H%M%S}-{uuid.uuid4().hex[:8]}.csv"
+    with tempfile.TemporaryFile() as buffer:
+        text = io.TextIOWrapper(buffer, encoding='utf-8', newline='')
+        count = write_csv(queryset, fields, text)
+        text.flush()
+        text.detach()
+        buffer.seek(0)
+        name = export_storage().save(name, File(buffer))
+    return name, count
+
+
+def export_path(name):
+    """Storage path of an export, or None when `name` is not a plain export file name."""
+    if '/' in name or '\\' in name or name.startswith('.') or not name.endswith('.csv'):
+        return None
+    return name
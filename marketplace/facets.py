@@ -0,0 +1,140 @@
+"""
+Faceted browsing for home: category, price band, seller rating and has-image.
+
+Each facet's counts come from one grouped query over the listing with every
+*other* active filter applied, so an option's count is how many items you
+would get by picking it:
+
+    SELECT category, COUNT(*) FROM item WHERE status = 'Available' AND price < 25 GROUP BY category
+
+That is four queries per page whatever the number of options. The filtered
+listing itself runs on item_status_category_price_idx, and seller rating is
+the denormalised CustomUser.seller_rating rather than an aggregate per row.
+
+Query string: ?category=Books&category=Furniture&price=10-25&rating=4&has_image=1
+"""
+from django.db.models import BooleanField, Case, Count, F, IntegerField, Q, Value, When
+
+from .models import Item
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ('0-10', 'Under £10', None, 10),
+    ('10-25', '£10 – £25', 10, 25),
+    ('25-50', '£25 – £50', 25, 50),
+    ('50-100', '£50 – £100', 50, 100),
+    ('100-', '£100 and over', 100, None),
+]
+# Seller rating options are cumulative: "4★ & up" includes 5★ sellers
+RATING_THRESHOLDS = (4, 3, 2)
+
+FACETS = ('category', 'price', 'rating', 'has_image')
+
+
+def _price_q(band):
+    _, _, low, high = band
+    q = Q()
+    if low is not None:
+        q &= Q(price__gte=low)
+    if high is not None:
+        q &= Q(price__lt=high)
+    return q
+
+
+def price_band_expression():
+    return Case(*(When(_price_q(band), then=Value(band[0])) for band in PRICE_BANDS))
+
+
+def rating_floor_expression():
+    return Case(
+        *(When(seller__seller_rating__gte=stars, then=Value(stars)) for stars in RATING_THRESHOLDS),
+        default=Value(0), output_field=IntegerField(),
+    )
+
+
+def has_image_expression():
+    return Case(
+        When(Q(image__isnull=True) | Q(image=''), then=Value(False)),
+        default=Value(True), output_field=BooleanField(),
+    )
+
+
+class FacetSelection:
+    """The facet filters chosen in a request's query string; unknown values are ignored."""
+
+    def __init__(self, params):
+        categories = {choice for choice, _ in Item.CATEGORY_CHOICES}
+        bands = {band[0] for band in PRICE_BANDS}
+        self.category = [c for c in params.getlist('category') if c in categories]
+        self.price = [p for p in params.getlist('price') if p in bands]
+        rating = params.get('rating', '')
+        self.rating = int(rating) if rating.isdigit() and int(rating) in RATING_THRESHOLDS else None
+        self.has_image = params.get('has_image') == '1'
+
+    def filter(self, queryset, skip=None):
+        """Apply every active facet except `skip` (the one being counted)."""
+        if self.category and skip != 'category':
+            queryset = queryset.filter(category__in=self.category)
+        if self.price and skip != 'price':
+            bands = Q()
+            for band in PRICE_BANDS:
+                if band[0] in self.price:
+                    bands |= _price_q(band)
+            queryset = queryset.filter(bands)
+        if self.rating and skip != 'rating':
+            queryset = queryset.filter(seller__seller_rating__gte=self.rating)
+        if self.has_image and skip != 'has_image':
+            queryset = queryset.exclude(image__isnull=True).exclude(image='')
+        return queryset
+
+
+def _grouped(queryset, expression):
+    rows = queryset.order_by().annotate(facet=expression).values('facet').annotate(n=Count('id'))
+    return {row['facet']: row['n'] for row in rows}
+
+
+def _toggled(params, name, value, multiple):
+    """Query string for the current page with one facet option switched on or off."""
+    params = params.copy()
+    params.pop('page', None)
+    values = params.getlist(name)
+    if value in values:
+        values.remove(value)
+    elif multiple:
+        values.append(value)
+    else:
+        values = [value]
+    params.setlist(name, values)
+    return params.urlencode()
+
+
+def facet_counts(queryset, selection, params):
+    """The facet panel for home: one grouped query per facet, each option with its count and toggle link."""
+    categories = _grouped(selection.filter(queryset, skip='category'), F('category'))
+    prices = _grouped(selection.filter(queryset, skip='price'), price_band_expression())
+    rating_floors = _grouped(selection.filter(queryset, skip='rating'), rating_floor_expression())
+    images = _grouped(selection.filter(queryset, skip='has_image'), has_image_expression())
+
+    options = {
+        'category': [(value, label, categories.get(value, 0), value in selection.category)
+                     for value, label in Item.CATEGORY_CHOICES],
+        'price': [(key, label, prices.get(key, 0), key in selection.price)
+                  for key, label, _, _ in PRICE_BANDS],
+        'rating': [(str(stars), f"{stars}★ & up",
+                    sum(n for floor, n in rating_floors.items() if floor >= stars), selection.rating == stars)
+                   for stars in RATING_THRESHOLDS],
+        'has_image': [('1', "With photo", images.get(True, 0), selection.has_image)],
+    }
+    titles = {'category': "Category", 'price': "Price", 'rating': "Seller rating", 'has_image': "Photo"}
+    return [
+        {
+            'name': name,
+            'title': titles[name],
+            'options': [
+                {'value': value, 'label': label, 'count': count, 'selected': selected,
+                 'query': _toggled(params, name, value, multiple=name in ('category', 'price'))}
+                for value, label, count, selected in options[name]
+            ],
+        }
+        for name in FACETS
+    ]
@@ -1,6 +1,6 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import Item, CustomUser, Offer, UserRating
+from .models import Item, CustomUser, Offer, UserRating, UNIVERSITY_EMAIL_RE
 import re
 from .models import Report
 from django.contrib.auth.forms import UserChangeForm
@@ -26,7 +26,7 @@ class CustomUserCreationForm(UserCreationForm):
     def clean_email(self):
         """Validate that email follows the university format."""
         email = self.cleaned_data.get("email")
-        if not re.match(r"^\d{7}[A-Z]@student\.gla\.ac\.uk$", email):
+        if not UNIVERSITY_EMAIL_RE.match(email):
             raise forms.ValidationError("Invalid university email. Please use your @student.gla.ac.uk email.")
         return email
 
@@ -58,7 +58,7 @@ class RegisterForm(UserCreationForm):
     def clean_email(self):
         """Ensure only university emails can be used for registration."""
         email = self.cleaned_data.get("email")
-        if not re.match(r"^\d{7}[A-Z]@student\.gla\.ac\.uk$", email):
+        if not UNIVERSITY_EMAIL_RE.match(email):
             raise forms.ValidationError("Invalid email. Use a valid university email (@student.gla.ac.uk).")
         return email
 
@@ -66,13 +66,13 @@ class RegisterForm(UserCreationForm):
 class ReportForm(forms.ModelForm):
     class Meta:
         model = Report
-        fields = ['reported_item', 'reason', 'description', 'status']
+        fields = ['reason', 'description']
         labels = {
             'reason': 'Reason for Reporting',
             'description': 'Additional Details (Optional)',
         }
         widgets = {
-            'reason': forms.Select(attrs={'class': 'form-control'}),
+            'reason': forms.TextInput(attrs={'class': 'form-control'}),
             'description': forms.Textarea(attrs={'class': 'form-control', 'rows': 4}),
         }
 
@@ -81,7 +81,7 @@ class ReportForm(forms.ModelForm):
         description = self.cleaned_data.get("description")
         if description and len(description) < 10:
             raise forms.ValidationError("Please provide more details (at least 10 characters).")
-        if any(word in description.lower() for word in ["spam", "fake", "test"]):
+        if description and any(word in description.lower() for word in ["spam", "fake", "test"]):
             raise forms.ValidationError("Inappropriate words detected in the description.")
         return description
 
@@ -0,0 +1,138 @@
+"""
+Campus pickup locations and "items near me" on home.
+
+Addresses are free text. geocode() matches them against a local gazetteer of
+campus buildings, halls and subway stops, with no network calls. A match gives
+the seller's coordinates and their grid cell. CustomUser.update_address()
+stores all three.
+
+The spatial index is a plain indexed column. The map is cut into cells about
+500 m square, and customuser.geo_cell holds each seller's cell. A radius
+search works in two steps:
+
+1. Pick the cells that overlap the circle. This is the indexed
+   `geo_cell IN (...)` lookup. Those sellers' Available items are then
+   read through item_seller_status_idx.
+2. Compute the exact distance for just those sellers. Distances use the
+   equirectangular approximation, which is well under 1% off at campus range.
+   The distance is computed in SQL, so home can filter and sort on it like
+   any other column.
+
+This behaves the same on every database backend and on the read replicas,
+so there is no separate R-tree to keep in sync.
+
+Query string: ?near=boyd-orr&radius=500, or ?near=me for the signed-in user's
+own address.
+"""
+import math
+import re
+from collections import namedtuple
+
+from django.contrib.auth import get_user_model
+from django.db.models import F, FloatField
+from django.db.models.functions import Sqrt
+
+Place = namedtuple('Place', 'key name lat lon aliases')
+
+# University of Glasgow: Gilmorehill campus, nearby halls and subway stops
+GAZETTEER = [
+    Place('main-building', "Main Building", 55.8721, -4.2882, ("main building", "gilbert scott", "cloisters")),
+    Place('library', "University Library", 55.8734, -4.2887, ("library", "hillhead street")),
+    Place('boyd-orr', "Boyd Orr Building", 55.8737, -4.2927, ("boyd orr",)),
+    Place('sawb', "Sir Alwyn Williams Building", 55.8738, -4.2920, ("alwyn williams", "sawb", "lilybank gardens")),
+    Place('fraser', "Fraser Building", 55.8727, -4.2898, ("fraser building",)),
+    Place('adam-smith', "Adam Smith Building", 55.8731, -4.2906, ("adam smith",)),
+    Place('mccune-smith', "James McCune Smith Learning Hub", 55.8730, -4.2942, ("mccune smith", "learning hub")),
+    Place('arc', "Advanced Research Centre", 55.8719, -4.2954, ("advanced research centre", "arc")),
+    Place('rankine', "Rankine Building", 55.8714, -4.2879, ("rankine",)),
+    Place('james-watt', "James Watt Building", 55.8711, -4.2898, ("james watt",)),
+    Place('joseph-black', "Joseph Black Building", 55.8716, -4.2935, ("joseph black",)),
+    Place('kelvin', "Kelvin Building", 55.8713, -4.2920, ("kelvin building",)),
+    Place('wolfson-medical', "Wolfson Medical School", 55.8702, -4.2933, ("wolfson medical",)),
+    Place('stevenson', "Stevenson Building", 55.8730, -4.2862, ("stevenson building", "sport centre")),
+    Place('guu', "Glasgow University Union", 55.8716, -4.2857, ("glasgow university union", "guu")),
+    Place('qmu', "Queen Margaret Union", 55.8741, -4.2913, ("queen margaret union", "qmu")),
+    Place('murano', "Murano Street Student Village", 55.8814, -4.2826, ("murano street", "murano")),
+    Place('qm-residences', "Queen Margaret Residences", 55.8811, -4.2939, ("queen margaret residences",)),
+    Place('cairncross', "Cairncross House", 55.8670, -4.2960, ("cairncross",)),
+    Place('kelvinhaugh', "Kelvinhaugh Street", 55.8633, -4.2892, ("kelvinhaugh",)),
+    Place('firhill', "Firhill Student Village", 55.8790, -4.2690, ("firhill",)),
+    Place('wolfson-hall', "Wolfson Hall, Garscube", 55.9028, -4.3142, ("wolfson hall", "garscube")),
+    Place('hillhead-subway', "Hillhead Subway", 55.8753, -4.2930, ("hillhead",)),
+    Place('kelvinbridge', "Kelvinbridge Subway", 55.8752, -4.2826, ("kelvinbridge",)),
+]
+PLACES = {place.key: place for place in GAZETTEER}
+
+_ALIASES = {alias: place for place in GAZETTEER for alias in place.aliases}
+_ALIAS_RE = re.compile(r'\b(?:%s)\b' % '|'.join(
+    re.escape(alias) for alias in sorted(_ALIASES, key=len, reverse=True)
+))
+
+RADIUS_CHOICES = (250, 500, 1000, 2000)  # metres
+DEFAULT_RADIUS = 1000
+
+M_PER_DEG_LAT = 111_320
+CELL_LAT = 0.0045  # ~500 m
+CELL_LON = 0.008   # ~500 m at 56°N
+_CELL_ROW_STRIDE = 100_000  # > 360 / CELL_LON, so (row, col) packs into one integer
+
+
+def geocode(address):
+    """(lat, lon) of the gazetteer place named in `address`, or None. The longest alias mentioned wins."""
+    text = ' '.join(re.findall(r'[a-z0-9]+', (address or '').lower()))
+    matches = [match.group() for match in _ALIAS_RE.finditer(text)]
+    if not matches:
+        return None
+    place = _ALIASES[max(matches, key=len)]
+    return place.lat, place.lon
+
+
+def grid_cell(lat, lon):
+    return math.floor(lat / CELL_LAT) * _CELL_ROW_STRIDE + math.floor(lon / CELL_LON)
+
+
+def cells_within(lat, lon, radius_m):
+    """Every grid cell overlapping the radius_m circle's bounding box."""
+    dlat = radius_m / M_PER_DEG_LAT
+    dlon = radius_m / (M_PER_DEG_LAT * math.cos(math.radians(lat)))
+    rows = range(math.floor((lat - dlat) / CELL_LAT), math.floor((lat + dlat) / CELL_LAT) + 1)
+    cols = range(math.floor((lon - dlon) / CELL_LON), math.floor((lon + dlon) / CELL_LON) + 1)
+    return [row * _CELL_ROW_STRIDE + col for row in rows for col in cols]
+
+
+def distance_expression(lat, lon, prefix=''):
+    """Metres from (lat, lon) to the row's latitude/longitude columns, as an SQL expression."""
+    m_per_deg_lon = M_PER_DEG_LAT * math.cos(math.radians(lat))
+    north = (F(f'{prefix}latitude') - lat) * M_PER_DEG_LAT
+    east = (F(f'{prefix}longitude') - lon) * m_per_deg_lon
+    return Sqrt(north * north + east * east, output_field=FloatField())
+
+
+def items_near(items, lat, lon, radius_m):
+    """`items` whose seller is within radius_m of (lat, lon), annotated with `distance` in metres."""
+    # As a subquery, so the plan starts from the geo_cell index and then reads
+    # item_seller_status_idx, rather than walking every Available item
+    sellers = get_user_model().objects.filter(geo_cell__in=cells_within(lat, lon, radius_m))
+    return items.filter(seller__in=sellers) \
+        .annotate(distance=distance_expression(lat, lon, prefix='seller__')) \
+        .filter(distance__lte=radius_m)
+
+
+class NearSelection:
+    """The ?near= origin and ?radius= in a request; `origin` is None when no usable location was asked for."""
+
+    def __init__(self, params, user):
+        self.key = params.get('near', '')
+        radius = params.get('radius', '')
+        self.radius = int(radius) if radius.isdigit() and int(radius) in RADIUS_CHOICES else DEFAULT_RADIUS
+        self.origin = None
+        if self.key == 'me':
+            if user.is_authenticated and user.latitude is not None:
+                self.origin = (user.latitude, user.longitude)
+        elif self.key in PLACES:
+            self.origin = (PLACES[self.key].lat, PLACES[self.key].lon)
+
+    def filter(self, items):
+        if self.origin is None:
+            return items
+        return items_near(items, *self.origin, self.radius)
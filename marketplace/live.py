@@ -0,0 +1,256 @@
+"""
+Live listing updates for home over server-sent events.
+
+    GET /live/items/    text/event-stream
+
+Item saves publish compact diffs once their transaction commits:
+
+    id: 42
+    event: new
+    data: {"id": 7, "seller_id": 3, "html": "<div class=\\"item-card\\" ...>", "seller_html": "..."}
+
+    event: status    data: {"id": 7, "status": "Sold"}
+    event: price     data: {"id": 7, "price": "12.50"}
+
+A new item's card is rendered when the event is published, not once per
+connected browser. Its links depend on whether the viewer is the seller, so
+it is rendered twice: `html` as any other viewer sees it, `seller_html` as
+the seller does. The page picks one by comparing seller_id with its user.
+
+Every event has an id. A reconnecting browser sends the last id it saw as
+Last-Event-ID, and the stream replays what it missed from the backlog
+(LIVE_BACKLOG events). If the gap reaches further back than the backlog, the
+stream sends `reload` and the page refreshes itself. home puts the id current
+at render time in the page, so nothing published between the render and the
+EventSource connecting is missed.
+
+Broadcasters (LIVE_EVENTS_BACKEND):
+- 'redis', the default with REDIS_URL: a capped Redis stream shared by every
+  worker.
+- 'memory': per process. It only sees saves made in the same process, so use
+  it for development and tests.
+
+A connection occupies a worker thread, so it is closed after
+LIVE_STREAM_SECONDS. The browser reconnects and resumes from its
+Last-Event-ID. A worker holds at most LIVE_MAX_STREAMS connections open so
+that its other threads stay free for page requests. Past that, a connection
+gets what it missed, if anything, and is closed at once with a `retry` of
+LIVE_POLL_SECONDS. The browser then polls at that interval until a slot is
+free; EventSource does this by itself.
+"""
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.http import HttpRequest
+from django.template.loader import render_to_string
+
+logger = logging.getLogger(__name__)
+
+REDIS_ID_RE = re.compile(r'^\d+-\d+$')
+
+
+class MemoryBroadcaster:
+    """Per-process event backlog; readers block on a condition until something newer arrives."""
+
+    def __init__(self, backlog):
+        self.condition = threading.Condition()
+        self.events = deque(maxlen=backlog)
+        self.last_id = 0
+
+    def publish(self, event, data):
+        with self.condition:
+            self.last_id += 1
+            self.events.append((str(self.last_id), event, data))
+            self.condition.notify_all()
+
+    def latest_id(self):
+        return str(self.last_id)
+
+    def read(self, after, timeout):
+        """
+        Events newer than id `after`, waiting up to `timeout` seconds for the
+        first one. None when `after` is not in the backlog (too old, or from
+        before a restart): the reader has to start over.
+        """
+        if not after.isdigit():
+            return None
+        after = int(after)
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_id != after, timeout)
+            oldest = int(self.events[0][0]) if self.events else self.last_id + 1
+            if after > self.last_id or after < oldest - 1:
+                return None
+            return [event for event in self.events if int(event[0]) > after]
+
+
+def _redis_id(value):
+    ms, _, seq = value.partition('-')
+    return int(ms), int(seq)
+
+
+class RedisBroadcaster:
+    """A Redis stream trimmed to about `backlog` entries; stream ids are the event ids."""
+    KEY = 'marketplace:live:items'
+
+    def __init__(self, url, backlog):
+        import redis
+
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.backlog = backlog
+
+    def publish(self, event, data):
+        self.client.xadd(self.KEY, {'event': event, 'data': data}, maxlen=self.backlog, approximate=True)
+
+    def latest_id(self):
+        entries = self.client.xrevrange(self.KEY, count=1)
+        return entries[0][0] if entries else '0-0'
+
+    def read(self, after, timeout):
+        if not REDIS_ID_RE.match(after):
+            return None
+        oldest = self.client.xrange(self.KEY, count=1)
+        if oldest and after != '0-0' and _redis_id(after) < _redis_id(oldest[0][0]):
+            return None  # trimmed past the reader's position
+        streams = self.client.xread({self.KEY: after}, block=int(timeout * 1000) or 1)
+        if not streams:
+            return []
+        return [(event_id, fields['event'], fields['data']) for event_id, fields in streams[0][1]]
+
+
+_broadcaster = None
+_broadcaster_lock = threading.Lock()
+
+
+def get_broadcaster():
+    global _broadcaster
+    if _broadcaster is None:
+        with _broadcaster_lock:
+            if _broadcaster is None:
+                backlog = getattr(settings, 'LIVE_BACKLOG', 1000)
+                if getattr(settings, 'LIVE_EVENTS_BACKEND', 'memory') == 'redis':
+                    _broadcaster = RedisBroadcaster(settings.REDIS_URL, backlog)
+                else:
+                    _broadcaster = MemoryBroadcaster(backlog)
+    return _broadcaster
+
+
+def publish(event, **data):
+    """Publish after the surrounding transaction commits, so no reader sees a change that rolls back."""
+    payload = json.dumps(data, separators=(',', ':'))
+
+    def send():
+        try:
+            get_broadcaster().publish(event, payload)
+        except Exception:
+            # Live updates are best effort; the next page load is always correct
+            logger.warning("Publishing live %s event failed", event, exc_info=True)
+
+    transaction.on_commit(send)
+
+
+def render_card(item, viewer):
+    """The item's home card as `viewer` would see it."""
+    request = HttpRequest()
+    request.user = viewer
+    return render_to_string('marketplace/partials/item_card.html', {'item': item}, request=request)
+
+
+def publish_item(item, created):
+    """The diff for one saved Item: a new card, or its status and/or price change."""
+    if created:
+        if item.status == 'Available':
+            publish('new', id=item.id, seller_id=item.seller_id, html=render_card(item, AnonymousUser()),
+                    seller_html=render_card(item, item.seller))
+        return
+    old_status = getattr(item, '_loaded_status', None)
+    if old_status is not None and item.__dict__.get('status', old_status) != old_status:
+        publish('status', id=item.id, status=item.status)
+    old_price = getattr(item, '_loaded_price', None)
+    new_price = item.__dict__.get('price')
+    if old_price is not None and new_price is not None and Decimal(str(new_price)) != old_price:
+        publish('price', id=item.id, price=str(new_price))
+
+
+def publish_removed(item):
+    if item.status == 'Available':
+        publish('status', id=item.id, status='Deleted')
+
+
+def publish_status(item_ids, status):
+    """For status changes made with QuerySet.update(), which sends no signals."""
+    for item_id in item_ids:
+        publish('status', id=item_id, status=status)
+
+
+def latest_event_id():
+    """The id home renders into the page for the EventSource to start from ('' if the broadcaster is down)."""
+    try:
+        return get_broadcaster().latest_id()
+    except Exception:
+        logger.warning("Live event broadcaster unavailable", exc_info=True)
+        return ''
+
+
+def format_event(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {data}\n\n"
+
+
+_open_streams = 0
+_open_streams_lock = threading.Lock()
+
+
+def _claim_stream():
+    global _open_streams
+    with _open_streams_lock:
+        if _open_streams >= getattr(settings, 'LIVE_MAX_STREAMS', 4):
+            return False
+        _open_streams += 1
+        return True
+
+
+def _release_stream():
+    global _open_streams
+    with _open_streams_lock:
+        _open_streams -= 1
+
+
+def event_stream(last_event_id, heartbeat=None, duration=None):
+    """The text/event-stream body: backlog since `last_event_id`, then live events, with keep-alive comments."""
+    heartbeat = heartbeat or getattr(settings, 'LIVE_HEARTBEAT_SECONDS', 15)
+    duration = duration or getattr(settings, 'LIVE_STREAM_SECONDS', 300)
+    broadcaster = get_broadcaster()
+    after = last_event_id or broadcaster.latest_id()
+    if not _claim_stream():
+        # Every stream slot is taken: answer like one poll and have the browser come back later
+        yield f"retry: {getattr(settings, 'LIVE_POLL_SECONDS', 10) * 1000}\n\n"
+        events = broadcaster.read(after, 0)
+        if events is None:
+            yield format_event(broadcaster.latest_id(), 'reload', '{}')
+        elif events:
+            yield ''.join(format_event(*event) for event in events)
+        return
+    try:
+        # Reconnect quickly when the server closes the stream at `duration`
+        yield "retry: 1000\n\n"
+        deadline = time.monotonic() + duration
+        while (remaining := deadline - time.monotonic()) > 0:
+            events = broadcaster.read(after, min(heartbeat, remaining))
+            if events is None:
+                yield format_event(broadcaster.latest_id(), 'reload', '{}')
+                return
+            if not events:
+                yield ": keep-alive\n\n"
+                continue
+            yield ''.join(format_event(*event) for event in events)
+            after = events[-1][0]
+    finally:
+        # Also runs when the server closes the response because the client went away
+        _release_stream()
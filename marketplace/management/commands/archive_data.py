@@ -0,0 +1,79 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from marketplace import archive
+from marketplace.models import Item, Message, Transaction
+
+# Whole-table reads that shrink with the hot tables (admin_dashboard, message search)
+HOT_QUERIES = [
+    ("admin_dashboard items", lambda: list(Item.objects.values_list('id', 'name', 'price', 'status'))),
+    ("admin_dashboard transactions", lambda: list(Transaction.objects.values_list('id', 'total_price', 'status'))),
+    ("message content scan", lambda: Message.objects.filter(content__icontains='refund').count()),
+]
+
+
+def time_queries(runs=5):
+    timings = {}
+    for label, query in HOT_QUERIES:
+        samples = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            query()
+            samples.append(time.perf_counter() - start)
+        timings[label] = statistics.median(samples) * 1e3
+    return timings
+
+
+class Command(BaseCommand):
+    help = (
+        "Move finished transactions, sold items and read messages past their retention windows "
+        "(ARCHIVE_*_AFTER_DAYS) into the archive tables, then report moved rows, space and hot-query timings."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+        parser.add_argument('--vacuum', action='store_true',
+                            help="VACUUM afterwards so the freed pages are returned to the filesystem.")
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            for label, queryset in [("transactions", archive.archivable_transactions()),
+                                    ("items", archive.archivable_items()),
+                                    ("messages", archive.archivable_messages())]:
+                self.stdout.write(f"{label}: {queryset.count()} rows would be archived")
+            return
+
+        hot_models = (Item, Transaction, Message)
+        tables_before = {model: archive.table_size(model) for model in hot_models}
+        size_before, _ = archive.database_size(Item)
+        timings_before = time_queries()
+        started = time.perf_counter()
+        moved = archive.archive_all(batch_size=options['batch_size'])
+        elapsed = time.perf_counter() - started
+        for label, count in moved.items():
+            self.stdout.write(f"{label}: {count} rows archived")
+        self.stdout.write(f"Archived in {elapsed:.1f}s")
+
+        for model in hot_models:
+            before, after = tables_before[model], archive.table_size(model)
+            if before is not None:
+                self.stdout.write(f"{model._meta.db_table:<30} {before / 1e6:8.2f} MB -> {after / 1e6:8.2f} MB")
+
+        size_after, free = archive.database_size(Item)
+        if options['vacuum']:
+            archive.vacuum(Item)
+            size_after, free = archive.database_size(Item)
+        if size_before is not None:
+            self.stdout.write(
+                f"Main database: {size_before / 1e6:.1f} MB -> {size_after / 1e6:.1f} MB"
+                + (f" ({free / 1e6:.1f} MB free pages; run with --vacuum to reclaim)" if free else "")
+            )
+
+        timings_after = time_queries()
+        for label, before in timings_before.items():
+            after = timings_after[label]
+            self.stdout.write(f"{label:<30} {before:8.2f} ms -> {after:8.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Archived {sum(moved.values())} rows."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.trending import refresh_trending
+
+
+class Command(BaseCommand):
+    help = "Recompute trending scores for all available items and rebuild the ranked table (run periodically)."
+
+    def handle(self, *args, **options):
+        ranked = refresh_trending()
+        self.stdout.write(self.style.SUCCESS(f"Ranked {ranked} items."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.viewcounts import get_view_buffer
+
+
+class Command(BaseCommand):
+    help = "Write buffered item view counts to the database (run from cron when using the Redis buffer)."
+
+    def handle(self, *args, **options):
+        flushed = get_view_buffer().flush()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {flushed} item views."))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.duplicates import check_item, index_items
+from marketplace.models import Item
+
+
+class Command(BaseCommand):
+    help = (
+        "Fingerprint listings for duplicate detection (marketplace.duplicates), in primary-key batches, "
+        "then check every available listing, oldest first, so the original of each re-post is kept. "
+        "Only needed once to backfill; afterwards new and edited listings are checked as they are saved."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--rebuild', action='store_true', help="Recompute signatures that already exist.")
+        parser.add_argument('--no-check', action='store_true', help="Only compute signatures.")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        items = Item.objects.order_by('pk').prefetch_related('images')
+        if not options['rebuild']:
+            items = items.filter(signature__isnull=True)
+
+        indexed, last_pk = 0, 0
+        while batch := list(items.filter(pk__gt=last_pk)[:batch_size]):
+            index_items(batch)
+            indexed += len(batch)
+            last_pk = batch[-1].pk
+
+        found = 0
+        if not options['no_check']:
+            available = Item.objects.filter(status='Available').select_related('signature').order_by('pk')
+            for item in available.iterator(chunk_size=batch_size):
+                if check_item(item, getattr(item, 'signature', None)) is not None:
+                    found += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Indexed {indexed} listings; {found} re-posts found."))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from marketplace.notifications import fan_out_item_changes
+
+
+class Command(BaseCommand):
+    help = "Notify wishlist watchers about price drops and sold items recorded in the item change log."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total_changes = total_notifications = 0
+        while True:
+            changes, notifications = fan_out_item_changes(batch_size=options['batch_size'])
+            if not changes:
+                break
+            total_changes += changes
+            total_notifications += notifications
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {total_changes} item changes, created {total_notifications} notifications."
+        ))
@@ -0,0 +1,71 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import Coalesce, TruncDate
+
+from marketplace.analytics import bump
+from marketplace.models import ArchivedItem, ArchivedTransaction, Item, Offer, SellerDailyStats, Transaction
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the offers/sales/revenue columns of the seller rollup from history. "
+        "Only needed once to backfill; afterwards the rollup is maintained incrementally. "
+        "Sales include archived transactions. View counts cannot be recomputed and are "
+        "left as they are, and offers on archived items were deleted with them."
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            SellerDailyStats.objects.update(offers=0, sales=0, revenue=0)
+
+            offers = (
+                Offer.objects.annotate(day=TruncDate('created_at'))
+                .values('item__seller', 'item__category', 'day')
+                .annotate(count=Count('id'))
+            )
+            for row in offers.iterator():
+                bump(row['item__seller'], row['item__category'], day=row['day'], offers=row['count'])
+
+            sales = (
+                Transaction.objects.filter(status='Sold')
+                .annotate(day=TruncDate(Coalesce('date_completed', 'date_initiated')))
+                .values('item__seller', 'item__category', 'day')
+                .annotate(count=Count('id'), revenue=Sum('total_price'))
+            )
+            for row in sales.iterator():
+                bump(row['item__seller'], row['item__category'], day=row['day'],
+                     sales=row['count'], revenue=row['revenue'])
+
+            unattributed = self.rebuild_archived_sales()
+
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {SellerDailyStats.objects.count()} rollup rows."))
+        if unattributed:
+            self.stdout.write(self.style.WARNING(
+                f"Skipped {unattributed} archived sales whose item no longer exists."
+            ))
+
+    def rebuild_archived_sales(self):
+        """Add the archived sales; returns how many could not be attributed to a seller."""
+        # The archive may be a separate database, so its rows are grouped per item and
+        # the item's seller and category are looked up in ArchivedItem and Item
+        sales = list(
+            ArchivedTransaction.objects.filter(status='Sold')
+            .annotate(day=TruncDate(Coalesce('date_completed', 'date_initiated')))
+            .values('item_id', 'day')
+            .annotate(count=Count('id'), revenue=Sum('total_price'))
+            .order_by()
+        )
+        item_ids = list({row['item_id'] for row in sales})
+        owners = {}
+        for model in (ArchivedItem, Item):
+            # in_bulk() splits the ids to stay within the backend's parameter limit
+            owners.update(model.objects.only('seller_id', 'category').in_bulk(item_ids))
+        unattributed = 0
+        for row in sales:
+            if row['item_id'] not in owners:
+                unattributed += row['count']
+                continue
+            item = owners[row['item_id']]
+            bump(item.seller_id, item.category, day=row['day'], sales=row['count'], revenue=row['revenue'])
+        return unattributed
@@ -0,0 +1,62 @@
+import signal
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+import marketplace.tasks  # noqa: F401  (registers the task functions)
+from marketplace.taskqueue import DatabaseBackend
+
+
+class Command(BaseCommand):
+    help = "Run queued background tasks on a thread pool until stopped (SIGINT/SIGTERM)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4)
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty.")
+        parser.add_argument('--stale-after', type=int, default=600, help="Requeue tasks running longer than this (seconds).")
+        parser.add_argument('--once', action='store_true', help="Exit as soon as the queue is empty.")
+
+    def handle(self, *args, **options):
+        backend = DatabaseBackend()
+        threads = options['threads']
+        stopping = threading.Event()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: stopping.set())
+
+        def run_one(task_row):
+            try:
+                return backend.run(task_row)
+            finally:
+                connections.close_all()
+
+        completed = failed = 0
+        in_flight = set()
+        with ThreadPoolExecutor(max_workers=threads, thread_name_prefix='task-worker') as pool:
+            while not stopping.is_set():
+                for future in [f for f in in_flight if f.done()]:
+                    in_flight.discard(future)
+                    if future.result():
+                        completed += 1
+                    else:
+                        failed += 1
+
+                backend.requeue_stale(options['stale_after'])
+                claimed = backend.claim(threads - len(in_flight)) if len(in_flight) < threads else []
+                for task_row in claimed:
+                    in_flight.add(pool.submit(run_one, task_row))
+
+                if not claimed:
+                    if options['once'] and not in_flight:
+                        break
+                    time.sleep(options['poll_interval'] if not in_flight else 0.05)
+            # Let running tasks finish before the pool shuts down
+            for future in in_flight:
+                if future.result():
+                    completed += 1
+                else:
+                    failed += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Worker stopped: {completed} tasks done, {failed} failed or retried."))
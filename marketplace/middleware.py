@@ -0,0 +1,271 @@
+import json
+import mimetypes
+import os
+import secrets
+import struct
+import time
+import zlib
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+from django.core.cache import cache
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, JsonResponse
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+from .routers import PIN_COOKIE_NAME, _has_written, replica_aliases
+from .storage import load_brotli
+
+
+def accepted_encodings(request):
+    """Content codings the client accepts (those not refused with q=0), lower-cased."""
+    accepted = set()
+    for part in request.headers.get('Accept-Encoding', '').split(','):
+        coding, _, params = part.partition(';')
+        name, _, value = params.strip().partition('=')
+        try:
+            refused = name.strip() == 'q' and float(value) == 0
+        except ValueError:
+            refused = False
+        if not refused:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class HealthCheckMiddleware:
+    """
+    Probes for the load balancer and the process manager, answered before
+    anything else runs: no host validation (probes come addressed to the
+    instance's IP), no session, no user and no database.
+
+    - LIVENESS_PATH: 200 whenever the worker can run Python at all.
+    - READINESS_PATH: 200 when this worker can serve pages, else 503 with the
+      failing checks. It checks that the static manifest is loaded (without
+      it every page fails on {% static %}) and that the cache answers. The
+      database is left out on purpose: one slow query should not take every
+      instance out of rotation at once.
+    """
+    LIVENESS_PATH = '/healthz'
+    READINESS_PATH = '/readyz'
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == self.LIVENESS_PATH:
+            response = HttpResponse('ok', content_type='text/plain')
+        elif request.path == self.READINESS_PATH:
+            checks = readiness_checks()
+            ready = all(result == 'ok' for result in checks.values())
+            response = JsonResponse({'status': 'ready' if ready else 'unavailable', 'checks': checks},
+                                    status=200 if ready else 503)
+        else:
+            return self.get_response(request)
+        response['Cache-Control'] = 'no-store'
+        return response
+
+
+def readiness_checks():
+    """{check name: 'ok' or what is wrong}"""
+    checks = {}
+    if isinstance(staticfiles_storage, ManifestFilesMixin) and not staticfiles_storage.hashed_files:
+        checks['static'] = 'no static files manifest; run collectstatic'
+    else:
+        checks['static'] = 'ok'
+    try:
+        cache.get('readiness-probe')
+    except Exception as error:
+        checks['cache'] = f'{type(error).__name__}: {error}'
+    else:
+        checks['cache'] = 'ok'
+    return checks
+
+
+class ReadYourWritesMiddleware:
+    """
+    After a request that wrote to the database (add_item, process_purchase, ...),
+    pin the user to the primary for READ_YOUR_WRITES_SECONDS so they never read
+    a replica that has not caught up with their own change yet.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _has_written.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _has_written.get()
+        finally:
+            _has_written.reset(token)
+
+        if wrote and replica_aliases():
+            window = getattr(settings, 'READ_YOUR_WRITES_SECONDS', 10)
+            response.set_cookie(
+                PIN_COOKIE_NAME, str(time.time() + window),
+                max_age=window, httponly=True, samesite='Lax',
+            )
+        return response
+
+
+class StaticFilesMiddleware:
+    """
+    Serve collected static files straight from STATIC_ROOT, in the style of
+    WhiteNoise, so no separate web server is needed for them.
+
+    Files listed in the staticfiles.json manifest have content-hashed names and
+    are sent with a one-year immutable Cache-Control; anything else gets
+    STATIC_MAX_AGE. Pre-compressed .br/.gz siblings written by
+    CompressedManifestStaticFilesStorage are used when the client accepts them.
+    """
+    IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = '/' + settings.STATIC_URL.lstrip('/')
+        self.root = settings.STATIC_ROOT
+        self.max_age = getattr(settings, 'STATIC_MAX_AGE', 60)
+        self.files = self.scan()
+
+    def scan(self):
+        """Map every collected file name to its on-disk variants, read once at startup."""
+        files = {}
+        if not self.root or not os.path.isdir(self.root):
+            return files
+        immutable = set()
+        manifest = os.path.join(self.root, 'staticfiles.json')
+        if os.path.exists(manifest):
+            with open(manifest) as f:
+                immutable = set(json.load(f).get('paths', {}).values())
+
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, self.root).replace(os.sep, '/')
+                if name.endswith(('.br', '.gz')) or name == 'staticfiles.json':
+                    continue
+                variants = {None: path}
+                for encoding, suffix in self.ENCODINGS:
+                    if os.path.exists(path + suffix):
+                        variants[encoding] = path + suffix
+                files[name] = {
+                    'variants': variants,
+                    'content_type': mimetypes.guess_type(filename)[0] or 'application/octet-stream',
+                    'cache_control': (self.IMMUTABLE_CACHE_CONTROL if name in immutable
+                                      else f'public, max-age={self.max_age}'),
+                }
+        return files
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            name = request.path_info[len(self.prefix):]
+            static_file = self.files.get(name)
+            if static_file is None and settings.DEBUG:
+                # Pick up files collected after startup while developing
+                self.files = self.scan()
+                static_file = self.files.get(name)
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    def serve(self, request, static_file):
+        variants = static_file['variants']
+        accepted = accepted_encodings(request)
+        encoding = next((coding for coding, _ in self.ENCODINGS if coding in variants and coding in accepted), None)
+        path = variants[encoding]
+
+        stat = os.stat(path)
+        etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}{"-" + encoding if encoding else ""}"'
+        if etag in request.headers.get('If-None-Match', ''):
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=static_file['content_type'])
+            response['Content-Length'] = stat.st_size
+        else:
+            response = FileResponse(open(path, 'rb'), content_type=static_file['content_type'])
+            response.headers.pop('Content-Disposition', None)
+        response['ETag'] = etag
+        response['Cache-Control'] = static_file['cache_control']
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    Compress HTML, JSON and other text responses, including streamed pages,
+    whose chunks are compressed and flushed as they are produced.
+
+    Brotli is used when the client accepts it and the brotli package is
+    installed; otherwise gzip, with the random-length header padding Django's
+    GZipMiddleware adds against BREACH. Django's own streamed gzip never
+    flushes the compressor, so a streamed page would reach the client only
+    when zlib's buffer filled; here each chunk ends with a sync flush. Images
+    and files that already carry a Content-Encoding are left alone, and so are
+    server-sent event streams: gzip would hold each event back in its buffer.
+    """
+    COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+    MIN_SIZE = 200
+
+    def process_response(self, request, response):
+        content_type = response.get('Content-Type', '')
+        if (response.has_header('Content-Encoding') or not content_type.startswith(self.COMPRESSIBLE_TYPES)
+                or content_type.startswith('text/event-stream')):
+            return response
+        encodings = accepted_encodings(request)
+        brotli = load_brotli()
+        if brotli is not None and 'br' in encodings:
+            encoding, compress_sequence = 'br', lambda chunks: self.brotli_sequence(brotli, chunks)
+            compress = brotli.compress
+        elif response.streaming and not response.is_async and 'gzip' in encodings:
+            encoding, compress_sequence, compress = 'gzip', self.gzip_sequence, None
+        else:
+            return super().process_response(request, response)
+
+        if response.streaming:
+            response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if len(response.content) < self.MIN_SIZE:
+                return response
+            compressed = compress(response.content)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def brotli_sequence(brotli, chunks):
+        compressor = brotli.Compressor()
+        for chunk in chunks:
+            # Flush per chunk so each streamed part reaches the client immediately
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+
+    def gzip_sequence(self, chunks):
+        """
+        A gzip member written by hand around a raw deflate stream: zlib's own
+        gzip header (wbits=31) has no room for the BREACH padding, which goes
+        in the header's file name as in django.utils.text.compress_sequence.
+        """
+        padding = b'a' * secrets.randbelow(self.max_random_bytes)
+        # ID1 ID2, deflate, FNAME flag, mtime 0, no extra flags, unknown OS, then the name
+        yield b'\x1f\x8b\x08\x08\x00\x00\x00\x00\x00\xff' + padding + b'\x00'
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        crc = size = 0
+        for chunk in chunks:
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            # Sync flush: everything so far is decodable, so each streamed part reaches the client now
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush() + struct.pack('<II', crc, size & 0xffffffff)
@@ -0,0 +1,51 @@
+# Generated by Django 4.2.10 on 2026-10-18 23:20
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_rows(apps, schema_editor):
+    """Keep the oldest Cart/Wishlist row per (user, item) before the unique constraints go on."""
+    for model_name in ('Cart', 'Wishlist'):
+        model = apps.get_model('marketplace', model_name)
+        keep_ids = model.objects.values('user', 'item').annotate(keep_id=Min('id')).values('keep_id')
+        model.objects.exclude(id__in=keep_ids).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0007_customuser_address'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['receiver'], name='msg_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['sender', 'receiver', 'timestamp'], name='msg_thread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='offer',
+            index=models.Index(fields=['item', 'status'], name='offer_item_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['status'], name='report_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['buyer', '-date_initiated'], name='txn_buyer_date_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_rows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='unique_cart_user_item'),
+        ),
+        migrations.AddConstraint(
+            model_name='wishlist',
+            constraint=models.UniqueConstraint(fields=('user', 'item'), name='unique_wishlist_user_item'),
+        ),
+    ]
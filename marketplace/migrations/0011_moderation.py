@@ -0,0 +1,26 @@
+# Generated by Django 4.2.10 on 2026-10-18 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0010_task'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='report',
+            name='report_status_idx',
+        ),
+        migrations.AlterField(
+            model_name='item',
+            name='status',
+            field=models.CharField(choices=[('Available', 'Available'), ('Pending', 'Pending'), ('Sold', 'Sold'), ('Hidden', 'Hidden')], default='Available', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='report',
+            index=models.Index(fields=['status', 'reported_item'], name='report_status_idx'),
+        ),
+    ]
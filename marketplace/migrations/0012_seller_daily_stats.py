@@ -0,0 +1,32 @@
+# Generated by Django 4.2.10 on 2026-10-18 23:31
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0011_moderation'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SellerDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(choices=[('Books', 'Books'), ('Electronics', 'Electronics'), ('Clothing', 'Clothing'), ('Furniture', 'Furniture'), ('Others', 'Others')], max_length=20)),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('offers', models.PositiveIntegerField(default=0)),
+                ('sales', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('seller', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='sellerdailystats',
+            constraint=models.UniqueConstraint(fields=('seller', 'day', 'category'), name='unique_seller_day_category'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-18 23:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0012_seller_daily_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='views',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
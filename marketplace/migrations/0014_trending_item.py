@@ -0,0 +1,23 @@
+# Generated by Django 4.2.10 on 2026-10-18 23:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0013_item_views'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingItem',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='marketplace.item')),
+                ('score', models.FloatField()),
+                ('rank', models.PositiveIntegerField(db_index=True)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.10 on 2026-10-18 23:54
+
+from django.db import migrations, models
+from django.db.models import Avg, OuterRef, Subquery
+
+
+def backfill_seller_rating(apps, schema_editor):
+    CustomUser = apps.get_model('marketplace', 'CustomUser')
+    UserRating = apps.get_model('marketplace', 'UserRating')
+    average = UserRating.objects.filter(rated_user=OuterRef('pk')).values('rated_user') \
+        .annotate(average=Avg('rating')).values('average')
+    CustomUser.objects.update(seller_rating=Subquery(average))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0014_trending_item'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='seller_rating',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['status', 'category', 'price'], name='item_status_category_price_idx'),
+        ),
+        migrations.RunPython(backfill_seller_rating, migrations.RunPython.noop),
+    ]
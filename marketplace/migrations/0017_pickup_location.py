@@ -0,0 +1,47 @@
+# Generated by Django 4.2.10 on 2026-10-19 00:05
+
+from django.db import migrations, models
+
+from marketplace import geo
+
+
+def backfill_pickup_location(apps, schema_editor):
+    CustomUser = apps.get_model('marketplace', 'CustomUser')
+    located = []
+    for user in CustomUser.objects.exclude(address__isnull=True).exclude(address='').only('id', 'address'):
+        location = geo.geocode(user.address)
+        if location:
+            user.latitude, user.longitude = location
+            user.geo_cell = geo.grid_cell(*location)
+            located.append(user)
+    CustomUser.objects.bulk_update(located, ['latitude', 'longitude', 'geo_cell'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0016_archive'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='geo_cell',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='latitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='longitude',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['seller', 'status'], name='item_seller_status_idx'),
+        ),
+        migrations.RunPython(backfill_pickup_location, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.2.10 on 2026-10-19 00:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0017_pickup_location'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transaction',
+            name='status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Sold', 'Sold'), ('Cancelled', 'Cancelled'), ('Refunded', 'Refunded')], max_length=20),
+        ),
+        migrations.CreateModel(
+            name='TransactionEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=20)),
+                ('from_status', models.CharField(blank=True, max_length=20)),
+                ('to_status', models.CharField(max_length=20)),
+                ('idempotency_key', models.CharField(blank=True, max_length=100, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('transaction', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='events', to='marketplace.transaction')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='transactionevent',
+            constraint=models.UniqueConstraint(fields=('transaction', 'idempotency_key'), name='unique_txn_event_key'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.10 on 2026-10-19 00:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0019_export_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignatureBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.BigIntegerField()),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='marketplace.item')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'item'], name='bucket_key_item_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ItemSignature',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='marketplace.item')),
+                ('minhash', models.BinaryField(null=True)),
+                ('image_hash', models.BigIntegerField(null=True)),
+                ('similarity', models.FloatField(blank=True, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('duplicate_of', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='marketplace.item')),
+            ],
+            options={
+                'indexes': [models.Index(condition=models.Q(('duplicate_of__isnull', False)), fields=['duplicate_of'], name='signature_duplicate_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.10 on 2026-10-19 01:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('marketplace', '0021_saved_searches'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='itemchangelog',
+            name='kind',
+            field=models.CharField(choices=[('price_drop', 'Price drop'), ('sold', 'Sold'), ('hidden', 'Hidden'), ('relisted', 'Relisted')], max_length=20),
+        ),
+    ]
@@ -1,11 +1,18 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F
 from django.conf import settings
 from django.core.exceptions import ValidationError
 import re
+from decimal import Decimal
 
 from django.utils import timezone
 
+from . import geo
+from .caching import invalidate_cached_user
+
+UNIVERSITY_EMAIL_RE = re.compile(r"^\d{7}[A-Z]@student\.gla\.ac\.uk$")
+
 
 # Custom User Model to enforce email validation
 class CustomUser(AbstractUser):
@@ -15,17 +22,69 @@ class CustomUser(AbstractUser):
     is_verified = models.BooleanField(default=False)  # Future email verification flag
     balance = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)  
     address = models.CharField(max_length=255, blank=True, null=True)  # 新增地址字段
+    # Average of received UserRatings, kept current by signals (facet filtering on home)
+    seller_rating = models.FloatField(null=True, blank=True, editable=False)
+    # Pickup location geocoded from address against the campus gazetteer (marketplace.geo)
+    latitude = models.FloatField(null=True, blank=True, editable=False)
+    longitude = models.FloatField(null=True, blank=True, editable=False)
+    geo_cell = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
+
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored email so save() only re-validates when it changes
+        instance._loaded_email = instance.__dict__.get('email')
+        return instance
 
+    def _email_changed(self, update_fields):
+        if update_fields is not None and 'email' not in update_fields:
+            return False
+        if 'email' in self.get_deferred_fields():
+            return False
+        return self._state.adding or self.email != getattr(self, '_loaded_email', None)
 
     def save(self, *args, **kwargs):
-        if not re.match(r"^\d{7}[A-Z]@student\.gla\.ac\.uk$", self.email):
-            raise ValidationError("Please use a valid university email address.")
+        if self._email_changed(kwargs.get('update_fields')):
+            if not UNIVERSITY_EMAIL_RE.match(self.email or ""):
+                raise ValidationError("Please use a valid university email address.")
         super().save(*args, **kwargs)
+        self._loaded_email = self.__dict__.get('email')
 
     def deposit(self, amount):
+        """Atomically add to the balance with a single UPDATE."""
         if amount > 0:
-            self.balance += amount
-            self.save()
+            CustomUser.objects.filter(pk=self.pk).update(balance=F('balance') + amount)
+            invalidate_cached_user(self.pk)
+            self.balance = Decimal(str(self.balance)) + amount
+
+    def withdraw(self, amount):
+        """
+        Atomically take `amount` off the balance. Returns False, without writing,
+        when the stored balance is insufficient.
+        """
+        updated = CustomUser.objects.filter(pk=self.pk, balance__gte=amount).update(balance=F('balance') - amount)
+        if not updated:
+            return False
+        invalidate_cached_user(self.pk)
+        self.balance = Decimal(str(self.balance)) - amount
+        return True
+
+    def update_address(self, address):
+        """Store the address and its geocoded pickup location. Returns False when it isn't on the campus map."""
+        self.address = address
+        location = geo.geocode(address)
+        self.latitude, self.longitude = location or (None, None)
+        self.geo_cell = geo.grid_cell(*location) if location else None
+        self.save(update_fields=['address', 'latitude', 'longitude', 'geo_cell'])
+        return location is not None
+
+    def refresh_seller_rating(self):
+        """Recompute seller_rating from the ratings this user has received, in one UPDATE."""
+        average = UserRating.objects.filter(rated_user=models.OuterRef('pk')).values('rated_user') \
+            .annotate(average=models.Avg('rating')).values('average')
+        CustomUser.objects.filter(pk=self.pk).update(seller_rating=models.Subquery(average))
+        invalidate_cached_user(self.pk)
 
 # Item model for listing products
 class Item(models.Model):
@@ -40,6 +99,7 @@ class Item(models.Model):
         ('Available', 'Available'),
         ('Pending', 'Pending'),
         ('Sold', 'Sold'),
+        ('Hidden', 'Hidden'),  # taken down by moderation
     ]
 
     name = models.CharField(max_length=200)
@@ -50,6 +110,67 @@ class Item(models.Model):
     seller = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Available')
     created_at = models.DateTimeField(auto_now_add=True)
+    views = models.PositiveIntegerField(default=0, editable=False)  # flushed in batches by marketplace.viewcounts
+
+    class Meta:
+        indexes = [
+            # home: Available items narrowed by category and price range (marketplace.facets)
+            models.Index(fields=['status', 'category', 'price'], name='item_status_category_price_idx'),
+            # home "near me": Available items of the sellers found by the geo_cell lookup (marketplace.geo)
+            models.Index(fields=['seller', 'status'], name='item_seller_status_idx'),
+            # Date-range exports (marketplace.exports)
+            models.Index(fields=['created_at'], name='item_created_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._snapshot_watched_fields()
+        return instance
+
+    def _snapshot_watched_fields(self):
+        self._loaded_price = self.__dict__.get('price')
+        self._loaded_status = self.__dict__.get('status')
+        self._loaded_listing = self._listing()
+
+    def _listing(self):
+        # What duplicate detection fingerprints (marketplace.duplicates)
+        return self.__dict__.get('name'), self.__dict__.get('description'), str(self.__dict__.get('image') or '')
+
+    def listing_changed(self):
+        """In a post_save receiver: whether the name, description or image differ from what was loaded."""
+        return self._listing() != getattr(self, '_loaded_listing', None)
+
+    def _watched_changes(self):
+        """ItemChangeLog rows for changes wishlist watchers care about (price drop, sold)."""
+        if self._state.adding:
+            return []
+        changes = []
+        old_price = getattr(self, '_loaded_price', None)
+        new_price = self.__dict__.get('price')
+        if old_price is not None and new_price is not None and Decimal(str(new_price)) < old_price:
+            changes.append(ItemChangeLog(item=self, kind='price_drop', old_price=old_price, new_price=new_price))
+        kind = status_change_kind(getattr(self, '_loaded_status', None), self.__dict__.get('status'))
+        if kind:
+            changes.append(ItemChangeLog(item=self, kind=kind))
+        return changes
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # views is only ever changed by F() increments; writing back the
+            # in-memory value would erase views flushed since this row was read
+            deferred = self.get_deferred_fields()
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'views' and field.attname not in deferred
+            ]
+        changes = self._watched_changes()
+        super().save(*args, **kwargs)
+        if changes:
+            # Only the log row is written here; watchers are notified in batch
+            # by notify_wishlist_watchers so edit_item never fans out inline.
+            ItemChangeLog.objects.bulk_create(changes)
+        self._snapshot_watched_fields()
 
     def __str__(self):
         return f"{self.name} - {self.get_status_display()}"
@@ -61,33 +182,71 @@ class ItemImage(models.Model):
 
 # Transaction model for purchases
 class Transaction(models.Model):
+    # Moved between only by marketplace.transitions (conditional UPDATEs)
+    STATUS_CHOICES = [
+        ('Pending', 'Pending'),
+        ('Sold', 'Sold'),
+        ('Cancelled', 'Cancelled'),
+        ('Refunded', 'Refunded'),
+    ]
+
     buyer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='purchases')
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
-    status = models.CharField(max_length=20, choices=[('Pending', 'Pending'), ('Sold', 'Sold')])
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES)
     total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0.00)
     date_initiated = models.DateTimeField(auto_now_add=True)
     date_completed = models.DateTimeField(null=True, blank=True)
     buyer_confirmation = models.BooleanField(default=False)
     seller_confirmation = models.BooleanField(default=False)
 
-    def confirm_transaction(self, user):
-        """Allows buyer and seller to confirm the transaction"""
-        if user == self.buyer:
-            self.buyer_confirmation = True
-        if user == self.item.seller:
-            self.seller_confirmation = True
+    class Meta:
+        indexes = [
+            # purchase_history: buyer's transactions, newest first
+            models.Index(fields=['buyer', '-date_initiated'], name='txn_buyer_date_idx'),
+            # Date-range exports (marketplace.exports)
+            models.Index(fields=['date_initiated'], name='txn_date_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Lets the analytics rollup spot the moment a transaction becomes a sale
+        instance._loaded_status = instance.__dict__.get('status')
+        return instance
 
-        if self.buyer_confirmation and self.seller_confirmation:
-            self.status = "Sold"
-            self.date_completed = timezone.now()
-            self.item.status = "Sold"
-            self.item.save()
+    def confirm_transaction(self, user, idempotency_key=None):
+        """Allows buyer and seller to confirm the transaction (see marketplace.transitions.confirm)."""
+        from . import transitions
 
-        self.save()
+        return transitions.confirm(self, user, idempotency_key=idempotency_key)
 
     def __str__(self):
         return f"Transaction: {self.item.name} - {self.status}"
 
+class TransactionEvent(models.Model):
+    """
+    Audit trail: one row per applied Transaction state change. The
+    transaction reference has no database constraint, so the trail outlives
+    archive_data moving the transaction into ArchivedTransaction (same id).
+    """
+    transaction = models.ForeignKey(Transaction, on_delete=models.DO_NOTHING, db_constraint=False,
+                                    related_name='events')
+    action = models.CharField(max_length=20)
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20)
+    actor = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True,
+                              related_name='+')
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'idempotency_key'], name='unique_txn_event_key'),
+        ]
+
+    def __str__(self):
+        return f"Transaction {self.transaction_id}: {self.action} ({self.from_status} -> {self.to_status})"
+
 # Review model for user feedback
 class Review(models.Model):
     reviewer = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
@@ -114,6 +273,12 @@ class Report(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='Pending')
     reported_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Covers the grouped moderation queue and per-item threshold counts
+            models.Index(fields=['status', 'reported_item'], name='report_status_idx'),
+        ]
+
     def __str__(self):
         return f"Report on {self.reported_item.name} by {self.reported_by.username}"
 
@@ -127,6 +292,13 @@ class Offer(models.Model):
     )
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['item', 'status'], name='offer_item_status_idx'),
+            # Date-range exports (marketplace.exports)
+            models.Index(fields=['created_at'], name='offer_created_idx'),
+        ]
+
 class UserRating(models.Model):
     rated_user = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='received_ratings', on_delete=models.CASCADE)
     reviewer = models.ForeignKey(settings.AUTH_USER_MODEL, related_name='given_ratings', on_delete=models.CASCADE)
@@ -139,11 +311,47 @@ class Cart(models.Model):
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    class Meta:
+        constraints = [
+            # One row per (user, item) so get_or_create in add_to_cart is race-free
+            models.UniqueConstraint(fields=['user', 'item'], name='unique_cart_user_item'),
+        ]
+
 class Wishlist(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     item = models.ForeignKey(Item, on_delete=models.CASCADE)
     added_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'item'], name='unique_wishlist_user_item'),
+        ]
+
+# A home query a buyer is notified about (see marketplace.saved_searches)
+class SavedSearch(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='saved_searches')
+    query = models.CharField(max_length=100, blank=True)
+    category = models.CharField(max_length=20, choices=Item.CATEGORY_CHOICES, blank=True)
+    # Inverted index key: the search is only checked against listings containing this term
+    term = models.CharField(max_length=100)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'query', 'category'], name='unique_saved_search'),
+        ]
+        indexes = [
+            models.Index(fields=['term', 'user'], name='saved_search_term_idx'),
+        ]
+
+    def describe(self):
+        if self.query and self.category:
+            return f"{self.query} in {self.category}"
+        return self.query or self.category
+
+    def __str__(self):
+        return f"{self.user}: {self.describe()}"
+
 class Message(models.Model):
     sender = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="sent_messages")
     receiver = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="received_messages")
@@ -151,5 +359,246 @@ class Message(models.Model):
     timestamp = models.DateTimeField(auto_now_add=True)
     is_read = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Unread badge in home / message_center. Django compiles is_read=False to
+            # NOT is_read, so a partial index is the only way SQLite can serve it.
+            models.Index(fields=['receiver'], condition=models.Q(is_read=False), name='msg_unread_idx'),
+            # Conversation threads ordered by time
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='msg_thread_idx'),
+        ]
+
     def __str__(self):
         return f"From {self.sender} to {self.receiver}: {self.content[:30]}"
+
+
+def status_change_kind(old_status, new_status):
+    """The ItemChangeLog kind for a status change watchers hear about, or None."""
+    if old_status is None or old_status == new_status:
+        return None
+    if new_status == 'Sold':
+        return 'sold'
+    if new_status == 'Hidden':
+        return 'hidden'
+    if old_status == 'Hidden' and new_status == 'Available':
+        return 'relisted'
+    return None
+
+
+# Item changes that wishlist watchers are notified about
+class ItemChangeLog(models.Model):
+    KIND_CHOICES = [
+        ('price_drop', 'Price drop'),
+        ('sold', 'Sold'),
+        ('hidden', 'Hidden'),
+        ('relisted', 'Relisted'),
+    ]
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='change_log')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    old_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True), name='changelog_pending_idx'),
+        ]
+
+    def describe(self):
+        if self.kind == 'price_drop':
+            return f"{self.item.name} dropped from £{self.old_price} to £{self.new_price}."
+        if self.kind == 'hidden':
+            return f"{self.item.name} has been taken off the marketplace."
+        if self.kind == 'relisted':
+            return f"{self.item.name} is back on the marketplace."
+        return f"{self.item.name} has been sold."
+
+    @classmethod
+    def log_status_change(cls, item_ids, from_status, to_status):
+        """
+        The rows Item.save() would have written for items moved with
+        QuerySet.update(), which bypasses it. Call it in the same transaction.
+        """
+        kind = status_change_kind(from_status, to_status)
+        if kind and item_ids:
+            cls.objects.bulk_create([cls(item_id=item_id, kind=kind) for item_id in item_ids])
+
+    def __str__(self):
+        return f"{self.get_kind_display()}: {self.item_id}"
+
+# In-app notifications (wishlist alerts and other background events)
+class Notification(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='notifications')
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, null=True, blank=True)
+    kind = models.CharField(max_length=20)
+    message = models.CharField(max_length=255)
+    is_read = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='notification_user_idx'),
+            models.Index(fields=['user'], condition=models.Q(is_read=False), name='notification_unread_idx'),
+        ]
+
+    def __str__(self):
+        return f"To {self.user}: {self.message}"
+
+
+# Background task queue (see marketplace.taskqueue); one row per enqueued call
+class Task(models.Model):
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    name = models.CharField(max_length=100)
+    args = models.JSONField(default=list)
+    kwargs = models.JSONField(default=dict)
+    priority = models.SmallIntegerField(default=0)  # higher runs first
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_retries = models.PositiveSmallIntegerField(default=3)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-priority', 'run_after'], condition=models.Q(status='queued'), name='task_ready_idx'),
+            models.Index(fields=['locked_at'], condition=models.Q(status='running'), name='task_running_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.status}]"
+
+
+# Per-seller daily rollup, updated incrementally (see marketplace.analytics)
+class SellerDailyStats(models.Model):
+    seller = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='daily_stats')
+    day = models.DateField()
+    category = models.CharField(max_length=20, choices=Item.CATEGORY_CHOICES)
+    views = models.PositiveIntegerField(default=0)
+    offers = models.PositiveIntegerField(default=0)
+    sales = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index for a seller's date-range reads
+            models.UniqueConstraint(fields=['seller', 'day', 'category'], name='unique_seller_day_category'),
+        ]
+
+    def __str__(self):
+        return f"{self.seller_id} {self.day} {self.category}"
+
+
+# Near-duplicate detection (see marketplace.duplicates); one row per indexed item
+class ItemSignature(models.Model):
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='signature')
+    minhash = models.BinaryField(null=True)  # MINHASH_PERMUTATIONS little-endian uint32s
+    image_hash = models.BigIntegerField(null=True)  # dHash of the primary image
+    # The older listing this one re-posts, as found by duplicates.check_item
+    duplicate_of = models.ForeignKey(Item, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    similarity = models.FloatField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['duplicate_of'], condition=models.Q(duplicate_of__isnull=False),
+                         name='signature_duplicate_idx'),
+        ]
+
+
+# LSH bucket index over ItemSignature: items sharing a key are duplicate candidates
+class SignatureBucket(models.Model):
+    key = models.BigIntegerField()
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        indexes = [
+            # Covering: a lookup reads the item ids straight from the index
+            models.Index(fields=['key', 'item'], name='bucket_key_item_idx'),
+        ]
+
+
+# Precomputed trending ranking (see marketplace.trending); rebuilt by compute_trending
+class TrendingItem(models.Model):
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    score = models.FloatField()
+    rank = models.PositiveIntegerField(db_index=True)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"#{self.rank} {self.item_id} ({self.score:.3f})"
+
+
+# Cold storage for rows past their retention window (see marketplace.archive).
+# Rows keep their original primary keys. User and item references are plain
+# columns without database constraints, because the archive may be a separate
+# SQLite file (ARCHIVE_DATABASE).
+def _archived_user_fk(related_name):
+    return models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.DO_NOTHING, db_constraint=False,
+                             related_name=related_name)
+
+
+class ArchivedItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    seller = _archived_user_fk('+')
+    name = models.CharField(max_length=200)
+    description = models.TextField()
+    category = models.CharField(max_length=20, choices=Item.CATEGORY_CHOICES)
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    image = models.CharField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=20)
+    created_at = models.DateTimeField()
+    views = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.name} (archived)"
+
+
+class ArchivedTransaction(models.Model):
+    is_archived = True
+
+    id = models.BigIntegerField(primary_key=True)
+    buyer = _archived_user_fk('+')
+    item_id = models.BigIntegerField()
+    # Copied from the item, which may itself be archived (or gone) later
+    item_name = models.CharField(max_length=200)
+    status = models.CharField(max_length=20)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    date_initiated = models.DateTimeField()
+    date_completed = models.DateTimeField(null=True, blank=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['buyer', '-date_initiated'], name='archived_txn_buyer_date_idx'),
+        ]
+
+
+class ArchivedMessage(models.Model):
+    is_archived = True
+
+    id = models.BigIntegerField(primary_key=True)
+    sender = _archived_user_fk('+')
+    receiver = _archived_user_fk('+')
+    content = models.TextField()
+    timestamp = models.DateTimeField()
+    is_read = models.BooleanField(default=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='archived_msg_thread_idx'),
+            models.Index(fields=['receiver', 'timestamp'], name='archived_msg_receiver_idx'),
+        ]
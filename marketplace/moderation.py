@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+
+from . import live
+from .models import Item, ItemChangeLog, Report
+
+# Moderator decisions on a whole item's reports
+MODERATION_ACTIONS = {
+    # Nothing wrong with the listing: close the reports and bring it back if they auto-hid it
+    'dismiss': ('Reviewed', 'Hidden', 'Available'),
+    # Listing breaks the rules: close the reports and keep it off the site
+    'hide': ('Resolved', 'Available', 'Hidden'),
+}
+
+
+def auto_hide_threshold():
+    return getattr(settings, 'REPORT_AUTO_HIDE_THRESHOLD', 5)
+
+
+def grouped_reports(status='Pending'):
+    """One row per reported item with its report count, busiest items first (a single GROUP BY)."""
+    return (
+        Report.objects.filter(status=status)
+        .values('reported_item')
+        .annotate(report_count=Count('id'), last_reported=Max('reported_at'))
+        .order_by('-report_count', '-last_reported')
+    )
+
+
+def attach_items(groups):
+    """Replace the item ids of a page of grouped rows with Item objects, in one query."""
+    groups = list(groups)
+    items = Item.objects.select_related('seller').in_bulk([group['reported_item'] for group in groups])
+    return [dict(group, item=items[group['reported_item']]) for group in groups if group['reported_item'] in items]
+
+
+def apply_action(item_ids, action):
+    """
+    Close every pending report on `item_ids` with one UPDATE and move the
+    items' status with another, logging the moves for wishlist watchers.
+    Dismissing only relists items the dismissed reports could have hidden:
+    one with no open reports was hidden by a moderator, and a re-post hidden
+    by the duplicate check stays hidden whatever its reports say.
+    Returns the number of reports closed.
+    """
+    report_status, from_item_status, to_item_status = MODERATION_ACTIONS[action]
+    with transaction.atomic():
+        pending = Report.objects.filter(reported_item_id__in=item_ids, status='Pending')
+        items = Item.objects.filter(id__in=item_ids)
+        if action == 'dismiss':
+            # Evaluated now: once the reports are closed the subquery would match nothing
+            items = Item.objects.filter(id__in=list(
+                items.filter(id__in=pending.values('reported_item'))
+                .exclude(signature__duplicate_of__isnull=False)
+                .values_list('pk', flat=True)
+            ))
+        closed = pending.update(status=report_status)
+        move_items(items, from_item_status, to_item_status)
+    return closed
+
+
+def move_items(queryset, from_status, to_status):
+    """
+    Move the items of `queryset` that are in `from_status` to `to_status` with
+    one UPDATE. update() skips Item.save(), so the change log rows for
+    wishlist watchers are written here, in the same transaction, and open
+    home pages are told. Returns the ids moved.
+    """
+    with transaction.atomic():
+        moving = queryset.select_for_update().filter(status=from_status)
+        item_ids = list(moving.values_list('pk', flat=True))
+        Item.objects.filter(id__in=item_ids).update(status=to_status)
+        ItemChangeLog.log_status_change(item_ids, from_status, to_status)
+        live.publish_status(item_ids, to_status)
+    return item_ids
+
+
+def auto_hide_if_reported(item_id):
+    """Hide an available item once its open reports reach REPORT_AUTO_HIDE_THRESHOLD."""
+    open_reports = Report.objects.filter(reported_item_id=item_id, status='Pending').count()
+    if open_reports < auto_hide_threshold():
+        return False
+    with transaction.atomic():
+        if not Item.objects.filter(id=item_id, status='Available').update(status='Hidden'):
+            return False
+        ItemChangeLog.log_status_change([item_id], 'Available', 'Hidden')
+    live.publish_status([item_id], 'Hidden')
+    return True
@@ -0,0 +1,59 @@
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ItemChangeLog, Notification, Wishlist
+
+# Notifications are inserted this many rows at a time
+FAN_OUT_CHUNK_SIZE = 1000
+
+
+def _pending_change_ids(batch_size):
+    return list(
+        ItemChangeLog.objects.filter(processed_at__isnull=True).order_by('id').values_list('id', flat=True)[:batch_size]
+    )
+
+
+def fan_out_item_changes(batch_size=500, chunk_size=FAN_OUT_CHUNK_SIZE):
+    """
+    Turn up to `batch_size` unprocessed ItemChangeLog rows into Notification rows
+    for every user watching the item. Watchers are streamed from the Wishlist
+    index and inserted with bulk_create, so an item with thousands of watchers
+    costs a handful of INSERTs. Returns (changes processed, notifications created).
+
+    Several drains can run at once (every purchase or moderation action queues
+    one), so each change is claimed with a conditional UPDATE of processed_at
+    before it is fanned out, and only the drain that wins the UPDATE notifies.
+    """
+    candidates = _pending_change_ids(batch_size)
+    if not candidates:
+        return 0, 0
+
+    # The claims are the transaction's first statements: on SQLite a concurrent
+    # drain then waits for the write lock instead of failing on a stale read
+    with transaction.atomic():
+        now = timezone.now()
+        claimed = [
+            change_id for change_id in candidates
+            if ItemChangeLog.objects.filter(id=change_id, processed_at__isnull=True).update(processed_at=now)
+        ]
+        changes = list(ItemChangeLog.objects.filter(id__in=claimed).select_related('item').order_by('id'))
+
+        created = 0
+        pending = []
+        for change in changes:
+            message = change.describe()
+            watchers = (
+                Wishlist.objects.filter(item_id=change.item_id)
+                .values_list('user_id', flat=True)
+                .iterator(chunk_size=chunk_size)
+            )
+            for user_id in watchers:
+                pending.append(Notification(user_id=user_id, item_id=change.item_id, kind=change.kind, message=message))
+                if len(pending) >= chunk_size:
+                    Notification.objects.bulk_create(pending)
+                    created += len(pending)
+                    pending = []
+        if pending:
+            Notification.objects.bulk_create(pending)
+            created += len(pending)
+    return len(changes), created
@@ -0,0 +1,184 @@
+"""
+Token-bucket rate limiting for write endpoints.
+
+    @login_required
+    @rate_limit('10/m')
+    def make_offer(request, item_id):
+        ...
+
+Each (endpoint, user) pair gets a bucket of N tokens that refills at N per
+period. Anonymous requests are keyed by client IP. Every limited request
+(POST by default) takes a token. When the bucket is empty the view is not
+called, and the client gets 429 Too Many Requests with a Retry-After header.
+
+Buckets live in Redis when REDIS_URL is set, updated atomically by a Lua
+script so every worker shares them. Otherwise they live in process memory,
+and so they do for RATE_LIMIT_REDIS_BACKOFF seconds after Redis fails: a
+request does not wait on an unreachable server again until then, and never
+for longer than RATE_LIMIT_REDIS_TIMEOUT. Settings:
+
+    RATE_LIMITS = {'make_offer': '20/m', 'deposit': None}   # per-endpoint override / disable
+    RATE_LIMIT_REDIS_TIMEOUT = 0.25  # seconds to connect or get an answer
+    RATE_LIMIT_REDIS_BACKOFF = 30    # seconds on per-process buckets after a failure
+"""
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from django.conf import settings
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+TOKEN_BUCKET_LUA = """
+local capacity = tonumber(ARGV[1])
+local refill_per_second = tonumber(ARGV[2])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1]) or capacity
+local updated = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + (now - updated) * refill_per_second)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / refill_per_second
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_per_second) + 1)
+return tostring(wait)
+"""
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 10 / 60): bucket capacity and tokens refilled per second."""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    if count <= 0 or period not in PERIODS:
+        raise ValueError(f"Invalid rate {rate!r}; expected e.g. '10/m' (periods: s, m, h, d)")
+    return count, count / PERIODS[period]
+
+
+class MemoryBucketStore:
+    """
+    Per-process buckets; the fallback when Redis is not configured or
+    unreachable. At most MAX_BUCKETS are kept. When the store is full it is
+    cut down to EVICT_TO of that in one pass, so a flood of new keys pays for
+    an eviction once every few thousand requests: refilled buckets go first,
+    then the least recently used, which only makes their clients' next
+    request start from a full bucket.
+    """
+    MAX_BUCKETS = 10_000
+    EVICT_TO = 0.9
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        self.buckets = OrderedDict()  # least recently used first
+
+    def consume(self, key, capacity, refill_per_second, now=None):
+        """Take one token. Returns 0 if allowed, otherwise seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            tokens, updated, _ = self.buckets.pop(key, (capacity, now, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) / refill_per_second
+            if len(self.buckets) >= self.MAX_BUCKETS:
+                self.evict(now)
+            full_at = now + (capacity - tokens) / refill_per_second
+            self.buckets[key] = (tokens, now, full_at)
+        return wait
+
+    def evict(self, now):
+        # A bucket that has refilled completely is the same as no bucket at all
+        self.buckets = OrderedDict((key, state) for key, state in self.buckets.items() if state[2] > now)
+        target = int(self.MAX_BUCKETS * self.EVICT_TO)
+        while len(self.buckets) >= target:
+            self.buckets.popitem(last=False)
+
+
+class RedisBucketStore:
+
+    def __init__(self, url):
+        import redis
+
+        timeout = getattr(settings, 'RATE_LIMIT_REDIS_TIMEOUT', 0.25)
+        self.client = redis.Redis.from_url(url, socket_connect_timeout=timeout, socket_timeout=timeout)
+        self.script = self.client.register_script(TOKEN_BUCKET_LUA)
+
+    def consume(self, key, capacity, refill_per_second, now=None):
+        return float(self.script(keys=[key], args=[capacity, refill_per_second]))
+
+
+_memory_store = MemoryBucketStore()
+_redis_store = None
+_redis_down_until = 0  # time.monotonic() before which Redis is not tried again
+
+
+def consume(key, capacity, refill_per_second):
+    global _redis_store, _redis_down_until
+    redis_url = getattr(settings, 'REDIS_URL', None)
+    if redis_url and time.monotonic() >= _redis_down_until:
+        try:
+            if _redis_store is None:
+                _redis_store = RedisBucketStore(redis_url)
+            return _redis_store.consume(key, capacity, refill_per_second)
+        except Exception:
+            backoff = getattr(settings, 'RATE_LIMIT_REDIS_BACKOFF', 30)
+            _redis_down_until = time.monotonic() + backoff
+            logger.warning("Rate limit store unavailable; using per-process buckets for %ss", backoff, exc_info=True)
+    return _memory_store.consume(key, capacity, refill_per_second)
+
+
+def client_ip(request):
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def too_many_requests(retry_after):
+    seconds = max(1, math.ceil(retry_after))
+    response = HttpResponse(f"Too many requests. Please try again in {seconds} seconds.",
+                            status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(seconds)
+    return response
+
+
+def rate_limit(rate, key='user', methods=('POST',), scope=None):
+    """
+    Limit a view to `rate` ('N/s', 'N/m', 'N/h' or 'N/d') per user and endpoint.
+    key='ip' limits per client address instead. RATE_LIMITS[scope] overrides
+    the rate, and None disables the limit. The scope defaults to the view name.
+    """
+    parse_rate(rate)  # fail at import time on a typo
+
+    def decorator(view_func):
+        name = scope or view_func.__name__
+
+        @wraps(view_func)
+        def _wrapped_view(request, *args, **kwargs):
+            if request.method in methods:
+                configured = getattr(settings, 'RATE_LIMITS', {}).get(name, rate)
+                if configured:
+                    capacity, refill_per_second = parse_rate(configured)
+                    user = getattr(request, 'user', None)
+                    if key == 'user' and user is not None and user.is_authenticated:
+                        ident = f"user:{user.pk}"
+                    else:
+                        ident = f"ip:{client_ip(request)}"
+                    wait = consume(f"ratelimit:{name}:{ident}", capacity, refill_per_second)
+                    if wait:
+                        return too_many_requests(wait)
+            return view_func(request, *args, **kwargs)
+        return _wrapped_view
+    return decorator
@@ -0,0 +1,106 @@
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+# Set while a @read_from_replica view is running and the user is not pinned to the primary
+_use_replica = ContextVar('use_replica', default=False)
+# Set as soon as the current request writes anything, so the middleware can pin the user
+_has_written = ContextVar('has_written', default=False)
+
+PIN_COOKIE_NAME = 'primary_pin'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Cold-storage models (marketplace.archive); they live in ARCHIVE_DATABASE when one is configured
+ARCHIVE_MODELS = {'archiveditem', 'archivedtransaction', 'archivedmessage'}
+
+
+def replica_aliases():
+    return list(getattr(settings, 'REPLICA_DATABASES', []))
+
+
+def archive_alias():
+    return getattr(settings, 'ARCHIVE_DATABASE', None)
+
+
+def _archive_db_for(model):
+    if model._meta.app_label == 'marketplace' and model._meta.model_name in ARCHIVE_MODELS:
+        return archive_alias()
+    return None
+
+
+def is_pinned_to_primary(request):
+    """True while the user is inside the read-your-writes window after their own write."""
+    try:
+        pinned_until = float(request.COOKIES.get(PIN_COOKIE_NAME, 0))
+    except ValueError:
+        return False
+    return pinned_until > time.time()
+
+
+@contextmanager
+def writes_without_pinning():
+    """
+    Writes made inside this block (view-counter flushes, rollups) are not the
+    user's own data, so they do not start a read-your-writes window.
+    """
+    written = _has_written.get()
+    try:
+        yield
+    finally:
+        _has_written.set(written)
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads from replica-safe views to a random replica; everything else,
+    including every write, goes to the primary (`default`). Archive models go
+    to ARCHIVE_DATABASE when it is set.
+    """
+
+    def db_for_read(self, model, **hints):
+        archive = _archive_db_for(model)
+        if archive:
+            return archive
+        replicas = replica_aliases()
+        if replicas and _use_replica.get():
+            return random.choice(replicas)
+        return None
+
+    def db_for_write(self, model, **hints):
+        archive = _archive_db_for(model)
+        if archive:
+            # Archiving is a batch job, not the user's own write: no read-your-writes pin
+            return archive
+        _has_written.set(True)
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Primary and replicas hold the same data; archive rows only reference ids
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        archive = archive_alias()
+        if not archive:
+            return None
+        is_archive_model = app_label == 'marketplace' and model_name in ARCHIVE_MODELS
+        if db == archive:
+            return is_archive_model
+        return False if is_archive_model else None
+
+
+def read_from_replica(view_func):
+    """Route the view's reads to a replica unless the user has just written something."""
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        if request.method not in SAFE_METHODS or is_pinned_to_primary(request):
+            return view_func(request, *args, **kwargs)
+        token = _use_replica.set(True)
+        try:
+            return view_func(request, *args, **kwargs)
+        finally:
+            _use_replica.reset(token)
+    return _wrapped_view
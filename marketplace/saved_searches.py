@@ -0,0 +1,108 @@
+"""
+Saved searches: a buyer keeps a home query (?q= and one ?category=) and is
+notified when a new listing matches it.
+
+A saved search matches an item as home would show it for the same query: the
+query is a case-insensitive substring of the name or the description, and the
+category, if any, is equal. New listings are matched in the background
+(tasks.match_saved_searches, queued from signals.py), so add_item only pays
+for queueing the task.
+
+Running every saved query against each new listing would cost one pass over
+all saved searches per listing. Instead each SavedSearch carries one index
+`term`:
+- for a query, one of its trigrams. A substring of a text contains only
+  trigrams of that text, so a search can only match a listing whose trigrams
+  include its term. It is the query's trigram made of the least common
+  characters (TERM_RARITY), which keeps each term's posting list short;
+- for a query under three characters, the query itself, against all the
+  listing's one- and two-character substrings;
+- for a category without a query, 'category:<name>'.
+
+Matching a listing is then one `term IN (...)` lookup on the indexed column,
+with the listing's terms as the parameters. Only the candidates it returns
+are checked against the full query.
+"""
+from django.db import connection
+
+from .models import Notification, SavedSearch
+
+TRIGRAM = 3
+# English letters from most to least frequent; anything else (digits, accents) counts as rarer still
+TERM_RARITY = {char: rank for rank, char in enumerate(' etaoinshrdlcumwfgypbvkjxqz')}
+# Notifications are inserted this many rows at a time
+MATCH_CHUNK_SIZE = 1000
+
+
+def normalize(text):
+    return (text or '').lower()
+
+
+def _grams(text, size):
+    return {text[n:n + size] for n in range(len(text) - size + 1)}
+
+
+def _rarity(gram):
+    return sum(TERM_RARITY.get(char, len(TERM_RARITY)) for char in gram)
+
+
+def search_term(query, category=''):
+    """The index term a saved search is filed under."""
+    query = normalize(query.strip())
+    if not query:
+        return f'category:{category}'
+    if len(query) < TRIGRAM:
+        return query
+    # Ties go to the first gram in sorted order so the term is stable
+    return max(sorted(_grams(query, TRIGRAM)), key=_rarity)
+
+
+def item_terms(item):
+    """Every term a saved search matching `item` could be filed under."""
+    terms = {f'category:{item.category}'}
+    for text in (normalize(item.name), normalize(item.description)):
+        for size in range(1, TRIGRAM + 1):
+            terms |= _grams(text, size)
+    return terms
+
+
+def matches(query, category, item):
+    """Whether home would list `item` for this query and category."""
+    if category and category != item.category:
+        return False
+    query = normalize(query)
+    return not query or query in normalize(item.name) or query in normalize(item.description)
+
+
+def candidates(item):
+    """(user id, query, category) of the saved searches filed under one of the item's terms, except the seller's."""
+    terms = sorted(item_terms(item))
+    # A long description has thousands of terms; keep each IN list within the backend's parameter limit
+    size = (connection.features.max_query_params or len(terms) + 1) - 1
+    for start in range(0, len(terms), size):
+        yield from SavedSearch.objects.filter(term__in=terms[start:start + size]) \
+            .exclude(user_id=item.seller_id).values_list('user_id', 'query', 'category') \
+            .iterator(chunk_size=MATCH_CHUNK_SIZE)
+
+
+def match_item(item):
+    """Notify every user with a saved search matching `item`, once per user; returns the number notified."""
+    users = {}
+    for user_id, query, category in candidates(item):
+        if user_id not in users and matches(query, category, item):
+            users[user_id] = SavedSearch(query=query, category=category)
+    notifications = [
+        Notification(user_id=user_id, item_id=item.pk, kind='saved_search',
+                     message=f'New listing for your saved search "{search.describe()}": {item.name}'[:255])
+        for user_id, search in users.items()
+    ]
+    Notification.objects.bulk_create(notifications, batch_size=MATCH_CHUNK_SIZE)
+    return len(notifications)
+
+
+def save_search(user, query, category=''):
+    """The user's saved search for this query, created if new; returns (search, created)."""
+    query = query.strip()
+    return SavedSearch.objects.get_or_create(
+        user=user, query=query, category=category, defaults={'term': search_term(query, category)},
+    )
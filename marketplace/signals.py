@@ -0,0 +1,55 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import analytics, live, tasks
+from .caching import invalidate_cached_user
+from .models import CustomUser, Item, Offer, Transaction, UserRating
+
+
+@receiver([post_save, post_delete], sender=CustomUser)
+def drop_cached_user(sender, instance, **kwargs):
+    """Any change to a user row must be visible on their next request."""
+    invalidate_cached_user(instance.pk)
+
+
+@receiver(post_save, sender=Offer)
+def roll_up_offer(sender, instance, created, **kwargs):
+    if created:
+        analytics.record_offer(instance)
+
+
+@receiver(post_save, sender=Transaction)
+def roll_up_sale(sender, instance, created, **kwargs):
+    previous = None if created else getattr(instance, '_loaded_status', None)
+    if instance.status == 'Sold' and previous != 'Sold':
+        analytics.record_sale(instance)
+    instance._loaded_status = instance.status
+
+
+@receiver([post_save, post_delete], sender=UserRating)
+def update_seller_rating(sender, instance, **kwargs):
+    CustomUser(pk=instance.rated_user_id).refresh_seller_rating()
+
+
+@receiver(post_save, sender=Item)
+def publish_item_change(sender, instance, created, **kwargs):
+    live.publish_item(instance, created)
+
+
+@receiver(post_save, sender=Item)
+def queue_duplicate_check(sender, instance, created, **kwargs):
+    """New or edited listings are fingerprinted in the background (marketplace.duplicates)."""
+    if created or instance.listing_changed():
+        tasks.index_item_signature.delay(instance.pk)
+
+
+@receiver(post_save, sender=Item)
+def queue_saved_search_match(sender, instance, created, **kwargs):
+    """New listings are matched against saved searches in the background (marketplace.saved_searches)."""
+    if created and instance.status == 'Available':
+        tasks.match_saved_searches.delay(instance.pk)
+
+
+@receiver(post_delete, sender=Item)
+def publish_item_removed(sender, instance, **kwargs):
+    live.publish_removed(instance)
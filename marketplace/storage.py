@@ -0,0 +1,67 @@
+"""
+Static files storage used by collectstatic outside development.
+
+Every collected file gets a content-hashed name (css/style.css ->
+css/style.3f2a9c1e0b7d.css) recorded in staticfiles.json, so templates using
+{% static %} always point at the current version and the files can be cached
+forever. Text assets also get pre-compressed .gz (and .br when the optional
+`brotli` package is installed) siblings that StaticFilesMiddleware serves to
+clients that accept them.
+"""
+import gzip
+from functools import lru_cache
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.map', '.svg', '.html', '.txt', '.json', '.xml', '.ico')
+# Not worth a second file (and a Vary header) for tiny assets
+MIN_COMPRESS_SIZE = 256
+# A compressed variant is kept only if it is at least this much smaller
+MAX_COMPRESSED_RATIO = 0.95
+
+
+@lru_cache(maxsize=None)
+def load_brotli():
+    """The optional brotli module, or None when it is not installed."""
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        brotli = load_brotli()
+        # Compress the originals as well as the hashed copies; both are served
+        for name in sorted(set(paths) | set(self.hashed_files.values())):
+            for compressed_name in self.compress(name, brotli):
+                yield name, compressed_name, True
+
+    def compress(self, name, brotli=None):
+        """Write .gz/.br variants of `name` and return their names."""
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return []
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return []
+
+        variants = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            variants['.br'] = brotli.compress(data)
+        written = []
+        for suffix, compressed in variants.items():
+            if len(compressed) > len(data) * MAX_COMPRESSED_RATIO:
+                continue
+            compressed_name = name + suffix
+            if self.exists(compressed_name):
+                self.delete(compressed_name)
+            self._save(compressed_name, ContentFile(compressed))
+            written.append(compressed_name)
+        return written
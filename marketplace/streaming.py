@@ -0,0 +1,127 @@
+"""
+Streaming HTML for long list pages.
+
+A view wraps each long list in StreamedRows and returns stream_template()
+instead of render():
+
+    return stream_template(request, "marketplace/purchase_history.html", {
+        "transactions": StreamedRows(transactions, "marketplace/partials/transaction_row.html", "transaction"),
+    })
+
+The page template prints the list with {{ transactions }} where the {% for %}
+loop used to be. The page is first rendered with a placeholder there. The
+response sends everything up to the first list straight away, then renders
+and sends the rows ROWS_PER_CHUNK at a time, then the rest of the page. The
+first byte goes out before the last row is rendered, and the whole page is
+never held in memory.
+
+Rows are rendered lazily after the view has returned. They run in a copy of
+the view's context, so reads still follow @read_from_replica.
+"""
+import contextvars
+import uuid
+
+from django.db.models import QuerySet
+from django.http import StreamingHttpResponse
+from django.middleware.csrf import get_token
+from django.template.context import make_context
+from django.template.loader import get_template, render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import SafeString
+
+ROWS_PER_CHUNK = 100
+
+
+class StreamedRows:
+    """A list rendered one row template at a time while the response streams."""
+
+    def __init__(self, rows, template_name, row_name, empty_html=''):
+        self.rows = rows
+        self.template_name = template_name
+        self.row_name = row_name
+        self.empty_html = empty_html
+        self.marker = SafeString(f'<!--stream:{uuid.uuid4().hex}-->')
+
+    def __str__(self):
+        return self.marker
+
+    def __html__(self):
+        return self.marker
+
+    def __bool__(self):
+        # Lets templates keep `{% if transactions %}` without loading every row
+        if isinstance(self.rows, QuerySet):
+            return self.rows.exists()
+        return bool(self.rows)
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def iterate(self):
+        if isinstance(self.rows, QuerySet) and self.rows._result_cache is None:
+            return self.rows.iterator(chunk_size=ROWS_PER_CHUNK)
+        return iter(self.rows)
+
+    def render(self, request, base_context):
+        """Yield the rendered rows in chunks of ROWS_PER_CHUNK."""
+        template = get_template(self.template_name).template
+        context = make_context(base_context, request)
+        # Context processors run once for the whole list, not once per row
+        with context.bind_template(template):
+            chunk = []
+            empty = True
+            for row in self.iterate():
+                empty = False
+                with context.push({self.row_name: row}):
+                    chunk.append(template.render(context))
+                if len(chunk) == ROWS_PER_CHUNK:
+                    yield ''.join(chunk)
+                    chunk = []
+            if chunk:
+                yield ''.join(chunk)
+            if empty and self.empty_html:
+                yield self.empty_html
+
+
+def _page_chunks(page, streams, request, context):
+    rest = page
+    for stream in sorted(streams, key=lambda s: page.find(s.marker)):
+        before, marker, rest = rest.partition(stream.marker)
+        yield before
+        if marker:
+            yield from stream.render(request, context)
+    yield rest
+
+
+def stream_template(request, template_name, context, status=200):
+    """Like render(), but the StreamedRows in `context` are rendered while the response is sent."""
+    # Rows may render {% csrf_token %} after CsrfViewMiddleware has processed the
+    # response, so make sure the CSRF cookie is set now.
+    get_token(request)
+    page = render_to_string(template_name, context, request)
+    streams = [value for value in context.values() if isinstance(value, StreamedRows)]
+    chunks = in_view_context(_page_chunks(page, streams, request, context))
+    return StreamingHttpResponse(chunks, status=status, content_type='text/html; charset=utf-8')
+
+
+def in_view_context(chunks):
+    """
+    Wrap a response body generator so each step runs in the context of the
+    view that created it (replica routing etc.), not the server's. Call it
+    from inside the view.
+    """
+    view_context = contextvars.copy_context()
+
+    def generate():
+        while True:
+            try:
+                yield view_context.run(next, chunks)
+            except StopIteration:
+                return
+
+    return generate()
+
+
+def empty_row(colspan, message):
+    """The {% empty %} row for a streamed table body."""
+    return format_html('<tr><td colspan="{}" class="text-center">{}</td></tr>', colspan, message)
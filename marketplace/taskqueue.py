@@ -0,0 +1,185 @@
+"""
+Lightweight background task queue.
+
+Functions decorated with @task are run later by `manage.py run_task_worker`
+instead of inside the request:
+
+    @task(max_retries=5)
+    def notify_user(user_id, message):
+        ...
+
+    notify_user.delay(user.id, "Your item sold", idempotency_key=f"sold:{item.id}", priority=5)
+
+TASK_BACKEND selects where tasks go: 'database' (the Task table, polled by the
+worker) or 'memory' (a per-process queue drained with run_pending(), for tests).
+"""
+import heapq
+import itertools
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TASK_REGISTRY = {}
+
+DEFAULT_MAX_RETRIES = 3
+# Seconds before the first retry; doubled on every further attempt
+DEFAULT_RETRY_DELAY = 10
+
+
+class TaskFunction:
+    def __init__(self, func, name, max_retries, retry_delay):
+        self.func = func
+        self.name = name
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, idempotency_key=None, priority=0, **kwargs):
+        """Queue a call. A second call with the same idempotency_key is dropped."""
+        return get_backend().enqueue(self, list(args), kwargs, priority=priority, idempotency_key=idempotency_key)
+
+
+def task(func=None, *, name=None, max_retries=DEFAULT_MAX_RETRIES, retry_delay=DEFAULT_RETRY_DELAY):
+    def register(func):
+        task_name = name or f"{func.__module__}.{func.__name__}"
+        wrapped = TaskFunction(func, task_name, max_retries, retry_delay)
+        TASK_REGISTRY[task_name] = wrapped
+        return wrapped
+    return register(func) if func is not None else register
+
+
+def retry_backoff(task_function, attempts):
+    return timedelta(seconds=task_function.retry_delay * 2 ** max(attempts - 1, 0))
+
+
+class DatabaseBackend:
+    """Tasks live in the Task table; workers claim them with a conditional UPDATE."""
+
+    def enqueue(self, task_function, args, kwargs, priority=0, idempotency_key=None):
+        from .models import Task
+
+        fields = dict(name=task_function.name, args=args, kwargs=kwargs,
+                      priority=priority, max_retries=task_function.max_retries)
+        if idempotency_key is None:
+            return Task.objects.create(**fields)
+        try:
+            with transaction.atomic():
+                return Task.objects.create(idempotency_key=idempotency_key, **fields)
+        except IntegrityError:
+            return Task.objects.get(idempotency_key=idempotency_key)
+
+    def requeue_stale(self, timeout):
+        """Put back tasks whose worker died mid-run (locked for longer than `timeout` seconds)."""
+        from .models import Task
+
+        cutoff = timezone.now() - timedelta(seconds=timeout)
+        return Task.objects.filter(status='running', locked_at__lt=cutoff).update(status='queued', locked_at=None)
+
+    def claim(self, limit):
+        """Atomically mark up to `limit` ready tasks as running and return them, highest priority first."""
+        from .models import Task
+
+        now = timezone.now()
+        candidates = list(
+            Task.objects.filter(status='queued', run_after__lte=now)
+            .order_by('-priority', 'run_after')
+            .values_list('id', flat=True)[:limit * 2]
+        )
+        claimed = []
+        for task_id in candidates:
+            if len(claimed) == limit:
+                break
+            # Only one worker can win this UPDATE, so no row locks are needed
+            won = Task.objects.filter(id=task_id, status='queued').update(
+                status='running', locked_at=now, attempts=F('attempts') + 1,
+            )
+            if won:
+                claimed.append(Task.objects.get(id=task_id))
+        return claimed
+
+    def run(self, task_row):
+        task_function = TASK_REGISTRY.get(task_row.name)
+        try:
+            if task_function is None:
+                raise LookupError(f"Unknown task {task_row.name!r}")
+            task_function(*task_row.args, **task_row.kwargs)
+        except Exception:
+            error = traceback.format_exc()
+            logger.exception("Task %s (%s) failed", task_row.id, task_row.name)
+            if task_function is not None and task_row.attempts <= task_row.max_retries:
+                task_row.status = 'queued'
+                task_row.run_after = timezone.now() + retry_backoff(task_function, task_row.attempts)
+            else:
+                task_row.status = 'failed'
+                task_row.finished_at = timezone.now()
+            task_row.last_error = error
+            task_row.locked_at = None
+            task_row.save(update_fields=['status', 'run_after', 'last_error', 'locked_at', 'finished_at'])
+            return False
+
+        task_row.status = 'done'
+        task_row.finished_at = timezone.now()
+        task_row.locked_at = None
+        task_row.save(update_fields=['status', 'finished_at', 'locked_at'])
+        return True
+
+
+class InMemoryBackend:
+    """Per-process priority queue for tests. Nothing runs until run_pending() is called."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.queue = []
+        self.seen_keys = set()
+        self.failed = []
+        self.counter = itertools.count()
+
+    def enqueue(self, task_function, args, kwargs, priority=0, idempotency_key=None):
+        if idempotency_key is not None:
+            if idempotency_key in self.seen_keys:
+                return None
+            self.seen_keys.add(idempotency_key)
+        entry = {'name': task_function.name, 'args': args, 'kwargs': kwargs, 'attempts': 0}
+        heapq.heappush(self.queue, (-priority, next(self.counter), entry))
+        return entry
+
+    def __len__(self):
+        return len(self.queue)
+
+    def run_pending(self):
+        """Run everything queued (including tasks queued by tasks), retrying failures immediately."""
+        ran = 0
+        while self.queue:
+            priority, _, entry = heapq.heappop(self.queue)
+            task_function = TASK_REGISTRY[entry['name']]
+            entry['attempts'] += 1
+            try:
+                task_function(*entry['args'], **entry['kwargs'])
+            except Exception:
+                if entry['attempts'] <= task_function.max_retries:
+                    heapq.heappush(self.queue, (priority, next(self.counter), entry))
+                else:
+                    self.failed.append(entry)
+            ran += 1
+        return ran
+
+
+_backends = {}
+
+
+def get_backend():
+    name = getattr(settings, 'TASK_BACKEND', 'database')
+    if name not in _backends:
+        _backends[name] = {'database': DatabaseBackend, 'memory': InMemoryBackend}[name]()
+    return _backends[name]
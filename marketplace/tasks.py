@@ -0,0 +1,71 @@
+"""Side effects that views hand off to the background worker (see taskqueue.py)."""
+from django.urls import reverse
+
+from . import exports, saved_searches
+from .models import Cart, Item, Notification, Offer
+from .moderation import auto_hide_if_reported
+from .notifications import fan_out_item_changes
+from .taskqueue import task
+from .trending import refresh_trending as refresh_trending_table
+
+
+@task
+def notify_user(user_id, message, kind='info', item_id=None):
+    Notification.objects.create(user_id=user_id, item_id=item_id, kind=kind, message=message[:255])
+
+
+@task
+def notify_wishlist_watchers():
+    while fan_out_item_changes()[0]:
+        pass
+
+
+@task
+def remove_item_from_carts(item_id):
+    """A sold item can no longer be bought, so drop it from everyone's cart."""
+    Cart.objects.filter(item_id=item_id).delete()
+
+
+@task
+def reject_competing_offers(item_id, accepted_offer_id):
+    Offer.objects.filter(item_id=item_id, status='Pending').exclude(id=accepted_offer_id).update(status='Rejected')
+
+
+@task
+def check_report_threshold(item_id):
+    if auto_hide_if_reported(item_id):
+        notify_wishlist_watchers.delay()
+
+
+@task
+def index_item_signature(item_id):
+    """Fingerprint a saved listing and act on it if it re-posts one of the seller's live listings."""
+    from . import duplicates  # numpy; only task workers need it, so web workers don't import it at startup
+
+    item = Item.objects.filter(pk=item_id).first()
+    if item is not None and duplicates.check_item(item) is not None:
+        notify_wishlist_watchers.delay()  # in case the re-post was hidden
+
+
+@task
+def match_saved_searches(item_id):
+    """Tell buyers whose saved searches a new listing matches."""
+    item = Item.objects.filter(pk=item_id, status='Available').first()
+    if item is not None:
+        saved_searches.match_item(item)
+
+
+@task
+def refresh_trending():
+    refresh_trending_table()
+
+
+@task(max_retries=1)
+def export_csv(model_label, query, fields, user_id):
+    """Write an admin result set to a CSV file and tell the staff member where to download it."""
+    queryset = exports.load_queryset(model_label, query)
+    name, count = exports.save_export(queryset, fields)
+    opts = queryset.model._meta
+    noun = opts.verbose_name if count == 1 else opts.verbose_name_plural
+    notify_user(user_id, f"Your export of {count} {noun} is ready: {reverse('download_export', args=[name])}",
+                kind='export')
@@ -1,3 +1,1775 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import math
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+import zlib
+from unittest import mock
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.core import signing
+from django.core.exceptions import ValidationError
+from django.contrib.sessions.models import Session
+from django.contrib.staticfiles import finders
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.http import HttpResponse, QueryDict
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.utils import timezone
+
+from . import analytics, archive, duplicates, exports, facets, geo, live, notifications, saved_searches, transitions
+from .admin import EstimatedCountPaginator
+from .backends import CachedModelBackend
+from .caching import user_cache_key
+from . import ratelimit, streaming, trending, viewcounts
+from .middleware import CompressionMiddleware, ReadYourWritesMiddleware, StaticFilesMiddleware
+from .models import (
+    CustomUser, Item, Transaction, Offer, Cart, Wishlist, Message, Report, ItemChangeLog, Notification, Task,
+    UserRating, Review, ArchivedItem, ArchivedMessage, ArchivedTransaction,
+    SellerDailyStats, TrendingItem, TransactionEvent, ItemSignature, SignatureBucket, SavedSearch,
+)
+from .moderation import apply_action
+from .notifications import fan_out_item_changes
+from .storage import CompressedManifestStaticFilesStorage
+from .taskqueue import DatabaseBackend, get_backend, task
+from .routers import PIN_COOKIE_NAME, PrimaryReplicaRouter, read_from_replica
+
+
+def make_user(username, student_id):
+    """Create a user with a valid university email (CustomUser.save enforces the format)."""
+    return CustomUser.objects.create_user(
+        username=username,
+        email=f"{student_id}@student.gla.ac.uk",
+        password="testpass123",
+    )
+
+
+def make_item(seller, name="Desk lamp", price="10.00", **kwargs):
+    return Item.objects.create(
+        name=name,
+        description=kwargs.pop("description", "A very useful item"),
+        category=kwargs.pop("category", "Others"),
+        price=Decimal(price),
+        seller=seller,
+        **kwargs
+    )
+
+
+# With DB_REPLICAS set, catalogue views read from a replica, and a replica's
+# connection cannot see the rows a TestCase writes inside its transaction. Tests
+# of what those pages show read from the primary; ReplicaDatabaseTests covers
+# the routing.
+reads_from_primary = override_settings(REPLICA_DATABASES=[])
+
+class HotQueryIndexTests(TestCase):
+    """Every hot-path filter must be answered from an index, never a full table scan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.buyer = make_user("buyer", "1234567A")
+        cls.seller = make_user("seller", "7654321B")
+        cls.item = make_item(cls.seller)
+
+    def assertUsesIndex(self, queryset, index_name=None):
+        if connection.vendor != 'sqlite':
+            self.skipTest("EXPLAIN QUERY PLAN assertions are SQLite specific")
+        plan = queryset.explain()
+        table = queryset.model._meta.db_table
+        self.assertIn("INDEX", plan, plan)
+        self.assertNotRegex(plan, rf"SCAN {table}(?! USING)", plan)
+        if index_name:
+            self.assertIn(index_name, plan, plan)
+
+    def test_unread_messages(self):
+        self.assertUsesIndex(Message.objects.filter(receiver=self.buyer, is_read=False), 'msg_unread_idx')
+
+    def test_message_thread(self):
+        qs = Message.objects.filter(
+            Q(sender=self.buyer, receiver=self.seller) | Q(sender=self.seller, receiver=self.buyer)
+        ).order_by('timestamp')
+        self.assertUsesIndex(qs, 'msg_thread_idx')
+
+    def test_faceted_listing(self):
+        qs = Item.objects.filter(status='Available', category__in=['Books'], price__gte=10, price__lt=25)
+        self.assertUsesIndex(qs, 'item_status_category_price_idx')
+
+    def test_purchase_history(self):
+        qs = Transaction.objects.filter(buyer=self.buyer).order_by('-date_initiated')
+        self.assertUsesIndex(qs, 'txn_buyer_date_idx')
+
+    def test_offers_for_item(self):
+        self.assertUsesIndex(Offer.objects.filter(item=self.item, status='Pending'), 'offer_item_status_idx')
+
+    def test_cart_and_wishlist_lookup(self):
+        self.assertUsesIndex(Cart.objects.filter(user=self.buyer, item=self.item))
+        self.assertUsesIndex(Wishlist.objects.filter(user=self.buyer, item=self.item))
+
+    def test_reports_by_status(self):
+        self.assertUsesIndex(Report.objects.filter(status='Pending'), 'report_status_idx')
+
+
+class UniqueConstraintTests(TestCase):
+
+    def setUp(self):
+        self.buyer = make_user("buyer", "1234567A")
+        self.item = make_item(make_user("seller", "7654321B"))
+
+    def test_get_or_create_does_not_duplicate(self):
+        for _ in range(3):
+            Cart.objects.get_or_create(user=self.buyer, item=self.item)
+            Wishlist.objects.get_or_create(user=self.buyer, item=self.item)
+        self.assertEqual(Cart.objects.count(), 1)
+        self.assertEqual(Wishlist.objects.count(), 1)
+
+
+@override_settings(REPLICA_DATABASES=['replica1'])
+class ReplicaRoutingTests(TestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.router = PrimaryReplicaRouter()
+
+    def route_inside_view(self, request):
+        @read_from_replica
+        def view(request):
+            return HttpResponse(self.router.db_for_read(Item) or 'default')
+        return view(request).content.decode()
+
+    def test_reads_outside_replica_views_use_primary(self):
+        self.assertIsNone(self.router.db_for_read(Item))
+        self.assertEqual(self.router.db_for_write(Item), 'default')
+
+    def test_replica_view_reads_from_replica(self):
+        self.assertEqual(self.route_inside_view(self.factory.get('/')), 'replica1')
+
+    def test_unsafe_methods_and_pinned_users_use_primary(self):
+        self.assertEqual(self.route_inside_view(self.factory.post('/')), 'default')
+        request = self.factory.get('/')
+        request.COOKIES[PIN_COOKIE_NAME] = str(time.time() + 60)
+        self.assertEqual(self.route_inside_view(request), 'default')
+        request.COOKIES[PIN_COOKIE_NAME] = str(time.time() - 1)
+        self.assertEqual(self.route_inside_view(request), 'replica1')
+
+    def test_middleware_pins_user_after_write(self):
+        def writing_view(request):
+            make_user("writer", "1111111C")
+            return HttpResponse()
+
+        response = ReadYourWritesMiddleware(writing_view)(self.factory.post('/'))
+        self.assertIn(PIN_COOKIE_NAME, response.cookies)
+        response = ReadYourWritesMiddleware(lambda request: HttpResponse())(self.factory.get('/'))
+        self.assertNotIn(PIN_COOKIE_NAME, response.cookies)
+
+
+@unittest.skipUnless('lagging_replica' in settings.DATABASES, "run with DB_REPLICAS=<file> to exercise a real replica")
+@override_settings(REPLICA_DATABASES=['lagging_replica'])
+class ReplicaDatabaseTests(TestCase):
+    """With DB_REPLICAS set, the test runner builds a second SQLite database that is never written to."""
+    databases = {'default'} | ({'lagging_replica'} & settings.DATABASES.keys())
+
+    def test_catalogue_reads_hit_replica_until_user_writes(self):
+        item = make_item(make_user("seller", "7654321B"), name="Primary only lamp")
+
+        self.assertNotContains(self.client.get(reverse('home')), item.name)
+        self.assertEqual(self.client.get(reverse('item_detail', args=[item.id])).status_code, 404)
+
+        self.client.cookies[PIN_COOKIE_NAME] = str(time.time() + 60)
+        self.assertContains(self.client.get(reverse('home')), item.name)
+
+
+@reads_from_primary
+@override_settings(USER_CACHE=True)  # one process here, so its memory cache counts as shared
+class CachedUserBackendTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user("buyer", "1234567A")
+        self.backend = CachedModelBackend()
+
+    def test_user_is_served_from_cache(self):
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(0):
+            user = self.backend.get_user(self.user.pk)
+        self.assertEqual(user.username, "buyer")
+        self.assertEqual(user.get_deferred_fields(), {'bio', 'address'})
+
+    def test_saving_user_invalidates_cache(self):
+        self.backend.get_user(self.user.pk)
+        self.user.balance = Decimal("25.00")
+        self.user.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).balance, Decimal("25.00"))
+
+    def test_logged_in_request_does_not_query_user(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse('home'))
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(reverse('home'))
+        tables = " ".join(query['sql'] for query in ctx.captured_queries)
+        self.assertNotIn("django_session", tables)
+        # The rating facet joins sellers; what must not happen is loading the session's user
+        self.assertNotIn('FROM "marketplace_customuser"', tables)
+
+    @override_settings(USER_CACHE=False)
+    def test_per_process_cache_is_not_used(self):
+        self.backend.get_user(self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.backend.get_user(self.user.pk).username, "buyer")
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+
+
+class ClearExpiredSessionsTests(TestCase):
+
+    def test_only_expired_sessions_are_deleted(self):
+        now = timezone.now()
+        for n in range(5):
+            Session.objects.create(session_key=f"old{n}", session_data="", expire_date=now - timedelta(days=1))
+        Session.objects.create(session_key="live", session_data="", expire_date=now + timedelta(days=1))
+        call_command('clear_expired_sessions', batch_size=2, stdout=StringIO())
+        self.assertEqual(list(Session.objects.values_list('session_key', flat=True)), ["live"])
+
+
+class CustomUserWritePathTests(TestCase):
+
+    def setUp(self):
+        self.user = make_user("buyer", "1234567A")
+
+    def test_email_is_validated_only_when_it_changes(self):
+        # A legacy row with a non-university email can still get other updates
+        CustomUser.objects.filter(pk=self.user.pk).update(email="legacy@example.com")
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.first_name = "Ada"
+        user.save()
+        user.email = "still-wrong@example.com"
+        with self.assertRaises(ValidationError):
+            user.save()
+        with self.assertRaises(ValidationError):
+            make_user("other", "not-a-student")
+
+    def test_deposit_is_a_single_update(self):
+        with self.assertNumQueries(1):
+            self.user.deposit(Decimal("10.50"))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal("10.50"))
+
+    def test_withdraw_refuses_overdraft(self):
+        self.user.deposit(Decimal("5.00"))
+        self.assertFalse(self.user.withdraw(Decimal("7.00")))
+        self.assertTrue(self.user.withdraw(Decimal("5.00")))
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.balance, Decimal("0.00"))
+
+    def test_update_address_is_a_single_targeted_update(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.user.update_address("Boyd Orr Building")
+        self.assertEqual(len(ctx.captured_queries), 1)
+        self.assertNotIn('"email"', ctx.captured_queries[0]['sql'])
+
+
+class WishlistTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user("seller", "7654321B")
+        self.item = make_item(self.seller, price="40.00")
+        self.watchers = [make_user(f"watcher{n}", f"100000{n}W") for n in range(3)]
+        for watcher in self.watchers:
+            Wishlist.objects.create(user=watcher, item=self.item)
+
+    @override_settings(USER_CACHE=True)  # the request user comes from the shared cache, as in production
+    def test_wishlist_page_is_paginated_and_uses_constant_queries(self):
+        buyer = self.watchers[0]
+        for n in range(25):
+            Wishlist.objects.create(user=buyer, item=make_item(self.seller, name=f"Book {n}"))
+        self.client.force_login(buyer)
+        self.client.get(reverse('wishlist'))
+        with self.assertNumQueries(3):  # count, page of items with sellers, notifications
+            response = self.client.get(reverse('wishlist'), {'page': 2})
+        self.assertEqual(len(response.context['wishlist_items']), 6)
+
+    def test_add_and_remove(self):
+        buyer = make_user("buyer", "1234567A")
+        self.client.force_login(buyer)
+        self.client.get(reverse('add_to_wishlist', args=[self.item.id]))
+        entry = Wishlist.objects.get(user=buyer)
+        self.client.get(reverse('remove_from_wishlist', args=[entry.id]))
+        self.assertFalse(Wishlist.objects.filter(user=buyer).exists())
+
+    def test_price_drop_and_sale_are_logged_not_fanned_out_inline(self):
+        self.item.price = Decimal("30.00")
+        with self.assertNumQueries(2):  # UPDATE item + one INSERT into the change log
+            self.item.save()
+        self.item.price = Decimal("35.00")
+        self.item.save()
+        self.item.status = 'Sold'
+        self.item.save()
+        self.assertEqual(list(ItemChangeLog.objects.values_list('kind', flat=True)), ['price_drop', 'sold'])
+        self.assertFalse(Notification.objects.exists())
+
+    def test_fan_out_notifies_every_watcher_in_bulk(self):
+        self.item.price = Decimal("30.00")
+        self.item.save()
+        with self.assertNumQueries(7):  # pending ids, claim, changes, watchers, one bulk insert + savepoint pair
+            changes, created = fan_out_item_changes(chunk_size=1000)
+        self.assertEqual((changes, created), (1, 3))
+        self.assertEqual(fan_out_item_changes(), (0, 0))
+        self.assertEqual(
+            set(Notification.objects.values_list('user_id', flat=True)),
+            {watcher.id for watcher in self.watchers},
+        )
+
+    def test_changes_claimed_by_another_drain_are_not_fanned_out_again(self):
+        self.item.price = Decimal("30.00")
+        self.item.save()
+        # A second drain read the same pending ids before the first claimed them
+        stale_ids = notifications._pending_change_ids(500)
+        self.assertEqual(fan_out_item_changes(), (1, 3))
+        with mock.patch.object(notifications, '_pending_change_ids', return_value=stale_ids):
+            self.assertEqual(fan_out_item_changes(), (0, 0))
+        self.assertEqual(Notification.objects.count(), 3)
+
+
+TASK_CALLS = []
+
+
+@task(name='tests.record', retry_delay=0)
+def record_call(value):
+    TASK_CALLS.append(value)
+
+
+@task(name='tests.always_fails', max_retries=1, retry_delay=0)
+def always_fails():
+    raise RuntimeError("boom")
+
+
+class DatabaseTaskQueueTests(TestCase):
+
+    def setUp(self):
+        TASK_CALLS.clear()
+        self.backend = DatabaseBackend()
+
+    def test_idempotency_key_deduplicates(self):
+        first = record_call.delay("a", idempotency_key="once")
+        second = record_call.delay("b", idempotency_key="once")
+        self.assertEqual(first.pk, second.pk)
+        self.assertEqual(Task.objects.count(), 1)
+
+    def test_claim_respects_priority_and_is_exclusive(self):
+        low = record_call.delay("low")
+        high = record_call.delay("high", priority=10)
+        self.assertEqual([t.pk for t in self.backend.claim(2)], [high.pk, low.pk])
+        self.assertEqual(self.backend.claim(2), [])
+
+    def test_failures_are_retried_then_marked_failed(self):
+        always_fails.delay()
+        for _ in range(2):
+            [task_row] = self.backend.claim(1)
+            with self.assertLogs('marketplace.taskqueue', 'ERROR'):
+                self.assertFalse(self.backend.run(task_row))
+        task_row = Task.objects.get()
+        self.assertEqual((task_row.status, task_row.attempts), ('failed', 2))
+        self.assertIn("boom", task_row.last_error)
+
+
+
+class TaskWorkerTests(TransactionTestCase):
+    """The worker runs tasks on other threads, which only see committed rows."""
+
+    def test_worker_command_drains_queue(self):
+        TASK_CALLS.clear()
+        for n in range(5):
+            record_call.delay(n)
+        call_command('run_task_worker', '--once', '--threads', '2', stdout=StringIO())
+        self.assertEqual(sorted(TASK_CALLS), [0, 1, 2, 3, 4])
+        self.assertEqual(Task.objects.filter(status='done').count(), 5)
+
+
+@override_settings(TASK_BACKEND='memory')
+class PurchaseSideEffectTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user("seller", "7654321B")
+        self.buyer = make_user("buyer", "1234567A")
+        self.buyer.deposit(Decimal("100.00"))
+        self.item = make_item(self.seller, price="40.00")
+        get_backend().clear()  # the new listing's duplicate check
+
+    def test_purchase_defers_side_effects(self):
+        other = make_user("other", "2222222C")
+        Cart.objects.create(user=other, item=self.item)
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('process_purchase', args=[self.item.id]), {'address': 'Library'})
+
+        self.assertEqual(len(get_backend()), 3)
+        self.assertFalse(Notification.objects.exists())
+        get_backend().run_pending()
+        self.assertTrue(Notification.objects.filter(user=self.seller, kind='sold').exists())
+        self.assertFalse(Cart.objects.filter(item=self.item).exists())
+
+
+@reads_from_primary
+@override_settings(TASK_BACKEND='memory', REPORT_AUTO_HIDE_THRESHOLD=3)
+class ModerationTests(TestCase):
+
+    def setUp(self):
+        get_backend().clear()
+        self.seller = make_user("seller", "7654321B")
+        self.reporters = [make_user(f"reporter{n}", f"300000{n}R") for n in range(4)]
+        self.staff = make_user("moderator", "9999999M")
+        CustomUser.objects.filter(pk=self.staff.pk).update(is_staff=True)
+
+    def report(self, item, reporters):
+        Report.objects.bulk_create([Report(reported_item=item, reported_by=r, reason="Counterfeit") for r in reporters])
+
+    def test_report_item_view_auto_hides_at_threshold(self):
+        item = make_item(self.seller)
+        for reporter in self.reporters[:3]:
+            self.client.force_login(reporter)
+            self.client.post(reverse('report_item', args=[item.id]), {'reason': 'Counterfeit goods'})
+        self.assertEqual(Report.objects.filter(reported_item=item).count(), 3)
+        get_backend().run_pending()
+        item.refresh_from_db()
+        self.assertEqual(item.status, 'Hidden')
+
+    @override_settings(USER_CACHE=True)  # the request user comes from the shared cache, as in production
+    def test_queue_is_grouped_and_query_count_is_constant(self):
+        for n in range(1, 4):
+            self.report(make_item(self.seller, name=f"Item {n}"), self.reporters[:n])
+        self.client.force_login(self.staff)
+        self.client.get(reverse('moderation_queue'))
+        with self.assertNumQueries(3):  # page count, grouped page, items with sellers
+            response = self.client.get(reverse('moderation_queue'))
+        counts = [row['report_count'] for row in response.context['rows']]
+        self.assertEqual(counts, [3, 2, 1])
+
+    def test_bulk_actions(self):
+        keep, remove = make_item(self.seller, name="Fine"), make_item(self.seller, name="Bad")
+        self.report(keep, self.reporters)
+        self.report(remove, self.reporters)
+        Item.objects.filter(id=keep.id).update(status='Hidden')
+        self.client.force_login(self.staff)
+        self.client.post(reverse('moderation_queue'), {'action': 'dismiss', 'item_ids': [keep.id]})
+        self.client.post(reverse('moderation_queue'), {'action': 'hide', 'item_ids': [remove.id]})
+        self.assertEqual(Item.objects.get(id=keep.id).status, 'Available')
+        self.assertEqual(Item.objects.get(id=remove.id).status, 'Hidden')
+        self.assertFalse(Report.objects.filter(status='Pending').exists())
+
+    def test_hides_and_relists_reach_wishlist_watchers(self):
+        item = make_item(self.seller, name="Watched")
+        watcher = self.reporters[0]
+        Wishlist.objects.create(user=watcher, item=item)
+        apply_action([item.id], 'hide')
+        apply_action([item.id], 'hide')  # already hidden: nothing more to log
+        apply_action([item.id], 'dismiss')  # no open reports: a moderator hid it, it stays hidden
+        self.report(item, self.reporters[1:])
+        apply_action([item.id], 'dismiss')
+        self.assertEqual(list(item.change_log.order_by('id').values_list('kind', flat=True)), ['hidden', 'relisted'])
+        fan_out_item_changes()
+        self.assertEqual(Notification.objects.filter(user=watcher, item=item).count(), 2)
+
+    def test_dismissing_reports_leaves_hidden_duplicates_hidden(self):
+        reported, repost = make_item(self.seller, name="Lamp"), make_item(self.seller, name="Lamp again")
+        ItemSignature.objects.create(item=repost, duplicate_of=reported, similarity=0.95)
+        for item in (reported, repost):
+            self.report(item, self.reporters)
+        Item.objects.filter(id__in=[reported.id, repost.id]).update(status='Hidden')
+        self.assertEqual(apply_action([reported.id, repost.id], 'dismiss'), 8)
+        self.assertEqual(Item.objects.get(id=reported.id).status, 'Available')
+        self.assertEqual(Item.objects.get(id=repost.id).status, 'Hidden')
+        self.assertFalse(Report.objects.filter(status='Pending').exists())
+
+    def test_hidden_items_are_only_shown_to_seller_and_staff(self):
+        item = make_item(self.seller, name="Hidden lamp")
+        Item.objects.filter(id=item.id).update(status='Hidden')
+        buyer = self.reporters[0]
+        self.client.force_login(buyer)
+        for name in ('item_detail', 'make_offer', 'add_to_cart', 'confirm_purchase'):
+            self.assertEqual(self.client.get(reverse(name, args=[item.id])).status_code, 404, name)
+        self.assertEqual(self.client.get(reverse('search_items'), {'query': 'lamp'}).json(), {'results': []})
+        buffer = viewcounts.LocalViewBuffer(flush_interval=3600, max_items=10)  # keep these views out of atexit
+        with mock.patch.object(viewcounts, '_buffer', buffer):
+            for viewer in (self.seller, self.staff):
+                self.client.force_login(viewer)
+                self.assertEqual(self.client.get(reverse('item_detail', args=[item.id])).status_code, 200)
+
+
+class SellerAnalyticsTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user("seller", "7654321B")
+        self.buyer = make_user("buyer", "1234567A")
+        self.book = make_item(self.seller, name="Textbook", category="Books", price="20.00")
+        self.lamp = make_item(self.seller, name="Lamp", category="Furniture", price="15.00")
+
+    def test_events_are_rolled_up_incrementally(self):
+        analytics.apply_view_counts({self.book.id: 4})
+        Offer.objects.create(buyer=self.buyer, item=self.book, price=Decimal("18.00"))
+        Transaction.objects.create(buyer=self.buyer, item=self.book, total_price=Decimal("20.00"), status="Sold")
+        pending = Transaction.objects.create(buyer=self.buyer, item=self.lamp, total_price=Decimal("15.00"), status="Pending")
+        self.assertFalse(SellerDailyStats.objects.filter(category="Furniture").exists())
+        pending = Transaction.objects.get(pk=pending.pk)
+        pending.status = "Sold"
+        pending.save()
+        pending.save()  # re-saving a sale must not count it twice
+
+        books = SellerDailyStats.objects.get(seller=self.seller, category="Books")
+        self.assertEqual((books.views, books.offers, books.sales, books.revenue), (4, 1, 1, Decimal("20.00")))
+        self.assertEqual(SellerDailyStats.objects.get(category="Furniture").sales, 1)
+
+    @override_settings(USER_CACHE=True)  # the request user comes from the shared cache, as in production
+    def test_dashboard_reads_only_the_rollup(self):
+        analytics.apply_view_counts({self.book.id: 10, self.lamp.id: 5})
+        Transaction.objects.create(buyer=self.buyer, item=self.book, total_price=Decimal("20.00"), status="Sold")
+        self.client.force_login(self.seller)
+        self.client.get(reverse('seller_analytics'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('seller_analytics'))
+        self.assertTrue(all("marketplace_sellerdailystats" in q['sql'] for q in ctx.captured_queries))
+        self.assertEqual(response.context['totals']['total_views'], 15)
+        self.assertEqual(response.context['by_category'][0]['conversion'], 10.0)
+
+    def test_dataframe_export_and_backfill(self):
+        Offer.objects.create(buyer=self.buyer, item=self.lamp, price=Decimal("12.00"))
+        SellerDailyStats.objects.update(offers=0)
+        call_command('rebuild_seller_stats', stdout=StringIO())
+        frame = analytics.seller_stats_frame(seller_id=self.seller.id)
+        self.assertEqual(list(frame.columns), ['seller_id', 'day', 'category', 'views', 'offers', 'sales', 'revenue'])
+        self.assertEqual(int(frame['offers'].sum()), 1)
+
+    def test_backfill_counts_archived_sales(self):
+        day = timezone.make_aware(timezone.datetime(2023, 9, 1, 12))
+        old_item = ArchivedItem.objects.create(id=10_000, seller=self.seller, name="Old bike", description="",
+                                               category="Others", price=Decimal("40.00"), status="Sold", created_at=day)
+        for pk, item_id, price in ((10_000, old_item.id, "40.00"), (10_001, self.book.id, "20.00"),
+                                   (10_002, 20_000, "5.00")):  # the last item is gone
+            ArchivedTransaction.objects.create(id=pk, buyer=self.buyer, item_id=item_id, item_name="", status='Sold',
+                                               total_price=Decimal(price), date_initiated=day)
+        out = StringIO()
+        call_command('rebuild_seller_stats', stdout=out)
+        rows = SellerDailyStats.objects.filter(seller=self.seller, day=day.date())
+        self.assertEqual(sorted(rows.values_list('category', 'sales', 'revenue')),
+                         [("Books", 1, Decimal("20.00")), ("Others", 1, Decimal("40.00"))])
+        self.assertIn("Skipped 1 archived sales", out.getvalue())
+
+
+@reads_from_primary
+class ViewCounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.item = make_item(make_user("seller", "7654321B"))
+        self.buffer = viewcounts.LocalViewBuffer(flush_interval=3600, max_items=10_000)
+        patcher = mock.patch.object(viewcounts, '_buffer', self.buffer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_views_are_buffered_and_deduplicated_per_viewer(self):
+        url = reverse('item_detail', args=[self.item.id])
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+            self.client.get(url)
+            self.client.get(url, REMOTE_ADDR='10.0.0.2')
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')])
+        self.assertEqual(self.buffer.pending(), 2)
+
+        self.assertEqual(self.buffer.flush(), 2)
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.views, 2)
+        self.assertEqual(SellerDailyStats.objects.get().views, 2)
+
+    def test_no_increments_lost_across_concurrent_flushes_and_shutdown(self):
+        per_thread, threads = 500, 8
+
+        def viewer():
+            for _ in range(per_thread):
+                self.buffer.add(self.item.id)
+
+        workers = [threading.Thread(target=viewer) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        while any(worker.is_alive() for worker in workers):
+            self.buffer.flush()
+        for worker in workers:
+            worker.join()
+        viewcounts.shutdown()  # what atexit runs when the process stops
+
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.views, per_thread * threads)
+        self.assertEqual(SellerDailyStats.objects.get().views, per_thread * threads)
+
+    def test_failed_flush_keeps_counts(self):
+        self.buffer.add(self.item.id, 5)
+        with mock.patch.object(viewcounts, 'apply_counts', side_effect=RuntimeError), \
+                self.assertLogs('marketplace.viewcounts', 'ERROR'):
+            self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.buffer.pending(), 5)
+
+    def test_saving_an_item_does_not_overwrite_flushed_views(self):
+        stale = Item.objects.get(pk=self.item.pk)
+        self.buffer.add(self.item.id, 3)
+        self.buffer.flush()
+        stale.name = "Renamed lamp"
+        stale.save()
+        self.item.refresh_from_db()
+        self.assertEqual((self.item.name, self.item.views), ("Renamed lamp", 3))
+
+
+@reads_from_primary
+class TrendingTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user("seller", "7654321B")
+        self.buyer = make_user("buyer", "1234567A")
+        self.now = timezone.now()
+        self.old = make_item(self.seller, name="Old chair", image="items/chair.png")
+        self.hot = make_item(self.seller, name="Hot laptop", image="items/laptop.png")
+        self.fresh = make_item(self.seller, name="Fresh mug")
+        Item.objects.filter(id=self.old.id).update(created_at=self.now - timedelta(days=10), views=50)
+        Item.objects.filter(id=self.hot.id).update(created_at=self.now - timedelta(days=1), views=40)
+        Offer.objects.create(buyer=self.buyer, item=self.hot, price=Decimal("9.00"))
+        Wishlist.objects.create(user=self.buyer, item=self.hot)
+
+    def test_scores_blend_activity_with_decay(self):
+        item_ids, scores = trending.compute_scores(self.now)
+        by_id = dict(zip(item_ids.tolist(), scores.tolist()))
+        self.assertGreater(by_id[self.hot.id], by_id[self.fresh.id])
+        self.assertGreater(by_id[self.fresh.id], by_id[self.old.id])
+
+    def test_refresh_builds_ranked_table_and_feeds_home(self):
+        Item.objects.filter(id=self.fresh.id).update(status='Sold')
+        self.assertEqual(trending.refresh_trending(self.now), 2)
+        self.assertEqual(list(TrendingItem.objects.order_by('rank').values_list('item_id', flat=True)),
+                         [self.hot.id, self.old.id])
+
+        response = self.client.get(reverse('home'))
+        self.assertEqual([i.id for i in response.context['featured_items']], [self.hot.id, self.old.id])
+
+        Item.objects.filter(id=self.fresh.id).update(status='Available')
+        response = self.client.get(reverse('home'), {'sort': 'trending'})
+        self.assertEqual([i.id for i in response.context['items']], [self.hot.id, self.old.id, self.fresh.id])
+
+    def test_featured_items_follow_the_filters(self):
+        self.assertEqual(trending.refresh_trending(self.now), 3)
+        response = self.client.get(reverse('home'), {'q': 'chair'})
+        self.assertEqual([i.id for i in response.context['featured_items']], [self.old.id])
+        response = self.client.get(reverse('home'), {'q': 'chair', 'sort': 'trending'})
+        self.assertEqual([i.id for i in response.context['items']], [self.old.id])
+
+    def test_trending_read_walks_the_rank_index(self):
+        trending.refresh_trending(self.now)
+        # The query home runs for each chunk of ranked items, with a filter applied
+        items = Item.objects.filter(status='Available', category='Books', price__lt=10)
+        plan = trending.rank_order(items).values_list('rank', 'item_id').filter(rank__gt=0)[:5].explain()
+        self.assertIn("marketplace_trendingitem USING INDEX", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+
+class StaticPipelineTests(TestCase):
+    CSS = ".item-card { margin: 10px; padding: 20px; }\n" * 40
+
+    def setUp(self):
+        self.source_dir = tempfile.mkdtemp()
+        self.static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        self.addCleanup(shutil.rmtree, self.static_root)
+
+        source = FileSystemStorage(location=self.source_dir)
+        source.save('css/site.css', ContentFile(self.CSS))
+        self.storage = CompressedManifestStaticFilesStorage(location=self.static_root, base_url='/static/')
+        # What collectstatic does: copy, then post-process
+        self.storage.save('css/site.css', ContentFile(self.CSS))
+        list(self.storage.post_process({'css/site.css': (source, 'css/site.css')}))
+        self.hashed_name = self.storage.stored_name('css/site.css')
+
+        with override_settings(STATIC_ROOT=self.static_root, STATIC_URL='/static/'):
+            self.middleware = StaticFilesMiddleware(lambda request: HttpResponse(status=404))
+
+    def get(self, name, **headers):
+        return self.middleware(RequestFactory().get(f'/static/{name}', **headers))
+
+    def test_collectstatic_writes_hashed_and_compressed_files(self):
+        self.assertNotEqual(self.hashed_name, 'css/site.css')
+        with open(f"{self.static_root}/{self.hashed_name}.gz", 'rb') as f:
+            self.assertLess(len(f.read()), len(self.CSS))
+
+    def test_hashed_file_is_immutable_and_served_compressed(self):
+        response = self.get(self.hashed_name, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+
+        plain = self.get(self.hashed_name, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(b''.join(plain.streaming_content).decode(), self.CSS)
+
+    def test_unhashed_name_gets_short_cache_and_etag_revalidates(self):
+        response = self.get('css/site.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        revalidated = self.get('css/site.css', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(revalidated.status_code, 304)
+        self.assertEqual(self.get('css/missing.css').status_code, 404)
+
+    def test_templates_reference_existing_static_files(self):
+        # The manifest storage raises for a missing name, so a bad reference breaks the page outside DEBUG
+        templates = Path(settings.BASE_DIR, 'marketplace', 'templates')
+        names = {name for path in templates.rglob('*.html')
+                 for name in re.findall(r"{% static '([^']+)' %}", path.read_text(encoding='utf-8'))}
+        self.assertIn('default-user.png', names)
+        self.assertEqual([name for name in sorted(names) if not finders.find(name)], [])
+
+
+@reads_from_primary
+class StreamingPageTests(TestCase):
+
+    def setUp(self):
+        self.buyer = make_user("buyer", "1234567A")
+        seller = make_user("seller", "7654321B")
+        self.items = [make_item(seller, name=f"Lamp {n}") for n in range(5)]
+
+    def test_home_streams_rows_in_chunks(self):
+        with mock.patch.object(streaming, 'ROWS_PER_CHUNK', 2):
+            response = self.client.get(reverse('home'))
+            self.assertTrue(response.streaming)
+            chunks = [chunk.decode() for chunk in response.streaming_content]
+        page = ''.join(chunks)
+        for item in self.items:
+            self.assertIn(item.name, page)
+        self.assertNotIn('<!--stream:', page)
+        # Shell before the list, three row chunks, then the rest of the page
+        self.assertEqual(len(chunks), 5)
+        self.assertIn('<nav', chunks[0])
+        self.assertIn('</html>', chunks[-1])
+
+    def test_empty_states_are_rendered(self):
+        self.client.force_login(self.buyer)
+        self.assertContains(self.client.get(reverse('purchase_history')), "You have not purchased any items yet.")
+        Item.objects.all().delete()
+        self.assertContains(self.client.get(reverse('home')), "No items available.")
+
+    def test_html_is_compressed_and_images_are_not(self):
+        response = self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        # Each streamed part is flushed: the page's first chunk decodes before the rest is rendered
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = iter(response.streaming_content)
+        first = b''
+        while not first:
+            first = decoder.decompress(next(chunks))
+        self.assertIn(b'<nav', first)
+        self.assertNotIn(b'</html>', first)
+        page = first + b''.join(decoder.decompress(chunk) for chunk in chunks) + decoder.flush()
+        self.assertIn(b'</html>', page)
+        self.assertTrue(decoder.eof)
+
+        request = RequestFactory().get('/media/photo.png', HTTP_ACCEPT_ENCODING='gzip')
+        image = CompressionMiddleware(lambda request: HttpResponse(b'\x89PNG' * 200, content_type='image/png'))(request)
+        self.assertFalse(image.has_header('Content-Encoding'))
+
+
+class RateLimitTests(TestCase):
+
+    def setUp(self):
+        ratelimit._memory_store.clear()
+        self.sender = make_user("sender", "1234567A")
+        self.receiver = make_user("receiver", "7654321B")
+        self.url = reverse('send_message', args=[self.receiver.id])
+
+    @override_settings(RATE_LIMITS={'send_message': '2/m'})
+    def test_posts_over_the_limit_get_429(self):
+        self.client.force_login(self.sender)
+        statuses = [self.client.post(self.url, {'content': f"hi {n}"}).status_code for n in range(3)]
+        self.assertEqual(statuses, [302, 302, 429])
+        self.assertEqual(Message.objects.count(), 2)
+
+        response = self.client.post(self.url, {'content': "again"})
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(1 <= int(response['Retry-After']) <= 30)
+
+        # Buckets are per user
+        self.client.force_login(self.receiver)
+        self.assertEqual(self.client.post(reverse('send_message', args=[self.sender.id]),
+                                          {'content': "reply"}).status_code, 302)
+
+    @override_settings(RATE_LIMITS={'send_message': None})
+    def test_limit_can_be_switched_off(self):
+        self.client.force_login(self.sender)
+        for n in range(25):
+            self.assertEqual(self.client.post(self.url, {'content': f"hi {n}"}).status_code, 302)
+
+    def test_bucket_refills_over_time(self):
+        store = ratelimit.MemoryBucketStore()
+        capacity, refill = ratelimit.parse_rate('2/m')
+        self.assertEqual([store.consume('k', capacity, refill, now=0) for _ in range(2)], [0, 0])
+        self.assertAlmostEqual(store.consume('k', capacity, refill, now=0), 30)
+        self.assertAlmostEqual(store.consume('k', capacity, refill, now=15), 15)
+        self.assertEqual(store.consume('k', capacity, refill, now=30), 0)
+
+    def test_memory_store_is_capped(self):
+        store = ratelimit.MemoryBucketStore()
+        store.MAX_BUCKETS = 10
+        capacity, refill = ratelimit.parse_rate('2/d')  # no bucket refills during the test
+        for n in range(10):
+            store.consume(f'k{n}', capacity, refill, now=0)
+        store.consume('k0', capacity, refill, now=1)
+        # Full: the two least recently used go in one pass, leaving room to grow again
+        store.consume('new', capacity, refill, now=2)
+        self.assertEqual(list(store.buckets), [f'k{n}' for n in range(3, 10)] + ['k0', 'new'])
+        with mock.patch.object(store, 'evict') as evict:
+            store.consume('newer', capacity, refill, now=3)
+        evict.assert_not_called()
+
+    @override_settings(REDIS_URL='redis://127.0.0.1:1/0', RATE_LIMIT_REDIS_BACKOFF=30)
+    def test_redis_failure_backs_off(self):
+        capacity, refill = ratelimit.parse_rate('2/m')
+        unreachable = mock.Mock(**{'consume.side_effect': ConnectionError})
+        redis_consume = unreachable.consume
+        with mock.patch.object(ratelimit, '_redis_store', unreachable), \
+                mock.patch.object(ratelimit, '_redis_down_until', 0), \
+                mock.patch.object(ratelimit.time, 'monotonic', return_value=1000.0) as clock, \
+                self.assertLogs('marketplace.ratelimit', 'WARNING'):
+            self.assertEqual([ratelimit.consume('k', capacity, refill) for _ in range(3)], [0, 0, 30])
+            self.assertEqual(redis_consume.call_count, 1)
+
+            clock.return_value = 1031.0
+            ratelimit.consume('k', capacity, refill)
+            self.assertEqual(redis_consume.call_count, 2)
+
+
+@reads_from_primary
+class FacetTests(TestCase):
+
+    def setUp(self):
+        self.good_seller = make_user("good", "1111111A")
+        self.new_seller = make_user("new", "2222222B")
+        rater = make_user("rater", "3333333C")
+        UserRating.objects.create(rated_user=self.good_seller, reviewer=rater, rating=5, comment="Great")
+        UserRating.objects.create(rated_user=self.good_seller, reviewer=rater, rating=4, comment="Good")
+        make_item(self.good_seller, name="Cheap novel", price="5.00", category="Books")
+        make_item(self.good_seller, name="Textbook", price="20.00", category="Books")
+        make_item(self.new_seller, name="Lamp", price="15.00", category="Furniture", image="items/lamp.jpg")
+        make_item(self.new_seller, name="Sold desk", price="15.00", category="Furniture", status="Sold")
+
+    def panel(self, **params):
+        response = self.client.get(reverse('home'), params)
+        return {facet['name']: {o['value']: o['count'] for o in facet['options']}
+                for facet in response.context['facets']}, response
+
+    def test_seller_rating_is_kept_current(self):
+        self.good_seller.refresh_from_db()
+        self.assertEqual(self.good_seller.seller_rating, 4.5)
+        UserRating.objects.filter(rating=5).delete()
+        self.good_seller.refresh_from_db()
+        self.assertEqual(self.good_seller.seller_rating, 4.0)
+
+    def test_counts_apply_the_other_facets(self):
+        counts, _ = self.panel()
+        self.assertEqual(counts['category']['Books'], 2)
+        self.assertEqual(counts['category']['Furniture'], 1)  # Sold items are not listed
+        self.assertEqual(counts['price'], {'0-10': 1, '10-25': 2, '25-50': 0, '50-100': 0, '100-': 0})
+        self.assertEqual(counts['rating'], {'4': 2, '3': 2, '2': 2})
+        self.assertEqual(counts['has_image'], {'1': 1})
+
+        counts, response = self.panel(price='10-25', category='Books')
+        # A facet's own selection does not narrow its counts; the others do
+        self.assertEqual(counts['category']['Furniture'], 1)
+        self.assertEqual(counts['price']['0-10'], 1)
+        self.assertEqual(counts['rating']['4'], 1)
+        self.assertEqual([item.name for item in response.context['items']], ["Textbook"])
+
+    def test_one_grouped_query_per_facet(self):
+        selection = facets.FacetSelection(QueryDict('category=Books&price=0-10&rating=4&has_image=1'))
+        with self.assertNumQueries(len(facets.FACETS)):
+            facets.facet_counts(Item.objects.filter(status='Available'), selection, QueryDict())
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        self.buyer = make_user("buyer", "1234567A")
+        self.seller = make_user("seller", "7654321B")
+        long_ago = timezone.now() - timedelta(days=800)
+
+        self.old_item = make_item(self.seller, name="Old bike", status="Sold")
+        self.old_purchase = Transaction.objects.create(buyer=self.buyer, item=self.old_item,
+                                                       total_price=Decimal("40.00"), status="Sold")
+        self.reviewed_item = make_item(self.seller, name="Reviewed kettle", status="Sold")
+        Review.objects.create(reviewer=self.buyer, item=self.reviewed_item, rating=5, comment="Great")
+        Item.objects.filter(id__in=[self.old_item.id, self.reviewed_item.id]).update(created_at=long_ago)
+        Transaction.objects.filter(id=self.old_purchase.id).update(date_initiated=long_ago)
+
+        self.old_read = Message.objects.create(sender=self.seller, receiver=self.buyer, content="Bike is yours", is_read=True)
+        self.old_unread = Message.objects.create(sender=self.seller, receiver=self.buyer, content="Still there?")
+        Message.objects.filter(id=self.old_read.id).update(timestamp=long_ago)
+        Message.objects.filter(id=self.old_unread.id).update(timestamp=long_ago + timedelta(hours=1))
+        Message.objects.create(sender=self.buyer, receiver=self.seller, content="Thanks!", is_read=True)
+
+    def test_rows_past_retention_move_to_archive(self):
+        self.assertEqual(archive.archive_all(), {'transactions': 1, 'items': 1, 'messages': 1})
+
+        self.assertFalse(Transaction.objects.filter(id=self.old_purchase.id).exists())
+        archived = ArchivedTransaction.objects.get(id=self.old_purchase.id)
+        self.assertEqual((archived.item_name, archived.buyer_id), ("Old bike", self.buyer.id))
+        self.assertTrue(ArchivedItem.objects.filter(id=self.old_item.id, name="Old bike").exists())
+        # Reviewed items and unread messages stay hot
+        self.assertTrue(Item.objects.filter(id=self.reviewed_item.id).exists())
+        self.assertTrue(Message.objects.filter(id=self.old_unread.id).exists())
+        self.assertEqual(ArchivedMessage.objects.get().content, "Bike is yours")
+
+        # A rerun finds nothing left to move
+        self.assertEqual(archive.archive_all(), {'transactions': 0, 'items': 0, 'messages': 0})
+
+    def test_items_with_finished_transactions_move_and_open_reports_keep_them(self):
+        long_ago = timezone.now() - timedelta(days=800)
+        rival = make_user("rival", "2345678C")
+        cancelled = Transaction.objects.create(buyer=rival, item=self.old_item, total_price=Decimal("40.00"),
+                                               status="Cancelled")
+        Transaction.objects.filter(id=cancelled.id).update(date_initiated=long_ago)
+        note = Notification.objects.create(user=self.buyer, item=self.old_item, kind='sold', message="Old bike sold")
+        reported = make_item(self.seller, name="Reported lamp", status="Sold")
+        Item.objects.filter(id=reported.id).update(created_at=long_ago)
+        Report.objects.create(reported_item=reported, reported_by=self.buyer, reason="Broken")
+
+        self.assertEqual(archive.archive_all()['items'], 1)
+        self.assertTrue(ArchivedTransaction.objects.filter(id=cancelled.id, status="Cancelled").exists())
+        self.assertTrue(ArchivedItem.objects.filter(id=self.old_item.id).exists())
+        note.refresh_from_db()
+        self.assertEqual((note.item_id, note.message), (None, "Old bike sold"))
+        self.assertTrue(Item.objects.filter(id=reported.id).exists())
+
+    def test_reads_span_hot_and_archived_rows(self):
+        archive.archive_all()
+        self.client.force_login(self.buyer)
+
+        self.assertContains(self.client.get(reverse('purchase_history')), "Old bike")
+
+        response = self.client.get(reverse('message_center_with_id', args=[self.seller.id]))
+        self.assertEqual([m.content for m in response.context['messages']],
+                         ["Bike is yours", "Still there?", "Thanks!"])
+        self.assertEqual(response.context['unique_users'], [self.seller])
+
+    @override_settings(ARCHIVE_DATABASE='archive')
+    def test_router_keeps_archive_tables_in_the_archive_database(self):
+        router = PrimaryReplicaRouter()
+        self.assertEqual(router.db_for_write(ArchivedMessage), 'archive')
+        self.assertEqual(router.db_for_read(ArchivedMessage), 'archive')
+        self.assertEqual(router.db_for_write(Message), 'default')
+        self.assertTrue(router.allow_migrate('archive', 'marketplace', 'archivedmessage'))
+        self.assertFalse(router.allow_migrate('archive', 'marketplace', 'message'))
+        self.assertFalse(router.allow_migrate('default', 'marketplace', 'archivedmessage'))
+
+
+@reads_from_primary
+class NearMeTests(TestCase):
+
+    def setUp(self):
+        self.near_seller = make_user("near", "1111111A")
+        self.far_seller = make_user("far", "2222222B")
+        self.unplaced_seller = make_user("unplaced", "3333333C")
+        self.assertTrue(self.near_seller.update_address("Flat 3/1, Boyd Orr Building"))
+        self.assertTrue(self.far_seller.update_address("Room 12, Wolfson Hall, Garscube Estate"))
+        self.assertFalse(self.unplaced_seller.update_address("221B Baker Street"))
+        self.next_door = make_item(self.near_seller, name="Kettle")
+        self.garscube = make_item(self.far_seller, name="Bike")
+        make_item(self.unplaced_seller, name="Toaster")
+
+    def test_geocoding_uses_the_longest_alias_mentioned(self):
+        self.assertEqual(geo.geocode("queen margaret union"), (geo.PLACES['qmu'].lat, geo.PLACES['qmu'].lon))
+        self.assertEqual(geo.geocode("QUEEN MARGARET RESIDENCES, flat 4"),
+                         (geo.PLACES['qm-residences'].lat, geo.PLACES['qm-residences'].lon))
+        self.assertIsNone(geo.geocode("Sparc Road"))  # aliases match whole words only
+        self.unplaced_seller.refresh_from_db()
+        self.assertIsNone(self.unplaced_seller.geo_cell)
+
+    def test_cells_cover_the_radius(self):
+        library = geo.PLACES['library']
+        cells = geo.cells_within(library.lat, library.lon, 1000)
+        for place in geo.GAZETTEER:
+            north = (place.lat - library.lat) * geo.M_PER_DEG_LAT
+            east = (place.lon - library.lon) * geo.M_PER_DEG_LAT * 0.56
+            if (north ** 2 + east ** 2) ** 0.5 <= 1000:
+                self.assertIn(geo.grid_cell(place.lat, place.lon), cells, place.key)
+
+    def test_home_filters_and_sorts_by_distance(self):
+        make_item(self.near_seller, name="Lamp")
+        response = self.client.get(reverse('home'), {'near': 'library', 'radius': 500})
+        content = b''.join(response.streaming_content).decode()
+        names = [item.name for item in response.context['items']]
+        self.assertCountEqual(names, ["Kettle", "Lamp"])
+        self.assertIn(" m away", content)
+
+        # Nearest first: Queen Margaret Residences is ~700 m from Murano Street, Boyd Orr ~1.1 km
+        residences = make_user("residences", "4444444D")
+        residences.update_address("Queen Margaret Residences")
+        make_item(residences, name="Rug")
+        response = self.client.get(reverse('home'), {'near': 'murano', 'radius': 2000})
+        items = list(response.context['items'])
+        self.assertEqual([item.name for item in items][0], "Rug")
+        self.assertCountEqual([item.name for item in items][1:], ["Kettle", "Lamp"])
+        self.assertTrue(700 < items[0].distance < 720 and 1000 < items[1].distance < 1100)
+
+        # Unknown places and anonymous "me" leave the listing unfiltered
+        response = self.client.get(reverse('home'), {'near': 'me'})
+        self.assertEqual(len(list(response.context['items'])), Item.objects.count())
+
+    def test_near_me_uses_the_users_address(self):
+        self.client.force_login(self.far_seller)
+        response = self.client.get(reverse('home'), {'near': 'me', 'radius': 250})
+        self.assertEqual([item.name for item in response.context['items']], ["Bike"])
+        self.assertEqual(response.context['items'].rows.first().distance, 0)
+
+
+@reads_from_primary
+@override_settings(LIVE_HEARTBEAT_SECONDS=0.01, LIVE_STREAM_SECONDS=0.05)
+class LiveUpdateTests(TestCase):
+
+    def setUp(self):
+        self.broadcaster = live.MemoryBroadcaster(backlog=5)
+        patcher = mock.patch.object(live, '_broadcaster', self.broadcaster)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.seller = make_user("seller", "7654321B")
+
+    def events(self, after='0'):
+        return [(event, json.loads(data)) for _, event, data in self.broadcaster.read(after, timeout=0)]
+
+    def test_item_saves_publish_diffs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = make_item(self.seller, name="Kettle", price="12.00")
+        with self.captureOnCommitCallbacks(execute=True):
+            item = Item.objects.get(pk=item.pk)
+            item.price = Decimal("9.50")
+            item.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            item.status = 'Sold'
+            item.save(update_fields=['status'])
+        with self.captureOnCommitCallbacks(execute=True):
+            item.name = "Electric kettle"
+            item.save()  # neither status nor price changed: nothing to publish
+
+        (new, card), price, status = self.events()
+        self.assertEqual(new, 'new')
+        self.assertIn(f'data-item-id="{item.id}"', card['html'])
+        self.assertEqual(card['seller_id'], self.seller.id)
+        self.assertIn("BUY IT NOW", card['html'])
+        self.assertNotIn("BUY IT NOW", card['seller_html'])
+        self.assertIn("Edit", card['seller_html'])
+        self.assertEqual(price, ('price', {'id': item.id, 'price': '9.50'}))
+        self.assertEqual(status, ('status', {'id': item.id, 'status': 'Sold'}))
+
+    def test_moderation_updates_are_published(self):
+        item = make_item(self.seller)
+        with self.captureOnCommitCallbacks(execute=True):
+            apply_action([item.id], 'hide')
+        self.assertEqual(self.events(), [('status', {'id': item.id, 'status': 'Hidden'})])
+
+    def test_rolled_back_saves_are_not_published(self):
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            make_item(self.seller)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(self.events(), [])
+
+    def test_stream_resumes_from_last_event_id(self):
+        for n in range(3):
+            self.broadcaster.publish('price', json.dumps({'id': n}))
+        response = self.client.get(reverse('live_items'), HTTP_LAST_EVENT_ID='1', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        body = b''.join(response.streaming_content).decode()
+        self.assertNotIn('id: 1\n', body)
+        self.assertIn('id: 2\nevent: price\ndata: {"id": 1}\n\n', body)
+        self.assertIn('id: 3\n', body)
+        self.assertIn(': keep-alive', body)
+
+    def test_gap_older_than_the_backlog_asks_for_a_reload(self):
+        for n in range(8):
+            self.broadcaster.publish('price', '{}')
+        stream = ''.join(live.event_stream('1'))
+        self.assertIn('event: reload', stream)
+        # An id from before a restart is just as unusable
+        self.assertIn('event: reload', ''.join(live.event_stream('100')))
+        self.assertNotIn('event: reload', ''.join(live.event_stream('3')))
+
+    @override_settings(LIVE_MAX_STREAMS=1, LIVE_POLL_SECONDS=10)
+    def test_streams_over_the_limit_fall_back_to_polling(self):
+        self.broadcaster.publish('price', '{"id": 1}')
+        held = live.event_stream('0', heartbeat=60, duration=60)
+        self.assertEqual(next(held), "retry: 1000\n\n")  # takes the worker's only slot
+
+        polled = ''.join(live.event_stream('0'))
+        self.assertTrue(polled.startswith("retry: 10000\n\n"))
+        self.assertIn('id: 1\nevent: price\n', polled)
+        self.assertNotIn('keep-alive', polled)
+
+        held.close()  # what the server does when the client goes away
+        stream = live.event_stream('1', heartbeat=60, duration=60)
+        self.assertEqual(next(stream), "retry: 1000\n\n")
+        stream.close()
+
+    def test_waiting_reader_wakes_on_publish(self):
+        after = self.broadcaster.latest_id()
+        threading.Timer(0.05, self.broadcaster.publish, args=('status', '{}')).start()
+        started = time.monotonic()
+        events = self.broadcaster.read(after, timeout=5)
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual([event for _, event, _ in events], ['status'])
+
+    def test_home_starts_the_feed_at_the_current_event(self):
+        self.broadcaster.publish('price', '{}')
+        response = self.client.get(reverse('home'))
+        content = b''.join(response.streaming_content).decode()
+        self.assertIn(reverse('live_items') + '?last_event_id=1', content)
+
+
+class TransactionStateMachineTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user("seller", "7654321B")
+        self.buyer = make_user("buyer", "1234567A")
+        self.buyer.deposit(Decimal("100.00"))
+        self.item = make_item(self.seller, price="40.00", category="Books")
+
+    def balance(self, user):
+        return CustomUser.objects.values_list('balance', flat=True).get(pk=user.pk)
+
+    def actions(self, transaction_row):
+        return list(transaction_row.events.order_by('id').values_list('action', flat=True))
+
+    def test_both_confirmations_complete_the_sale(self):
+        self.client.force_login(self.buyer)
+        self.client.get(reverse('buy_item', args=[self.item.id]))
+        purchase = Transaction.objects.get(item=self.item)
+        self.assertEqual((purchase.status, self.balance(self.buyer)), ('Pending', Decimal("60.00")))
+
+        self.client.get(reverse('confirm_transaction', args=[purchase.id]))  # GET changes nothing
+        self.client.post(reverse('confirm_transaction', args=[purchase.id]), {'idempotency_key': 'confirm-a'})
+        purchase.refresh_from_db()
+        self.assertEqual((purchase.status, purchase.buyer_confirmation), ('Pending', True))
+
+        self.assertEqual(transitions.confirm(purchase, self.seller), transitions.APPLIED)
+        self.item.refresh_from_db()
+        self.assertEqual((purchase.status, self.item.status), ('Sold', 'Sold'))
+        self.assertIsNotNone(purchase.date_completed)
+        self.assertEqual(self.actions(purchase), ['created', 'buyer_confirmed', 'seller_confirmed', 'completed'])
+        stats = SellerDailyStats.objects.get(seller=self.seller)
+        self.assertEqual((stats.sales, stats.revenue), (1, Decimal("40.00")))
+        self.assertEqual(transitions.confirm(purchase, self.buyer), transitions.ALREADY_DONE)
+
+    def test_idempotency_key_replays_without_reapplying(self):
+        purchase = transitions.request_purchase(self.item, self.buyer)
+        self.assertEqual(transitions.cancel(purchase, self.buyer, idempotency_key='k1'), transitions.APPLIED)
+        self.assertEqual(transitions.cancel(purchase, self.buyer, idempotency_key='k1'), transitions.REPLAYED)
+        self.assertEqual(transitions.cancel(purchase, self.seller), transitions.ALREADY_DONE)
+        self.assertEqual(self.balance(self.buyer), Decimal("100.00"))  # repaid once
+        self.item.refresh_from_db()
+        self.assertEqual(self.item.status, 'Available')
+        self.assertEqual(self.actions(purchase), ['created', 'cancelled'])
+        with self.assertRaises(transitions.TransitionError):
+            transitions.confirm(purchase, self.buyer)
+
+    def test_only_parties_may_act(self):
+        stranger = make_user("stranger", "5555555S")
+        purchase = transitions.request_purchase(self.item, self.buyer)
+        for step in (transitions.confirm, transitions.cancel, transitions.refund):
+            with self.assertRaises(transitions.TransitionError):
+                step(purchase, stranger)
+        with self.assertRaises(transitions.TransitionError):
+            transitions.refund(purchase, self.seller)  # not sold yet
+
+    def test_item_goes_to_one_buyer_and_needs_the_money(self):
+        rival = make_user("rival", "6666666R")
+        rival.deposit(Decimal("100.00"))
+        transitions.request_purchase(self.item, self.buyer)
+        with self.assertRaises(transitions.TransitionError):
+            transitions.request_purchase(self.item, rival)
+        self.assertEqual(self.balance(rival), Decimal("100.00"))
+
+        pricey = make_item(self.seller, price="500.00")
+        with self.assertRaises(transitions.TransitionError):
+            transitions.request_purchase(pricey, rival)
+        pricey.refresh_from_db()
+        self.assertEqual(pricey.status, 'Available')  # the reservation rolled back
+
+    def test_refund_repays_buyer_and_relists_item(self):
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('process_purchase', args=[self.item.id]), {'address': 'Library'})
+        purchase = Transaction.objects.get(item=self.item)
+        self.client.force_login(self.seller)
+        self.client.post(reverse('refund_transaction', args=[purchase.id]), {'idempotency_key': 'refund-x'})
+        self.client.post(reverse('refund_transaction', args=[purchase.id]), {'idempotency_key': 'refund-x'})
+
+        purchase.refresh_from_db()
+        self.item.refresh_from_db()
+        self.assertEqual((purchase.status, self.item.status), ('Refunded', 'Available'))
+        self.assertEqual(self.balance(self.buyer), Decimal("100.00"))
+        stats = SellerDailyStats.objects.get(seller=self.seller)
+        self.assertEqual((stats.sales, stats.revenue), (0, Decimal("0.00")))
+        self.assertEqual(self.actions(purchase), ['created', 'refunded'])
+
+    def test_refund_on_a_later_day_comes_off_the_sale_day(self):
+        purchase = transitions.purchase_now(self.item, self.buyer)
+        # Move the sale, and its rollup row, back a day
+        yesterday = timezone.now() - timedelta(days=1)
+        Transaction.objects.filter(pk=purchase.pk).update(date_completed=yesterday)
+        SellerDailyStats.objects.filter(seller=self.seller).update(day=timezone.localdate(yesterday))
+        purchase = Transaction.objects.get(pk=purchase.pk)
+
+        transitions.refund(purchase, self.seller)
+        stats = SellerDailyStats.objects.get(seller=self.seller)
+        self.assertEqual((stats.day, stats.sales, stats.revenue), (timezone.localdate(yesterday), 0, Decimal("0.00")))
+
+    def test_immediate_purchase_sells_once(self):
+        rival = make_user("rival", "6666666R")
+        rival.deposit(Decimal("100.00"))
+        purchase = transitions.purchase_now(self.item, self.buyer)
+        with self.assertRaises(transitions.TransitionError):
+            transitions.purchase_now(self.item, rival)
+
+        self.item.refresh_from_db()
+        self.assertEqual((purchase.status, self.item.status), ('Sold', 'Sold'))
+        self.assertEqual((self.balance(self.buyer), self.balance(rival)), (Decimal("60.00"), Decimal("100.00")))
+        self.assertEqual(Transaction.objects.filter(item=self.item).count(), 1)
+        self.assertEqual(self.actions(purchase), ['created'])
+        self.assertEqual(list(self.item.change_log.values_list('kind', flat=True)), ['sold'])
+        stats = SellerDailyStats.objects.get(seller=self.seller)
+        self.assertEqual((stats.sales, stats.revenue), (1, Decimal("40.00")))
+
+        pricey = make_item(self.seller, price="500.00")
+        self.client.force_login(rival)
+        self.client.post(reverse('process_purchase', args=[pricey.id]), {'address': 'Library'})
+        pricey.refresh_from_db()
+        self.assertEqual((pricey.status, self.balance(rival)), ('Available', Decimal("100.00")))
+
+    def test_accepted_offer_reserves_at_offer_price(self):
+        offer = Offer.objects.create(buyer=self.buyer, item=self.item, price=Decimal("30.00"))
+        self.client.force_login(self.seller)
+        self.client.get(reverse('accept_offer', args=[offer.id]))
+        self.client.get(reverse('accept_offer', args=[offer.id]))  # a second click changes nothing
+
+        offer.refresh_from_db()
+        self.item.refresh_from_db()
+        purchase = Transaction.objects.get(item=self.item)
+        self.assertEqual((offer.status, self.item.status), ('Accepted', 'Pending'))
+        self.assertEqual((purchase.status, purchase.total_price), ('Pending', Decimal("30.00")))
+        self.assertEqual(self.balance(self.buyer), Decimal("70.00"))
+        self.assertEqual(self.actions(purchase), ['created'])
+
+        broke = make_user("broke", "7777777Z")
+        other_item = make_item(self.seller, price="40.00")
+        unaffordable = Offer.objects.create(buyer=broke, item=other_item, price=Decimal("35.00"))
+        with self.assertRaises(transitions.TransitionError):
+            transitions.accept_offer(unaffordable, self.seller)
+        unaffordable.refresh_from_db()
+        other_item.refresh_from_db()
+        self.assertEqual((unaffordable.status, other_item.status), ('Pending', 'Available'))
+
+
+class ConcurrentConfirmationTests(TransactionTestCase):
+    """Confirmations from many threads at once: every sale completes exactly once."""
+    TRANSACTIONS = 100
+    THREADS = 8
+
+    def test_no_lost_or_duplicated_updates(self):
+        seller = make_user("seller", "7654321B")
+        buyer = make_user("buyer", "1234567A")
+        buyer.deposit(Decimal("1000.00"))
+        purchases = [transitions.request_purchase(make_item(seller, name=f"Item {n}", price="5.00"), buyer)
+                     for n in range(self.TRANSACTIONS)]
+
+        # Both parties confirm every transaction, each request sent twice (a double submit)
+        calls = [(purchase.id, user, f"{user.username}-{purchase.id}")
+                 for purchase in purchases for user in (buyer, seller) for _ in range(2)]
+        random.Random(7).shuffle(calls)
+        outcomes, errors = [], []
+
+        def worker(chunk):
+            try:
+                for transaction_id, user, key in chunk:
+                    outcomes.append(transitions.confirm(Transaction.objects.get(pk=transaction_id), user, key))
+            except Exception as error:  # surfaced by the assertion below
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=(calls[n::self.THREADS],)) for n in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(outcomes.count(transitions.APPLIED), 2 * self.TRANSACTIONS)
+        self.assertEqual(Transaction.objects.filter(status='Sold').count(), self.TRANSACTIONS)
+        self.assertEqual(Item.objects.filter(status='Sold').count(), self.TRANSACTIONS)
+        for action in ('buyer_confirmed', 'seller_confirmed', 'completed'):
+            self.assertEqual(TransactionEvent.objects.filter(action=action).count(), self.TRANSACTIONS)
+        stats = SellerDailyStats.objects.get(seller=seller)
+        self.assertEqual((stats.sales, stats.revenue), (self.TRANSACTIONS, Decimal("5.00") * self.TRANSACTIONS))
+
+
+
+@override_settings(TASK_BACKEND='memory')
+class AdminScaleTests(TestCase):
+
+    def setUp(self):
+        get_backend().clear()
+        self.seller = make_user("seller", "7654321B")
+        self.staff = make_user("admin", "9999999M")
+        CustomUser.objects.filter(pk=self.staff.pk).update(is_staff=True, is_superuser=True)
+        self.client.force_login(self.staff)
+
+    def changelist(self, model):
+        return reverse(f'admin:marketplace_{model}_changelist')
+
+    def act(self, model, action, objects, **params):
+        data = {'action': action, ACTION_CHECKBOX_NAME: [obj.pk for obj in objects], **params}
+        return self.client.post(self.changelist(model), data)
+
+    def test_every_model_has_a_changelist(self):
+        for model in ('customuser', 'item', 'transaction', 'review', 'report', 'offer', 'message', 'cart', 'wishlist'):
+            self.assertEqual(self.client.get(self.changelist(model)).status_code, 200, model)
+
+    @override_settings(ADMIN_EXACT_COUNT_LIMIT=3)
+    def test_unfiltered_count_of_big_table_is_estimated(self):
+        items = [make_item(self.seller, name=f"Item {n}") for n in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(EstimatedCountPaginator(Item.objects.order_by('pk'), 2).count, items[-1].pk)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in queries.captured_queries))
+        Item.objects.filter(pk=items[0].pk).update(status='Sold')
+        self.assertEqual(EstimatedCountPaginator(Item.objects.filter(status='Sold').order_by('pk'), 2).count, 1)
+
+    def test_hide_and_relist_are_one_update_each(self):
+        items = [make_item(self.seller, name=f"Item {n}") for n in range(3)]
+        with CaptureQueriesContext(connection) as queries:
+            self.act('item', 'hide_items', items[:2])
+        updates = [query for query in queries.captured_queries if query['sql'].startswith('UPDATE "marketplace_item"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Item.objects.filter(status='Hidden').count(), 2)
+        self.act('item', 'relist_items', items)
+        self.assertEqual(Item.objects.filter(status='Available').count(), 3)
+        # Logged for wishlist watchers like a save() would be, once per item moved
+        kinds = ItemChangeLog.objects.filter(item__in=items).values_list('kind', flat=True)
+        self.assertEqual(sorted(kinds), ['hidden', 'hidden', 'relisted', 'relisted'])
+
+    def test_item_search_does_not_join_users(self):
+        make_item(self.seller, name="Desk lamp")
+        make_item(self.staff, name="Desk chair")
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.changelist('item'), {'q': 'desk'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        # The page itself joins sellers for display (list_select_related); the search count does not
+        counts = [query['sql'] for query in queries.captured_queries if 'COUNT(' in query['sql'] and 'LIKE' in query['sql']]
+        self.assertEqual(len(counts), 1)
+        self.assertNotIn('JOIN', counts[0])
+        response = self.client.get(self.changelist('item'), {'q': 'seller:seller'})
+        self.assertEqual([item.name for item in response.context['cl'].result_list], ["Desk lamp"])
+
+    def test_deactivate_users_skips_self_and_drops_cached_users(self):
+        cache.set(user_cache_key(self.seller.pk), self.seller)
+        self.act('customuser', 'deactivate_users', [self.seller, self.staff])
+        self.assertFalse(CustomUser.objects.get(pk=self.seller.pk).is_active)
+        self.assertTrue(CustomUser.objects.get(pk=self.staff.pk).is_active)
+        self.assertIsNone(cache.get(user_cache_key(self.seller.pk)))
+
+    def test_report_actions_use_moderation(self):
+        item = make_item(self.seller)
+        report = Report.objects.create(reported_item=item, reported_by=self.staff, reason="Counterfeit")
+        self.act('report', 'hide_reported_items', [report])
+        self.assertEqual(Item.objects.get(pk=item.pk).status, 'Hidden')
+        self.assertEqual(Report.objects.get(pk=report.pk).status, 'Resolved')
+
+    @override_settings(ADMIN_DELETE_PREVIEW_LIMIT=1)
+    def test_large_delete_confirmation_is_a_summary(self):
+        items = [make_item(self.seller, name=f"Item {n}") for n in range(3)]
+        response = self.act('item', 'delete_selected', items)
+        self.assertContains(response, "3 items, with their")
+        self.client.post(self.changelist('item'), {
+            'action': 'delete_selected', 'post': 'yes', ACTION_CHECKBOX_NAME: [item.pk for item in items],
+        })
+        self.assertFalse(Item.objects.exists())
+
+    def test_export_of_filtered_result_set(self):
+        media, private = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.addCleanup(shutil.rmtree, private)
+        make_item(self.seller, name="Desk lamp")
+        make_item(self.seller, name="Old sofa", status='Sold')
+        storages = dict(settings.STORAGES, exports={
+            'BACKEND': 'django.core.files.storage.FileSystemStorage', 'OPTIONS': {'location': private}})
+        with override_settings(MEDIA_ROOT=media, STORAGES=storages):
+            # "Select all" across the filtered changelist
+            response = self.client.post(self.changelist('item') + '?status__exact=Available', {
+                'action': 'export_csv', 'select_across': '1', 'index': '0',
+                ACTION_CHECKBOX_NAME: [Item.objects.first().pk],
+            })
+            self.assertEqual(response.status_code, 302)
+            get_backend().run_pending()
+            notification = Notification.objects.get(user=self.staff, kind='export')
+            link = notification.message.rpartition(' ')[2]
+            content = b''.join(self.client.get(link).streaming_content).decode()
+            self.client.force_login(self.seller)
+            self.assertEqual(self.client.get(link).status_code, 302)  # staff only
+        self.assertEqual(os.listdir(media), [])  # nothing under the public MEDIA_URL
+        self.assertEqual(len(os.listdir(private)), 1)
+        rows = content.splitlines()
+        self.assertEqual(rows[0].split(',')[:2], ['id', 'name'])
+        self.assertEqual([row.split(',')[1] for row in rows[1:]], ["Desk lamp"])
+
+    def test_export_file_neutralises_formulas(self):
+        make_item(self.seller, name='=HYPERLINK("http://evil.example","Click")')
+        stream = io.StringIO()
+        self.assertEqual(exports.write_csv(Item.objects.all(), ['id', 'name'], stream), 1)
+        rows = list(csv.reader(stream.getvalue().splitlines()))
+        self.assertEqual(rows[1][1], '\'=HYPERLINK("http://evil.example","Click")')
+
+    def test_tampered_export_query_is_rejected(self):
+        dumped = exports.dump_queryset(Item.objects.filter(status='Sold'))
+        self.assertEqual(str(exports.load_queryset('marketplace.Item', dumped).query),
+                         str(Item.objects.filter(status='Sold').query))
+        with self.assertRaises(signing.BadSignature):
+            exports.load_queryset('marketplace.Item', 'x' + dumped)
+
+
+@reads_from_primary
+class StreamedExportTests(TestCase):
+
+    def setUp(self):
+        self.seller = make_user("seller", "7654321B")
+        self.buyer = make_user("buyer", "1234567A")
+        self.staff = make_user("admin", "9999999M")
+        CustomUser.objects.filter(pk=self.staff.pk).update(is_staff=True)
+        for n, day in enumerate([1, 15, 28]):
+            item = make_item(self.seller, name=f"Item {n}")
+            purchase = Transaction.objects.create(buyer=self.buyer, item=item, total_price=item.price, status='Sold')
+            Transaction.objects.filter(pk=purchase.pk).update(
+                date_initiated=timezone.make_aware(timezone.datetime(2024, 3, day, 12)))
+
+    def download(self, url, **params):
+        response = self.client.get(url, params)
+        with CaptureQueriesContext(connection) as queries:
+            body = b''.join(response.streaming_content).decode()
+        return response, list(csv.reader(body.splitlines())), queries
+
+    def test_transactions_stream_in_one_query_within_the_date_range(self):
+        self.client.force_login(self.staff)
+        response, rows, queries = self.download(reverse('export_rows', args=['transactions']),
+                                                **{'from': '2024-03-10', 'to': '2024-03-28'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('attachment', response['Content-Disposition'])
+        self.assertEqual(rows[0], [header for header, _ in exports.TRANSACTION_COLUMNS])
+        self.assertEqual([(row[1], row[-2], row[-1]) for row in rows[1:]],
+                         [("Item 1", "buyer", "seller"), ("Item 2", "buyer", "seller")])
+        self.assertEqual(len(queries), 1)  # buyer, item and seller joined in
+
+    def test_offers_and_items(self):
+        Offer.objects.create(buyer=self.buyer, item=Item.objects.first(), price=Decimal("8.00"))
+        self.client.force_login(self.staff)
+        _, offers, _ = self.download(reverse('export_rows', args=['offers']))
+        _, items, _ = self.download(reverse('export_rows', args=['items']))
+        self.assertEqual([row[4] for row in offers[1:]], ["buyer"])
+        self.assertEqual(len(items), 4)
+
+    def test_staff_only_and_bad_parameters(self):
+        url = reverse('export_rows', args=['transactions'])
+        self.client.force_login(self.buyer)
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.client.get(url, {'from': '03/10/2024'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'format': 'pdf'}).status_code, 400)
+        self.assertEqual(self.client.get(reverse('export_rows', args=['users'])).status_code, 404)
+
+    def test_purchase_history_export_includes_archive(self):
+        ArchivedTransaction.objects.create(
+            id=10_000, buyer=self.buyer, item_id=10_000, item_name="Old bike", status='Sold',
+            total_price=Decimal("40.00"), date_initiated=timezone.make_aware(timezone.datetime(2023, 9, 1)))
+        other = make_user("other", "2345678C")
+        Transaction.objects.create(buyer=other, item=make_item(self.seller), total_price=Decimal("1.00"), status='Sold')
+        self.client.force_login(self.buyer)
+        _, rows, _ = self.download(reverse('export_purchase_history'))
+        self.assertEqual([row[1] for row in rows[1:]], ["Item 2", "Item 1", "Item 0", "Old bike"])
+        _, rows, _ = self.download(reverse('export_purchase_history'), to='2023-12-31')
+        self.assertEqual([row[1] for row in rows[1:]], ["Old bike"])
+
+    def test_formulas_in_user_text_are_neutralised(self):
+        Item.objects.filter(name="Item 0").update(name='=HYPERLINK("http://evil.example","Click")')
+        CustomUser.objects.filter(pk=self.buyer.pk).update(username="@SUM(1+1)")
+        self.client.force_login(self.staff)
+        _, rows, _ = self.download(reverse('export_rows', args=['transactions']))
+        self.assertEqual((rows[1][1], rows[1][-2]), ('\'=HYPERLINK("http://evil.example","Click")', "'@SUM(1+1)"))
+        self.assertEqual(exports.spreadsheet_safe(Decimal("-5.00")), Decimal("-5.00"))  # numbers stay numbers
+
+    @unittest.skipIf(exports.load_openpyxl() is None, "openpyxl is not installed")
+    def test_xlsx(self):
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_rows', args=['transactions']), {'format': 'xlsx'})
+        workbook = exports.load_openpyxl().load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(workbook.active.max_row, 4)
+
+
+def png(scale=1, shade=0):
+    """A 64x48 test photo as PNG bytes, optionally resized by `scale` and brightened by `shade`."""
+    from PIL import Image
+
+    image = Image.new('L', (64, 48))
+    image.putdata([min(255, int(128 + 60 * math.sin(x / 6) * math.cos(y / 5)) + shade)
+                   for y in range(48) for x in range(64)])
+    image = image.resize((64 * scale, 48 * scale))
+    buffer = io.BytesIO()
+    image.save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@override_settings(TASK_BACKEND='memory')
+class DuplicateListingTests(TestCase):
+    DESCRIPTION = "Barely used scientific calculator, comes with the original case and manual. Collect from Boyd Orr."
+
+    def setUp(self):
+        get_backend().clear()
+        self.seller = make_user("seller", "7654321B")
+        self.other = make_user("other", "1234567A")
+
+    def post(self, seller, name="Casio FX-991 calculator", description=DESCRIPTION, **kwargs):
+        item = make_item(seller, name=name, description=description, **kwargs)
+        get_backend().run_pending()
+        item.refresh_from_db()
+        return item
+
+    def test_minhash_estimates_similarity(self):
+        signature = duplicates.minhash(self.DESCRIPTION)
+        edited = duplicates.minhash(self.DESCRIPTION.replace("Boyd Orr", "the library"))
+        unrelated = duplicates.minhash("Wooden desk chair, slightly scratched, free to a good home.")
+        self.assertGreater(duplicates.text_similarity(signature, edited), 0.7)
+        self.assertLess(duplicates.text_similarity(signature, unrelated), 0.2)
+        self.assertIsNone(duplicates.minhash("!!!"))
+
+    def test_repost_is_hidden_and_seller_told(self):
+        original = self.post(self.seller)
+        repost = self.post(self.seller, name="casio fx-991 calculator!")
+        self.assertEqual(original.status, 'Available')
+        self.assertEqual(repost.status, 'Hidden')
+        signature = ItemSignature.objects.get(item=repost)
+        self.assertEqual(signature.duplicate_of_id, original.pk)
+        self.assertGreaterEqual(signature.similarity, 0.8)
+        self.assertTrue(Notification.objects.filter(user=self.seller, item=repost, kind='duplicate').exists())
+        self.assertEqual(list(repost.change_log.values_list('kind', flat=True)), ['hidden'])
+
+    def test_other_sellers_and_other_items_are_not_duplicates(self):
+        self.post(self.seller)
+        self.assertEqual(self.post(self.other).status, 'Available')
+        self.assertEqual(self.post(self.seller, name="Desk chair", description="Wooden, slightly scratched").status,
+                         'Available')
+        self.assertFalse(ItemSignature.objects.filter(duplicate_of__isnull=False).exists())
+
+    @override_settings(DUPLICATE_ACTION='flag')
+    def test_flag_only(self):
+        original = self.post(self.seller)
+        repost = self.post(self.seller)
+        self.assertEqual(repost.status, 'Available')
+        self.assertEqual(ItemSignature.objects.get(item=repost).duplicate_of_id, original.pk)
+
+    def test_candidates_come_from_the_bucket_index(self):
+        original = self.post(self.seller)
+        for n in range(5):
+            self.post(self.seller, name=f"Listing {n}", description=f"Something else entirely, number {n}")
+        repost = make_item(self.seller, name=original.name, description=original.description)
+        signature = duplicates.index_item(repost)
+        with self.assertNumQueries(2):  # bucket lookup, candidate signatures
+            matches = duplicates.find_duplicates(repost, signature)
+        self.assertEqual([item_id for item_id, _ in matches], [original.pk])
+
+    def test_same_photo_is_a_duplicate(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        with override_settings(MEDIA_ROOT=media):
+            original = self.post(self.seller, image=ContentFile(png(), name="a.png"))
+            # Same photo, resized and a little brighter, with a different description
+            repost = self.post(self.seller, name="Calculator", description="Great for exams",
+                               image=ContentFile(png(scale=2, shade=4), name="b.png"))
+        self.assertLessEqual(duplicates.image_distance(ItemSignature.objects.get(item=original).image_hash,
+                                                       ItemSignature.objects.get(item=repost).image_hash), 6)
+        self.assertEqual(repost.status, 'Hidden')
+
+    def test_backfill_command(self):
+        Item.objects.bulk_create([  # bulk_create sends no post_save, like listings from before the detector
+            Item(seller=self.seller, name="Casio FX-991 calculator", description=self.DESCRIPTION,
+                 price=Decimal("10.00"), category="Electronics")
+            for _ in range(3)
+        ] + [Item(seller=self.seller, name="Desk chair", description="Wooden", price=Decimal("5.00"),
+                  category="Furniture")])
+        out = StringIO()
+        call_command('index_duplicates', '--batch-size', '2', stdout=out)
+        self.assertIn("Indexed 4 listings; 2 re-posts found.", out.getvalue())
+        self.assertEqual(ItemSignature.objects.count(), 4)
+        self.assertEqual(list(Item.objects.order_by('pk').values_list('status', flat=True)),
+                         ['Available', 'Hidden', 'Hidden', 'Available'])
+        buckets = SignatureBucket.objects.count()
+        call_command('index_duplicates', '--rebuild', '--no-check', stdout=StringIO())
+        self.assertEqual(SignatureBucket.objects.count(), buckets)
+
+
+@reads_from_primary
+@override_settings(TASK_BACKEND='memory')
+class SavedSearchTests(TestCase):
+    def setUp(self):
+        get_backend().clear()
+        self.seller = make_user("seller", "7654321B")
+        self.buyer = make_user("buyer", "1234567A")
+
+    def post(self, **kwargs):
+        item = make_item(self.seller, **kwargs)
+        get_backend().run_pending()
+        return item
+
+    def notified(self, user=None):
+        return list(Notification.objects.filter(user=user or self.buyer, kind='saved_search')
+                    .values_list('item_id', flat=True))
+
+    def test_search_term_is_a_trigram_of_the_query(self):
+        self.assertEqual(saved_searches.search_term("Calculus Textbook"), "xtb")
+        self.assertEqual(saved_searches.search_term("tv"), "tv")
+        self.assertEqual(saved_searches.search_term("", "Books"), "category:Books")
+        item = make_item(self.seller, name="Calculus textbook, 3rd edition", category="Books")
+        for query, category in (("calculus textbook", ""), ("Ca", ""), ("", "Books"), ("3rd", "Books")):
+            self.assertIn(saved_searches.search_term(query, category), saved_searches.item_terms(item))
+
+    def test_new_listing_matches_like_home(self):
+        saved_searches.save_search(self.buyer, "desk lamp")
+        saved_searches.save_search(self.buyer, "LAMP", "Furniture")
+        saved_searches.save_search(self.buyer, "", "Books")
+        saved_searches.save_search(self.seller, "lamp")  # the seller's own search
+        lamp = self.post(name="Desk Lamp, barely used", category="Others")
+        textbook = self.post(name="Statistics textbook", category="Books")
+        self.post(name="Desk chair", description="Comes with a lamp", category="Clothing")
+        self.assertEqual(sorted(self.notified()), [lamp.pk, textbook.pk])
+        self.assertEqual(self.notified(self.seller), [])
+
+    def test_one_notification_per_user_and_item(self):
+        saved_searches.save_search(self.buyer, "lamp")
+        saved_searches.save_search(self.buyer, "desk")
+        lamp = self.post(name="Desk lamp")
+        self.assertEqual(self.notified(), [lamp.pk])
+
+    def test_matching_reads_only_candidates(self):
+        other = make_user("other", "2345678C")
+        SavedSearch.objects.bulk_create([
+            SavedSearch(user=other, query=f"unrelated query {n}", term=saved_searches.search_term(f"unrelated query {n}"))
+            for n in range(200)
+        ])
+        saved_searches.save_search(self.buyer, "lamp")
+        item = make_item(self.seller, name="Desk lamp")
+        self.assertEqual(list(saved_searches.candidates(item)), [(self.buyer.pk, "lamp", "")])
+
+    def test_edits_and_hidden_listings_are_not_matched(self):
+        saved_searches.save_search(self.buyer, "lamp")
+        item = self.post(name="Desk chair", status='Hidden')
+        item.name = "Desk lamp"
+        item.status = 'Available'
+        item.save()
+        get_backend().run_pending()
+        self.assertEqual(self.notified(), [])
+
+    def test_save_and_delete_views(self):
+        self.client.force_login(self.buyer)
+        response = self.client.post(reverse('save_search'), {'q': '  desk lamp ', 'category': 'Nope'})
+        self.assertRedirects(response, reverse('saved_searches'))
+        self.client.post(reverse('save_search'), {'q': 'desk lamp'})
+        search = SavedSearch.objects.get(user=self.buyer)
+        self.assertEqual((search.query, search.category, search.term), ("desk lamp", "", "amp"))
+        self.assertContains(self.client.get(reverse('saved_searches')), "desk lamp")
+        self.assertRedirects(self.client.post(reverse('save_search'), {'q': ''}), reverse('home'),
+                             fetch_redirect_response=False)
+
+        make_user("other", "2345678C")
+        self.client.force_login(CustomUser.objects.get(username="other"))
+        self.client.post(reverse('delete_saved_search', args=[search.id]))
+        self.assertTrue(SavedSearch.objects.filter(pk=search.pk).exists())
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('delete_saved_search', args=[search.id]))
+        self.assertFalse(SavedSearch.objects.exists())
+
+    def test_home_offers_to_save_the_search(self):
+        self.client.force_login(self.buyer)
+        self.assertContains(self.client.get(reverse('home'), {'q': 'lamp', 'category': 'Books'}), "Save this search")
+        self.assertNotContains(self.client.get(reverse('home')), "Save this search")
+
+
+class StartupImportTests(TestCase):
+    def test_worker_boot_leaves_rarely_used_modules_unloaded(self):
+        # A fresh interpreter, as a gunicorn worker: the app, the URLconf, every view and the URL index
+        script = (
+            "import os, sys; os.environ['DJANGO_SETTINGS_MODULE'] = 'student_trading.settings'; "
+            "import student_trading.wsgi; from django.urls import get_resolver, reverse; get_resolver().url_patterns; "
+            "reverse('home'); print(' '.join(sys.modules))"
+        )
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR,
+                                capture_output=True, text=True, check=True)
+        loaded = set(result.stdout.split())
+        self.assertIn('marketplace.views', loaded)
+        for module in ('numpy', 'marketplace.admin', 'marketplace.duplicates'):
+            self.assertNotIn(module, loaded)
+
+    def test_admin_is_loaded_on_first_use(self):
+        admin_user = make_user("staff", "1111111A")
+        CustomUser.objects.filter(pk=admin_user.pk).update(is_staff=True, is_superuser=True)
+        self.client.force_login(admin_user)
+        self.assertEqual(self.client.get(reverse('admin:marketplace_item_changelist')).status_code, 200)
+        self.assertEqual(resolve('/admin/marketplace/item/').url_name, 'marketplace_item_changelist')
+
+
+class HealthCheckTests(TestCase):
+    @override_settings(ALLOWED_HOSTS=['market.example.ac.uk'])
+    def test_liveness_skips_host_validation_and_the_database(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/healthz', HTTP_HOST='10.0.0.5')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'no-store')
+        self.assertNotIn('Set-Cookie', response)
+
+    def test_readiness(self):
+        with self.assertNumQueries(0):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'status': 'ready', 'checks': {'static': 'ok', 'cache': 'ok'}})
+
+    def test_not_ready_without_static_manifest(self):
+        static_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, static_root)
+        storages = dict(settings.STORAGES, staticfiles={
+            'BACKEND': 'marketplace.storage.CompressedManifestStaticFilesStorage'})
+        with override_settings(STATIC_ROOT=static_root, STORAGES=storages):
+            response = self.client.get('/readyz')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['status'], 'unavailable')
+        self.assertIn('collectstatic', response.json()['checks']['static'])
+
+    def test_production_settings_require_redis(self):
+        script = "import django, os; os.environ['DJANGO_SETTINGS_MODULE'] = 'student_trading.settings'; django.setup()"
+        env = {key: value for key, value in os.environ.items() if key not in ('REDIS_URL', 'DJANGO_LOCAL_STATE')}
+        env['DJANGO_DEBUG'] = '0'
+        result = subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=env,
+                                capture_output=True, text=True)
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn('ImproperlyConfigured: REDIS_URL must be set', result.stderr)
+        subprocess.run([sys.executable, '-c', script], cwd=settings.BASE_DIR, env=dict(env, DJANGO_LOCAL_STATE='1'),
+                       capture_output=True, check=True)
@@ -0,0 +1,215 @@
+"""
+Transaction state machine.
+
+    request_purchase / accept_offer --> Pending --confirm (buyer and seller)--> Sold --refund--> Refunded
+                                          |                                      ^
+                                          +--cancel--> Cancelled                 |
+    purchase_now ----------------------------------------------------------------+
+
+The buyer pays when the transaction is created: request_purchase, an
+accepted offer (at the offer's price) or purchase_now, the immediate sale.
+Cancel and refund give the money back.
+
+Every step is a conditional UPDATE on the row's current state, e.g.
+
+    UPDATE marketplace_transaction SET status = 'Sold', date_completed = ...
+    WHERE id = 7 AND status = 'Pending' AND buyer_confirmation AND seller_confirmation
+
+Of any number of concurrent requests, exactly one moves the row. Only that
+one runs the side effects: the item's status, the buyer's money, the sales
+rollup. The others update 0 rows and then read the row to learn why.
+
+Each applied step writes a TransactionEvent, which is the audit trail.
+Steps take an optional idempotency key. The forms post one, or a client
+can send an Idempotency-Key header. If a step with that key was already
+applied to the transaction, the call returns REPLAYED and does nothing
+again.
+
+A step's database transaction starts with its UPDATE. On SQLite the write
+lock is therefore taken first. Concurrent steps then wait on the busy
+timeout instead of failing a read-to-write lock upgrade with "database is
+locked".
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from . import analytics, live
+from .models import CustomUser, Item, ItemChangeLog, Offer, Transaction, TransactionEvent
+
+APPLIED = 'applied'            # this call moved the transaction
+ALREADY_DONE = 'already_done'  # it was already in the requested state
+REPLAYED = 'replayed'          # a step with this idempotency key was applied before
+
+
+class TransitionError(Exception):
+    """The user may not take this step, or the transaction's status no longer allows it."""
+
+
+def _replayed(transaction_row, idempotency_key):
+    return bool(idempotency_key) and TransactionEvent.objects.filter(
+        transaction_id=transaction_row.pk, idempotency_key=idempotency_key,
+    ).exists()
+
+
+def _record(transaction_row, action, from_status, to_status, actor, idempotency_key=None):
+    TransactionEvent.objects.create(
+        transaction_id=transaction_row.pk, action=action, from_status=from_status, to_status=to_status,
+        actor=actor, idempotency_key=idempotency_key or None,
+    )
+
+
+def _current_status(transaction_row):
+    return Transaction.objects.values_list('status', flat=True).get(pk=transaction_row.pk)
+
+
+def _move_item(item_id, from_statuses, to_status):
+    """Move the item through Item.save() so wishlist and live-update signals still fire."""
+    item = Item.objects.select_for_update().get(pk=item_id)
+    if item.status in from_statuses:
+        item.status = to_status
+        item.save(update_fields=['status'])
+    return item
+
+
+def _refresh(transaction_row):
+    transaction_row.refresh_from_db(fields=['status', 'buyer_confirmation', 'seller_confirmation', 'date_completed'])
+    transaction_row._loaded_status = transaction_row.status
+
+
+def _seller_id(transaction_row):
+    return Item.objects.values_list('seller_id', flat=True).get(pk=transaction_row.item_id)
+
+
+def request_purchase(item, buyer, price=None):
+    """
+    Reserve an Available item for `buyer` and take payment, returning the
+    Pending transaction. Of two buyers racing for the same item, one gets it.
+    `price` is an agreed price (an accepted offer); by default the item's.
+    """
+    with transaction.atomic():
+        if not Item.objects.filter(pk=item.pk, status='Available').update(status='Pending'):
+            raise TransitionError("This item is no longer available.")
+        if price is None:
+            # The price as it is now the row is reserved, not as the buyer's page showed it
+            price = Item.objects.values_list('price', flat=True).get(pk=item.pk)
+        if not buyer.withdraw(price):
+            raise TransitionError("Insufficient balance to request this item.")
+        transaction_row = Transaction.objects.create(buyer=buyer, item=item, total_price=price, status='Pending')
+        record_created(transaction_row, buyer)
+        live.publish_status([item.pk], 'Pending')
+    item.status = 'Pending'
+    item._snapshot_watched_fields()
+    return transaction_row
+
+
+def accept_offer(offer, seller):
+    """
+    The seller accepts a pending offer: the item is reserved for the offer's
+    buyer at the offer's price, as request_purchase would, and the Pending
+    transaction is returned. Nothing changes unless all of it succeeds.
+    """
+    if seller.pk != offer.item.seller_id:
+        raise TransitionError("Only the seller can accept this offer.")
+    with transaction.atomic():
+        if not Offer.objects.filter(pk=offer.pk, status='Pending').update(status='Accepted'):
+            raise TransitionError("This offer is no longer pending.")
+        transaction_row = request_purchase(offer.item, offer.buyer, price=offer.price)
+    offer.status = 'Accepted'
+    return transaction_row
+
+
+def purchase_now(item, buyer):
+    """
+    Sell an Available item to `buyer` outright, returning the Sold
+    transaction. Of two buyers racing for the same item, one gets it.
+    """
+    with transaction.atomic():
+        if not Item.objects.filter(pk=item.pk, status='Available').update(status='Sold'):
+            raise TransitionError("This item is no longer available.")
+        price = Item.objects.values_list('price', flat=True).get(pk=item.pk)
+        if not buyer.withdraw(price):
+            raise TransitionError("Insufficient balance to complete the purchase.")
+        # Created Sold, so the post_save receiver rolls the sale up (analytics.record_sale)
+        transaction_row = Transaction.objects.create(buyer=buyer, item=item, total_price=price, status='Sold',
+                                                     date_completed=timezone.now())
+        record_created(transaction_row, buyer)
+        # update() skips Item.save(), which would have logged the sale for wishlist watchers
+        ItemChangeLog.objects.create(item_id=item.pk, kind='sold')
+        live.publish_status([item.pk], 'Sold')
+    item.status = 'Sold'
+    item._snapshot_watched_fields()
+    return transaction_row
+
+
+def confirm(transaction_row, user, idempotency_key=None):
+    """Record the buyer's or the seller's confirmation. The second confirmation completes the sale."""
+    if _replayed(transaction_row, idempotency_key):
+        return REPLAYED
+    if user.pk == transaction_row.buyer_id:
+        party = 'buyer'
+    elif user.pk == _seller_id(transaction_row):
+        party = 'seller'
+    else:
+        raise TransitionError("Only the buyer or the seller can confirm this transaction.")
+    flag = f'{party}_confirmation'
+
+    pending = Transaction.objects.filter(pk=transaction_row.pk, status='Pending')
+    with transaction.atomic():
+        confirmed = pending.filter(**{flag: False}).update(**{flag: True})
+        if confirmed:
+            _record(transaction_row, f'{party}_confirmed', 'Pending', 'Pending', user, idempotency_key)
+        completed = pending.filter(buyer_confirmation=True, seller_confirmation=True) \
+            .update(status='Sold', date_completed=timezone.now())
+        if completed:
+            _record(transaction_row, 'completed', 'Pending', 'Sold', user)
+            transaction_row.item = _move_item(transaction_row.item_id, ('Available', 'Pending'), 'Sold')
+            # QuerySet.update() sends no post_save, so roll the sale up here
+            analytics.record_sale(transaction_row)
+        elif not confirmed and _current_status(transaction_row) not in ('Pending', 'Sold'):
+            raise TransitionError("This transaction can no longer be confirmed.")
+    _refresh(transaction_row)
+    return APPLIED if confirmed or completed else ALREADY_DONE
+
+
+def cancel(transaction_row, user, idempotency_key=None):
+    """Either party backs out of a pending transaction: the buyer is repaid and the item goes back on sale."""
+    if _replayed(transaction_row, idempotency_key):
+        return REPLAYED
+    if user.pk not in (transaction_row.buyer_id, _seller_id(transaction_row)):
+        raise TransitionError("Only the buyer or the seller can cancel this transaction.")
+
+    with transaction.atomic():
+        cancelled = Transaction.objects.filter(pk=transaction_row.pk, status='Pending').update(status='Cancelled')
+        if cancelled:
+            _record(transaction_row, 'cancelled', 'Pending', 'Cancelled', user, idempotency_key)
+            CustomUser(pk=transaction_row.buyer_id).deposit(transaction_row.total_price)
+            _move_item(transaction_row.item_id, ('Pending',), 'Available')
+        elif _current_status(transaction_row) != 'Cancelled':
+            raise TransitionError("Only pending transactions can be cancelled.")
+    _refresh(transaction_row)
+    return APPLIED if cancelled else ALREADY_DONE
+
+
+def refund(transaction_row, user, idempotency_key=None):
+    """The seller (or staff) refunds a completed sale: the buyer is credited and the item is relisted."""
+    if _replayed(transaction_row, idempotency_key):
+        return REPLAYED
+    if not (user.is_staff or user.pk == _seller_id(transaction_row)):
+        raise TransitionError("Only the seller can refund this transaction.")
+
+    with transaction.atomic():
+        refunded = Transaction.objects.filter(pk=transaction_row.pk, status='Sold').update(status='Refunded')
+        if refunded:
+            _record(transaction_row, 'refunded', 'Sold', 'Refunded', user, idempotency_key)
+            CustomUser(pk=transaction_row.buyer_id).deposit(transaction_row.total_price)
+            transaction_row.item = _move_item(transaction_row.item_id, ('Sold',), 'Available')
+            analytics.record_refund(transaction_row)
+        elif _current_status(transaction_row) != 'Refunded':
+            raise TransitionError("Only completed sales can be refunded.")
+    _refresh(transaction_row)
+    return APPLIED if refunded else ALREADY_DONE
+
+
+def record_created(transaction_row, actor):
+    """First audit entry for a transaction created directly in its starting state."""
+    _record(transaction_row, 'created', '', transaction_row.status, actor)
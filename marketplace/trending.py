@@ -0,0 +1,149 @@
+"""
+Trending score engine for the featured carousel and the "trending" sort on home.
+
+Scores are recomputed periodically (`manage.py compute_trending` or the
+refresh_trending task) for every available item in one vectorized NumPy pass
+and written to TrendingItem with a dense rank.
+
+Reads walk the rank index in order (rank_order): each ranked row is checked
+against home's current filters with a primary-key probe, and the matching
+items are loaded a chunk at a time. The first rows cost the same whatever the
+filters; a filter that few ranked items pass walks further down the index.
+Items listed since the last run have no rank and come after the ranked ones.
+
+    activity = W_VIEWS * log1p(views)
+             + W_WISHLISTS * sum(decay(wishlist age))
+             + W_OFFERS * sum(decay(offer age))
+    score    = (1 + activity) * decay(item age)
+
+where decay(age) = 0.5 ** (age / half-life).
+
+NumPy is imported by the functions that score, not by the module: web
+workers import this module for featured_items() and should not pay for
+loading NumPy at startup.
+"""
+from datetime import timedelta
+from itertools import islice
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .models import Item, Offer, TrendingItem, Wishlist
+
+W_VIEWS = 1.0
+W_WISHLISTS = 2.0
+W_OFFERS = 4.0
+ITEM_HALF_LIFE_HOURS = 72
+EVENT_HALF_LIFE_HOURS = 24
+# Wishlist adds and offers older than this no longer contribute
+EVENT_WINDOW = timedelta(days=14)
+# Ranked items are loaded this many at a time
+RANK_CHUNK_SIZE = 500
+
+
+def _hours_between(now, timestamps):
+    import numpy as np
+
+    return np.fromiter(((now - t).total_seconds() / 3600 for t in timestamps), dtype=np.float64)
+
+
+def _decayed_event_counts(item_ids, events, now):
+    """Sum of per-event decay weights for each id in the sorted `item_ids` array."""
+    import numpy as np
+
+    totals = np.zeros(len(item_ids))
+    events = list(events)
+    if not events or not len(item_ids):
+        return totals
+    event_items = np.fromiter((item_id for item_id, _ in events), dtype=np.int64)
+    weights = 0.5 ** (_hours_between(now, (at for _, at in events)) / EVENT_HALF_LIFE_HOURS)
+
+    positions = np.searchsorted(item_ids, event_items)
+    positions = np.minimum(positions, len(item_ids) - 1)
+    known = item_ids[positions] == event_items  # events on items that are no longer available drop out
+    np.add.at(totals, positions[known], weights[known])
+    return totals
+
+
+def compute_scores(now=None):
+    """Return (item_ids, scores) as NumPy arrays for every available item, ids ascending."""
+    import numpy as np
+
+    now = now or timezone.now()
+    rows = list(Item.objects.filter(status='Available').order_by('id').values_list('id', 'created_at', 'views'))
+    if not rows:
+        return np.array([], dtype=np.int64), np.array([])
+
+    item_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+    age_hours = np.maximum(_hours_between(now, (row[1] for row in rows)), 0)
+    views = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+
+    since = now - EVENT_WINDOW
+    wishlists = _decayed_event_counts(
+        item_ids, Wishlist.objects.filter(added_at__gte=since).values_list('item_id', 'added_at'), now)
+    offers = _decayed_event_counts(
+        item_ids, Offer.objects.filter(created_at__gte=since).values_list('item_id', 'created_at'), now)
+
+    activity = W_VIEWS * np.log1p(views) + W_WISHLISTS * wishlists + W_OFFERS * offers
+    scores = (1 + activity) * 0.5 ** (age_hours / ITEM_HALF_LIFE_HOURS)
+    return item_ids, scores
+
+
+def refresh_trending(now=None):
+    """Recompute all scores and replace the ranked table atomically. Returns the number of ranked items."""
+    import numpy as np
+
+    now = now or timezone.now()
+    item_ids, scores = compute_scores(now)
+    # Highest score first; ties go to the newer item (larger id)
+    order = np.lexsort((-item_ids, -scores))
+    ranked = [
+        TrendingItem(item_id=int(item_ids[i]), score=float(scores[i]), rank=rank, computed_at=now)
+        for rank, i in enumerate(order, start=1)
+    ]
+    with transaction.atomic():
+        TrendingItem.objects.all().delete()
+        TrendingItem.objects.bulk_create(ranked, batch_size=1000)
+    return len(ranked)
+
+
+def rank_order(items):
+    """TrendingItem rows of the items in `items` (an Item queryset), best first, read off the rank index."""
+    return TrendingItem.objects.filter(Exists(items.filter(pk=OuterRef('item_id')))).order_by('rank')
+
+
+def ranked_items(items, chunk_size=RANK_CHUNK_SIZE):
+    """
+    The items in `items` that have a rank, best first. They are loaded
+    through `items`, so its annotations and select_related carry over.
+    """
+    ranks = rank_order(items).values_list('rank', 'item_id')
+    last_rank = 0
+    while True:
+        chunk = list(ranks.filter(rank__gt=last_rank)[:chunk_size])
+        if not chunk:
+            return
+        last_rank = chunk[-1][0]
+        by_id = items.in_bulk([item_id for _, item_id in chunk])
+        yield from (by_id[item_id] for _, item_id in chunk if item_id in by_id)
+
+
+class TrendingRows:
+    """Home's trending sort: the ranked items, then the unranked ones newest first."""
+
+    def __init__(self, items):
+        self.items = items
+
+    def __bool__(self):
+        return self.items.exists()
+
+    def __iter__(self):
+        yield from ranked_items(self.items)
+        yield from self.items.filter(trending__isnull=True).order_by('-created_at').iterator(chunk_size=RANK_CHUNK_SIZE)
+
+
+def featured_items(items, limit=5):
+    """Top trending items in `items` that have a picture."""
+    with_image = items.exclude(image__isnull=True).exclude(image="")
+    return list(islice(ranked_items(with_image, chunk_size=limit), limit))
@@ -6,10 +6,14 @@ from .views import send_message, message_center  # 确保 send_message 已导入
 urlpatterns = [
     # Home and Authentication
     path('', views.home, name='home'),
+    path('live/items/', views.live_items, name='live_items'),
     path('register/', views.register, name='register'),
     path('login/', views.user_login, name='login'),
     path('logout/', LogoutView.as_view(next_page='home'), name='logout'),
     path('admin_dashboard/', views.admin_dashboard, name='admin_dashboard'),
+    path('moderation/', views.moderation_queue, name='moderation_queue'),
+    path('exports/<str:name>/', views.download_export, name='download_export'),
+    path('export/<str:kind>/', views.export_rows, name='export_rows'),
     # Item Management
     path('add_item/', views.add_item, name='add_item'),
     path('item/<int:item_id>/', views.item_detail, name='item_detail'),
@@ -27,11 +31,14 @@ urlpatterns = [
 
     # Transaction Management
     path('confirm_transaction/<int:transaction_id>/', views.confirm_transaction, name='confirm_transaction'),
+    path('cancel_transaction/<int:transaction_id>/', views.cancel_transaction, name='cancel_transaction'),
+    path('refund_transaction/<int:transaction_id>/', views.refund_transaction, name='refund_transaction'),
 
     path('make_offer/<int:item_id>/', views.make_offer, name='make_offer'),
     path('accept_offer/<int:offer_id>/', views.accept_offer, name='accept_offer'),
     path('reject_offer/<int:offer_id>/', views.reject_offer, name='reject_offer'),
     path('my_listings/', views.my_listings, name='my_listings'),
+    path('my_listings/analytics/', views.seller_analytics, name='seller_analytics'),
     path('profile/edit/', profile_edit, name='profile_edit'),
     path('messages/', message_center, name='message_center'),
 
@@ -46,10 +53,19 @@ urlpatterns = [
     path('item/<int:item_id>/confirm_purchase/', views.confirm_purchase, name='confirm_purchase'),
     path('item/<int:item_id>/process_purchase/', views.process_purchase, name='process_purchase'),
     path('purchase_history/', views.purchase_history, name='purchase_history'),
+    path('purchase_history/export/', views.export_purchase_history, name='export_purchase_history'),
 
     path('cart/add/<int:item_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/', views.view_cart, name='cart'),
 
+    path('wishlist/', views.view_wishlist, name='wishlist'),
+    path('wishlist/add/<int:item_id>/', views.add_to_wishlist, name='add_to_wishlist'),
+    path('wishlist/remove/<int:wishlist_id>/', views.remove_from_wishlist, name='remove_from_wishlist'),
+
+    path('saved_searches/', views.view_saved_searches, name='saved_searches'),
+    path('saved_searches/save/', views.save_search, name='save_search'),
+    path('saved_searches/<int:search_id>/delete/', views.delete_saved_search, name='delete_saved_search'),
+
 # Messaging System
     path("messages/", message_center, name="message_center"),
     path("messages/<int:receiver_id>/", message_center, name="message_center_with_id"),
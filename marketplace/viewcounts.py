@@ -0,0 +1,171 @@
+"""
+Buffered item view counters.
+
+item_detail calls record_view(); the hit is added to an in-memory (or Redis)
+buffer and written out in batches as
+
+    UPDATE marketplace_item SET views = views + n WHERE id IN (...)
+
+with one UPDATE per distinct increment, then folded into the seller rollup.
+A flush happens when VIEW_FLUSH_INTERVAL seconds have passed since the last
+one, when the local buffer holds VIEW_BUFFER_MAX_ITEMS items, on interpreter exit,
+and whenever `manage.py flush_view_counts` runs (use that from cron with the
+Redis buffer).
+
+Repeat views of the same item from the same session within
+VIEW_DEDUPE_SECONDS are not counted.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from . import analytics
+from .models import Item
+from .routers import writes_without_pinning
+
+logger = logging.getLogger(__name__)
+
+
+def apply_counts(counts):
+    """Write a {item_id: n} batch: item totals plus the seller rollup, in one transaction."""
+    by_increment = defaultdict(list)
+    for item_id, n in counts.items():
+        by_increment[n].append(item_id)
+    with writes_without_pinning(), transaction.atomic():
+        for n, item_ids in by_increment.items():
+            Item.objects.filter(id__in=item_ids).update(views=F('views') + n)
+        analytics.apply_view_counts(counts)
+
+
+class LocalViewBuffer:
+    """Per-process buffer. Increments survive failed flushes by being merged back."""
+
+    def __init__(self, flush_interval, max_items):
+        self.flush_interval = flush_interval
+        self.max_items = max_items
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.last_flush = time.monotonic()
+
+    def add(self, item_id, n=1):
+        with self.lock:
+            self.counts[item_id] += n
+            due = (len(self.counts) >= self.max_items
+                   or time.monotonic() - self.last_flush >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def pending(self):
+        with self.lock:
+            return sum(self.counts.values())
+
+    def flush(self):
+        with self.lock:
+            counts, self.counts = self.counts, Counter()
+            self.last_flush = time.monotonic()
+        if not counts:
+            return 0
+        try:
+            apply_counts(counts)
+        except Exception:
+            logger.exception("Flushing %d item view counts failed; keeping them for the next flush", len(counts))
+            with self.lock:
+                self.counts.update(counts)
+            return 0
+        return sum(counts.values())
+
+
+class RedisViewBuffer:
+    """
+    Buffer shared by every worker in a Redis hash. A flush atomically renames
+    the hash first, so increments arriving during the flush go to a fresh one.
+    """
+    KEY = 'marketplace:item_views'
+
+    def __init__(self, url, flush_interval):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+        self.flush_interval = flush_interval
+        self.last_flush = time.monotonic()
+
+    def add(self, item_id, n=1):
+        self.client.hincrby(self.KEY, item_id, n)
+        if time.monotonic() - self.last_flush >= self.flush_interval:
+            self.flush()
+
+    def pending(self):
+        return sum(int(n) for n in self.client.hvals(self.KEY))
+
+    def flush(self):
+        self.last_flush = time.monotonic()
+        batch_key = f"{self.KEY}:flushing:{uuid.uuid4().hex}"
+        try:
+            self.client.rename(self.KEY, batch_key)
+        except Exception:  # redis.ResponseError: nothing buffered
+            return 0
+        counts = {int(item_id): int(n) for item_id, n in self.client.hgetall(batch_key).items()}
+        try:
+            apply_counts(counts)
+        except Exception:
+            logger.exception("Flushing %d item view counts failed; returning them to Redis", len(counts))
+            pipe = self.client.pipeline()
+            for item_id, n in counts.items():
+                pipe.hincrby(self.KEY, item_id, n)
+            pipe.delete(batch_key)
+            pipe.execute()
+            return 0
+        self.client.delete(batch_key)
+        return sum(counts.values())
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                interval = getattr(settings, 'VIEW_FLUSH_INTERVAL', 30)
+                if getattr(settings, 'VIEW_COUNTER_BACKEND', 'local') == 'redis':
+                    _buffer = RedisViewBuffer(settings.REDIS_URL, interval)
+                else:
+                    _buffer = LocalViewBuffer(interval, getattr(settings, 'VIEW_BUFFER_MAX_ITEMS', 1000))
+                atexit.register(shutdown)
+    return _buffer
+
+
+def shutdown():
+    """Flush whatever is buffered; registered with atexit so a graceful stop loses nothing."""
+    if _buffer is not None:
+        _buffer.flush()
+
+
+def viewer_key(request):
+    session_key = getattr(request, 'session', None) and request.session.session_key
+    if session_key:
+        return session_key
+    # Anonymous visitors have no session until something is stored in it
+    anonymous = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return hashlib.md5(anonymous.encode()).hexdigest()
+
+
+def record_view(request, item):
+    """Count a view of `item` unless this viewer already viewed it within the dedupe window."""
+    dedupe_key = f"viewed:{item.id}:{viewer_key(request)}"
+    # cache.add is atomic and only succeeds for the first view in the window
+    if not cache.add(dedupe_key, 1, getattr(settings, 'VIEW_DEDUPE_SECONDS', 1800)):
+        return False
+    get_view_buffer().add(item.id)
+    return True
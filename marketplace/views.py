@@ -4,13 +4,24 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import FileResponse, Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
 from .models import Item, ItemImage, Transaction, Review, Report, UserRating, CustomUser, Offer, Cart, Wishlist, Message
 from .forms import CustomUserCreationForm, ItemForm, ReportForm
 import re
+import uuid
+from decimal import Decimal, InvalidOperation
 from django.db.models import Q
+from django.core.paginator import Paginator
 from django.contrib.admin.views.decorators import staff_member_required
 from .forms import CustomUserForm
+from .ratelimit import rate_limit
+from .routers import read_from_replica
+from .streaming import StreamedRows, empty_row, stream_template
+from . import analytics, archive, exports, facets, geo, live, saved_searches, tasks, transitions, trending, viewcounts
+from .moderation import MODERATION_ACTIONS, apply_action, attach_items, auto_hide_threshold, grouped_reports
+
+WISHLIST_PAGE_SIZE = 20
+MODERATION_PAGE_SIZE = 50
 
 
 
@@ -49,6 +60,7 @@ def add_item(request):
 
 # Report an item for inappropriate content
 @login_required
+@rate_limit('5/h')
 def report_item(request, item_id):
     item = get_object_or_404(Item, id=item_id)
     if request.method == 'POST':
@@ -56,31 +68,57 @@ def report_item(request, item_id):
         if form.is_valid():
             report = form.save(commit=False)
             report.reported_by = request.user
-            report.item = item
+            report.reported_item = item
             report.save()
+            tasks.check_report_threshold.delay(item.id)
             messages.success(request, "Your report has been submitted.")
             return redirect('home')
     else:
         form = ReportForm()
     return render(request, 'marketplace/report_item.html', {'form': form, 'item': item})
 
+def _transaction_step(request, transaction_id, step, done_message):
+    """Run one marketplace.transitions step from a POSTed form, then go back to where the form was."""
+    transaction = get_object_or_404(Transaction.objects.select_related('item'), id=transaction_id)
+    back = redirect('item_detail', item_id=transaction.item_id) if request.user == transaction.item.seller \
+        else redirect('purchase_history')
+    if request.method != 'POST':
+        return back
+    idempotency_key = request.POST.get('idempotency_key') or request.headers.get('Idempotency-Key')
+    try:
+        outcome = step(transaction, request.user, idempotency_key=idempotency_key)
+    except transitions.TransitionError as error:
+        messages.error(request, str(error))
+    else:
+        if outcome == transitions.APPLIED:
+            messages.success(request, done_message)
+        else:
+            messages.info(request, "That has already been done.")
+    return back
+
+
 # Confirm transaction completion by both buyer and seller
 @login_required
 def confirm_transaction(request, transaction_id):
-    transaction = get_object_or_404(Transaction, id=transaction_id)
+    return _transaction_step(request, transaction_id, transitions.confirm, "Transaction confirmed.")
 
-    # Only the buyer or seller can confirm the transaction
-    if request.user == transaction.buyer or request.user == transaction.item.seller:
-        transaction.status = "Sold"
-        transaction.save()
-        messages.success(request, "Transaction successfully confirmed.")
 
-    return redirect('home')
+@login_required
+def cancel_transaction(request, transaction_id):
+    return _transaction_step(request, transaction_id, transitions.cancel,
+                             "Transaction cancelled and the buyer repaid.")
+
+
+@login_required
+def refund_transaction(request, transaction_id):
+    return _transaction_step(request, transaction_id, transitions.refund,
+                             "Sale refunded and the item relisted.")
 
 # Home page with search and filters
+@read_from_replica
 def home(request):
     query = request.GET.get('q', '').strip()
-    category = request.GET.get('category', '').strip()
+    sort = request.GET.get('sort', '').strip()
 
     # Base queryset (Available items only)
     items = Item.objects.filter(status="Available").order_by('-created_at')
@@ -89,26 +127,60 @@ def home(request):
     if query:
         items = items.filter(Q(name__icontains=query) | Q(description__icontains=query))
 
-    if category:
-        items = items.filter(category=category)
-
-    # Ensure featured items only include those with images
-    featured_items = items.exclude(image__isnull=True).exclude(image="")[:5]
-
-    # Extract categories dynamically
-    categories = [choice[0] for choice in Item.CATEGORY_CHOICES]
+    # Items near a campus building (or the user's own address), nearest first
+    near = geo.NearSelection(request.GET, request.user)
+    items = near.filter(items)
+    if near.origin is not None and sort != 'trending':
+        items = items.order_by('distance', '-created_at')
+
+    # Facet filters (category, price band, seller rating, photo) with live counts
+    selection = facets.FacetSelection(request.GET)
+    facet_panel = facets.facet_counts(items, selection, request.GET)
+    items = selection.filter(items).select_related('seller')
+
+    # Featured carousel: top trending items with images among the filtered items,
+    # newest with images until the first ranking run
+    featured_items = trending.featured_items(items, limit=5)
+    if not featured_items:
+        featured_items = items.exclude(image__isnull=True).exclude(image="")[:5]
+
+    if sort == 'trending':
+        # Read in rank order off the precomputed trending table; unranked (brand new) items go last
+        rows = trending.TrendingRows(items)
+    else:
+        rows = items.distinct()  # Ensure unique results
 
     unread_messages_count = 0
     if request.user.is_authenticated:
         unread_messages_count = Message.objects.filter(receiver=request.user, is_read=False).count()
 
-    return render(request, "marketplace/home.html", {
-        "items": items.distinct(),  # Ensure unique results
+    return stream_template(request, "marketplace/home.html", {
+        "items": StreamedRows(
+            rows, "marketplace/partials/item_card.html", "item",
+            empty_html='<p class="text-center text-light">No items available.</p>',
+        ),
         "featured_items": featured_items,
-        "categories": categories,
+        "facets": facet_panel,
+        "near": near,
+        "live_last_event_id": live.latest_event_id(),
+        "places": geo.GAZETTEER,
+        "radius_choices": geo.RADIUS_CHOICES,
+        "sort": sort,
+        # A search can be saved with its query and at most one category
+        "saved_search_category": selection.category[0] if len(selection.category) == 1 else '',
+        "can_save_search": len(selection.category) <= 1 and bool(query or selection.category),
         "unread_messages_count": unread_messages_count
     })
 
+def live_items(request):
+    """Server-sent events with new listings and status/price changes for home (marketplace.live)."""
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id', '')
+    response = StreamingHttpResponse(live.event_stream(last_event_id), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # stop nginx from buffering the stream
+    return response
+
+
 def user_login(request):
     if request.method == "POST":
         form = AuthenticationForm(data=request.POST)
@@ -131,9 +203,6 @@ def user_login(request):
 
 
 
-from django.contrib.auth.decorators import login_required
-from django.shortcuts import redirect, render
-from .models import CustomUser, Item
 
 @login_required
 def admin_dashboard(request):
@@ -141,16 +210,77 @@ def admin_dashboard(request):
         return redirect('home')  # 不是管理员则跳转到普通用户界面
 
     users = CustomUser.objects.all()  # 获取所有用户
-    items = Item.objects.all()  # 获取所有商品
-    transactions = Transaction.objects.all()  # 获取所有交易记录
+    items = Item.objects.select_related('seller')  # 获取所有商品
+    transactions = Transaction.objects.select_related('buyer', 'item')  # 获取所有交易记录
+
+    return stream_template(request, "marketplace/admin_dashboard.html", {
+        "users": StreamedRows(users, "marketplace/partials/admin_user_row.html", "user",
+                              empty_html=empty_row(5, "No users found.")),
+        "items": StreamedRows(items, "marketplace/partials/admin_item_row.html", "item",
+                              empty_html=empty_row(6, "No items available.")),
+        "transactions": StreamedRows(transactions, "marketplace/partials/admin_transaction_row.html", "transaction",
+                                     empty_html=empty_row(5, "No transactions found.")),  # 传递交易数据
+        "export_kinds": list(exports.STREAMED_EXPORTS),
+        "export_formats": exports.formats(),
+    })
 
-    return render(request, "marketplace/admin_dashboard.html", {
-        "users": users,
-        "items": items,
-        "transactions": transactions,  # 传递交易数据
+
+@staff_member_required
+def moderation_queue(request):
+    """ Open reports grouped by item, with bulk dismiss / hide """
+    if request.method == "POST":
+        action = request.POST.get("action")
+        item_ids = [int(i) for i in request.POST.getlist("item_ids") if i.isdigit()]
+        if action in MODERATION_ACTIONS and item_ids:
+            closed = apply_action(item_ids, action)
+            tasks.notify_wishlist_watchers.delay()
+            messages.success(request, f"{closed} reports closed.")
+        else:
+            messages.error(request, "Select at least one item and an action.")
+        return redirect('moderation_queue')
+
+    page = Paginator(grouped_reports(), MODERATION_PAGE_SIZE).get_page(request.GET.get('page'))
+    return render(request, "marketplace/moderation_queue.html", {
+        "rows": attach_items(page.object_list),
+        "page_obj": page,
+        "threshold": auto_hide_threshold(),
     })
 
 
+@staff_member_required
+def download_export(request, name):
+    """ A CSV written by the admin's background export (marketplace.exports) """
+    path = exports.export_path(name)
+    storage = exports.export_storage()
+    if path is None or not storage.exists(path):
+        raise Http404("No such export.")
+    return FileResponse(storage.open(path, 'rb'), as_attachment=True, filename=name,
+                        content_type='text/csv')
+
+
+def _export_params(request):
+    """(start, end, format) of an export request; ValueError for a bad date or an unavailable format."""
+    start, end = exports.date_range(request.GET)
+    file_format = request.GET.get('format', 'csv')
+    if file_format not in exports.formats():
+        raise ValueError(f"Export format {file_format!r} is not available.")
+    return start, end, file_format
+
+
+@staff_member_required
+@read_from_replica
+def export_rows(request, kind):
+    """ Streamed CSV/XLSX of every transaction, offer or item, optionally within ?from=&to= """
+    if kind not in exports.STREAMED_EXPORTS:
+        raise Http404("No such export.")
+    try:
+        start, end, file_format = _export_params(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    return exports.export_response(exports.streamed_rows(kind, start, end), exports.STREAMED_EXPORTS[kind].columns,
+                                   kind, file_format)
+
+
 # User Logout
 @login_required
 def user_logout(request):
@@ -161,41 +291,44 @@ def user_logout(request):
 # Buy an item
 @login_required
 def buy_item(request, item_id):
-    item = get_object_or_404(Item, id=item_id)
+    item = get_object_or_404(Item, id=item_id, status='Available')
 
     # Prevent self-purchase
     if item.seller == request.user:
         messages.error(request, "You cannot buy your own item!")
         return redirect('home')
 
-    # Ensure item availability
-    if item.status != "Available":
-        messages.error(request, "This item is no longer available.")
+    # Reserve the item and take payment; both parties then confirm (marketplace.transitions)
+    try:
+        transitions.request_purchase(item, request.user)
+    except transitions.TransitionError as error:
+        messages.error(request, str(error))
         return redirect('home')
 
-    # Create transaction
-    Transaction.objects.create(
-        buyer=request.user,
-        item=item,
-        total_price=item.price,
-        status='Pending'
-    )
-
-    # Update item status
-    item.status = 'Pending'
-    item.save()
-
     messages.success(request, "Purchase request submitted successfully!")
     return redirect('home')
 
 # View item details
+@read_from_replica
 def item_detail(request, item_id):
     item = get_object_or_404(Item, id=item_id)
+    # Hidden listings (moderated or duplicate) are only shown to their seller and staff
+    if item.status == 'Hidden' and not (request.user.pk == item.seller_id or request.user.is_staff):
+        raise Http404("No such item.")
     reviews = Review.objects.filter(item=item)
-    return render(request, 'items/item_detail.html', {'item': item, 'reviews': reviews})
+    viewcounts.record_view(request, item)
+    # The seller confirms, cancels or refunds the item's current transaction from here
+    open_transaction = None
+    if request.user.pk == item.seller_id:
+        open_transaction = Transaction.objects.filter(item=item, status__in=('Pending', 'Sold')) \
+            .order_by('-date_initiated').first()
+    return render(request, 'items/item_detail.html', {
+        'item': item, 'reviews': reviews, 'open_transaction': open_transaction, 'form_key': uuid.uuid4().hex,
+    })
 
 # Leave a review for an item
 @login_required
+@rate_limit('10/h')
 def leave_review(request, item_id):
     item = get_object_or_404(Item, id=item_id)
 
@@ -230,13 +363,14 @@ def mark_item_sold(request, item_id):
     messages.success(request, "Item marked as sold successfully!")
     return redirect('home')
 
+@read_from_replica
 def search_items(request):
     """Searches for items based on user input."""
     query = request.GET.get('query', '').strip()
 
     if query:
         items = Item.objects.filter(
-            Q(name__icontains=query) | Q(description__icontains=query)
+            Q(name__icontains=query) | Q(description__icontains=query), status='Available'
         )
         results = list(items.values('id', 'name', 'price', 'category', 'status'))
         return JsonResponse({'results': results})
@@ -245,7 +379,7 @@ def search_items(request):
 
 def search_results(request):
     query = request.GET.get('q')
-    results = Item.objects.filter(name__icontains=query) if query else []
+    results = Item.objects.filter(name__icontains=query, status='Available') if query else []
     return render(request, "marketplace/search_results.html", {"results": results, "query": query})
 
 @login_required
@@ -291,8 +425,9 @@ def delete_item(request, item_id):
 
 # Allow users to bid
 @login_required
+@rate_limit('10/m')
 def make_offer(request, item_id):
-    item = get_object_or_404(Item, id=item_id)
+    item = get_object_or_404(Item, id=item_id, status='Available')
 
     if request.method == "POST":
         price = request.POST.get("price")
@@ -305,15 +440,23 @@ def make_offer(request, item_id):
 # Bids accepted
 @login_required
 def accept_offer(request, offer_id):
-    offer = get_object_or_404(Offer, id=offer_id, item__seller=request.user)
-    offer.status = 'Accepted'
-    offer.save()
-
-    # Update product status
-    offer.item.status = 'Sold'
-    offer.item.save()
+    offer = get_object_or_404(Offer.objects.select_related('item', 'buyer'), id=offer_id, item__seller=request.user)
+    try:
+        # Reserves the item for the buyer at the offer's price; both then confirm as for any purchase
+        purchase = transitions.accept_offer(offer, request.user)
+    except transitions.TransitionError as error:
+        messages.error(request, str(error))
+        return redirect('item_detail', item_id=offer.item_id)
+
+    # Tell the buyer and close out competing offers in the background
+    tasks.notify_user.delay(
+        offer.buyer_id, f"Your offer of £{offer.price} for {offer.item.name} was accepted.", kind='offer',
+        item_id=offer.item_id, idempotency_key=f"offer:{offer.id}:accepted", priority=5,
+    )
+    tasks.reject_competing_offers.delay(offer.item_id, offer.id, idempotency_key=f"offer:{offer.id}:reject-others")
 
-    messages.success(request, "Offer accepted. The item is now sold.")
+    messages.success(request, f"Offer accepted. The item is reserved for {offer.buyer.username} "
+                              f"at £{purchase.total_price} until you both confirm.")
     return redirect('home')
 
 # Rejecting bids
@@ -345,6 +488,11 @@ def my_listings(request):
     items = Item.objects.filter(seller=request.user)
     return render(request, "marketplace/my_listings.html", {"items": items})
 
+@login_required
+def seller_analytics(request):
+    """Views, offers, sales and revenue for the seller's listings, from the daily rollup."""
+    return render(request, "marketplace/seller_analytics.html", analytics.seller_summary(request.user))
+
 @login_required
 def manage_offers(request, item_id):
     """Allows the seller to manage offers for their items."""
@@ -354,18 +502,90 @@ def manage_offers(request, item_id):
     return render(request, "marketplace/manage_offers.html", {"item": item, "offers": offers})
 
 def add_to_cart(request, item_id):
-    item = get_object_or_404(Item, id=item_id)
+    item = get_object_or_404(Item, id=item_id, status='Available')
     cart_item, created = Cart.objects.get_or_create(user=request.user, item=item)
     if not created:
         cart_item.quantity += 1
         cart_item.save()
     return redirect('cart')
 
+@login_required
 def add_to_wishlist(request, item_id):
     item = get_object_or_404(Item, id=item_id)
-    Wishlist.objects.get_or_create(user=request.user, item=item)
+
+    if item.seller == request.user:
+        messages.error(request, "You cannot add your own item to the wishlist.")
+        return redirect('item_detail', item_id=item.id)
+
+    _, created = Wishlist.objects.get_or_create(user=request.user, item=item)
+    if created:
+        messages.success(request, "Item added to your wishlist! We'll let you know if the price drops.")
+    else:
+        messages.info(request, "This item is already in your wishlist.")
     return redirect('wishlist')
 
+@login_required
+def remove_from_wishlist(request, wishlist_id):
+    Wishlist.objects.filter(id=wishlist_id, user=request.user).delete()
+    messages.success(request, "Item removed from your wishlist.")
+    return redirect('wishlist')
+
+@login_required
+def view_wishlist(request):
+    """ Paginated wishlist, plus unread price-drop / sold notifications """
+    wishlist_items = (
+        Wishlist.objects.filter(user=request.user)
+        .select_related('item', 'item__seller')
+        .order_by('-added_at')
+    )
+    page = Paginator(wishlist_items, WISHLIST_PAGE_SIZE).get_page(request.GET.get('page'))
+
+    unread = request.user.notifications.filter(is_read=False)
+    notifications = list(unread.select_related('item').order_by('-created_at')[:10])
+    if notifications:
+        unread.filter(id__in=[n.id for n in notifications]).update(is_read=True)
+
+    return render(request, "marketplace/wishlist.html", {
+        "wishlist_items": page.object_list,
+        "page_obj": page,
+        "notifications": notifications,
+    })
+
+
+@login_required
+def view_saved_searches(request):
+    """ The user's saved searches; matches arrive as notifications """
+    searches = request.user.saved_searches.order_by('-created_at')
+    return render(request, "marketplace/saved_searches.html", {"searches": searches})
+
+
+@login_required
+def save_search(request):
+    """ Save the home query (?q= and at most one category) posted from home """
+    if request.method != 'POST':
+        return redirect('saved_searches')
+    query = request.POST.get('q', '').strip()[:100]
+    category = request.POST.get('category', '')
+    if category not in dict(Item.CATEGORY_CHOICES):
+        category = ''
+    if not query and not category:
+        messages.error(request, "Search for something or pick a category before saving the search.")
+        return redirect('home')
+    search, created = saved_searches.save_search(request.user, query, category)
+    if created:
+        messages.success(request, f'Saved "{search.describe()}". We will let you know about new listings.')
+    else:
+        messages.info(request, f'You have already saved "{search.describe()}".')
+    return redirect('saved_searches')
+
+
+@login_required
+def delete_saved_search(request, search_id):
+    if request.method == 'POST':
+        request.user.saved_searches.filter(id=search_id).delete()
+        messages.success(request, "Saved search removed.")
+    return redirect('saved_searches')
+
 def send_message(request, seller_id):
     seller = get_object_or_404(CustomUser, id=seller_id)
     if request.method == "POST":
@@ -391,20 +611,19 @@ def profile_edit(request):
 def profile_view(request):
     return render(request, "marketplace/profile.html")
 
-from decimal import Decimal
 @login_required
+@rate_limit('5/m')
 def deposit(request):
     if request.method == "POST":
         amount = request.POST.get("amount")
         try:
             amount = Decimal(amount)
             if amount > 0:
-                request.user.balance += amount
-                request.user.save()
+                request.user.deposit(amount)
                 messages.success(request, f"Successfully deposited ${amount:.2f}!")
             else:
                 messages.error(request, "Deposit amount must be greater than zero.")
-        except ValueError:
+        except (InvalidOperation, TypeError):
             messages.error(request, "Invalid amount entered.")
     return redirect('profile_view')
 
@@ -415,9 +634,14 @@ def update_address(request):
     if request.method == "POST":
         address = request.POST.get("address")
         if address:
-            request.user.address = address
-            request.user.save()
-            messages.success(request, "Your address has been updated!")
+            if request.user.update_address(address):
+                messages.success(request, "Your address has been updated!")
+            else:
+                messages.warning(
+                    request,
+                    "Your address has been updated, but it doesn't name a campus building or hall, "
+                    "so your items won't appear in \"near me\" searches.",
+                )
         else:
             messages.error(request, "Address cannot be empty.")
     return redirect('profile_view')
@@ -426,7 +650,7 @@ def update_address(request):
 @login_required
 def confirm_purchase(request, item_id):
     """ 显示确认购买页面 """
-    item = get_object_or_404(Item, id=item_id)
+    item = get_object_or_404(Item, id=item_id, status='Available')
     if item.seller == request.user:
         messages.error(request, "You cannot buy your own item.")
         return redirect('item_detail', item_id=item.id)
@@ -438,7 +662,7 @@ def confirm_purchase(request, item_id):
 @login_required
 def process_purchase(request, item_id):
     """ 处理购买逻辑 """
-    item = get_object_or_404(Item, id=item_id)
+    item = get_object_or_404(Item, id=item_id, status='Available')
     
     # 检查是否是卖家自己
     if item.seller == request.user:
@@ -448,26 +672,20 @@ def process_purchase(request, item_id):
     if request.method == "POST":
         address = request.POST.get("address")
         
-        # 检查余额是否足够
-        if request.user.balance < item.price:
-            messages.error(request, "Insufficient balance to complete the purchase.")
+        # 条件更新商品状态、扣除余额并创建交易记录（同一个数据库事务）
+        try:
+            purchase = transitions.purchase_now(item, request.user)
+        except transitions.TransitionError as error:
+            messages.error(request, str(error))
             return redirect('confirm_purchase', item_id=item.id)
 
-        # 扣除余额
-        request.user.balance -= item.price
-        request.user.save()
-
-        # 创建交易记录
-        Transaction.objects.create(
-            buyer=request.user,
-            item=item,
-            total_price=item.price,
-            status="Sold"
+        # 通知卖家、清理购物车等副作用交给后台任务
+        tasks.notify_user.delay(
+            item.seller_id, f"{item.name} was bought by {request.user.username}.", kind='sold', item_id=item.id,
+            idempotency_key=f"purchase:{purchase.id}:notify-seller", priority=5,
         )
-
-        # 更新商品状态
-        item.status = "Sold"
-        item.save()
+        tasks.remove_item_from_carts.delay(item.id, idempotency_key=f"purchase:{purchase.id}:carts")
+        tasks.notify_wishlist_watchers.delay()
 
         messages.success(request, f"Purchase successful! Your item will be shipped to {address}.")
         return redirect('profile_view')
@@ -475,21 +693,34 @@ def process_purchase(request, item_id):
     return redirect('confirm_purchase', item_id=item.id)
 
 
-from django.shortcuts import render
-from django.contrib.auth.decorators import login_required
-from .models import Transaction
 
 @login_required
 def purchase_history(request):
     """ 显示用户的购买记录 """
-    transactions = Transaction.objects.filter(buyer=request.user).order_by('-date_initiated')
-    return render(request, "marketplace/purchase_history.html", {"transactions": transactions})
+    transactions = archive.purchase_history(request.user)  # includes archived purchases
+    return stream_template(request, "marketplace/purchase_history.html", {
+        "transactions": StreamedRows(transactions, "marketplace/partials/transaction_row.html", "transaction"),
+        "form_key": uuid.uuid4().hex,  # idempotency keys for the row actions
+        "export_formats": exports.formats(),
+    })
+
+
+@login_required
+@read_from_replica
+def export_purchase_history(request):
+    """ The user's purchase history (archived purchases included) as a CSV/XLSX download """
+    try:
+        start, end, file_format = _export_params(request)
+    except ValueError as error:
+        return HttpResponseBadRequest(str(error))
+    transactions = archive.purchase_history(request.user, start, end)
+    return exports.export_response(transactions, exports.PURCHASE_COLUMNS, 'purchases', file_format)
 
 
 @login_required
 def add_to_cart(request, item_id):
     """ 处理添加购物车逻辑 """
-    item = get_object_or_404(Item, id=item_id)
+    item = get_object_or_404(Item, id=item_id, status='Available')
 
     # 防止用户添加自己出售的商品
     if item.seller == request.user:
@@ -512,13 +743,9 @@ def view_cart(request):
     return render(request, "marketplace/cart.html", {"cart_items": cart_items})
 
 
-from django.shortcuts import get_object_or_404, redirect, render
-from django.contrib.auth.decorators import login_required
-from django.contrib import messages
-from django.db.models import Q
-from .models import CustomUser, Message
 
 @login_required
+@rate_limit('20/m')
 def send_message(request, receiver_id):
     """ 允许买家和卖家双方互相发送消息 """
     receiver = get_object_or_404(CustomUser, id=receiver_id)
@@ -533,10 +760,6 @@ def send_message(request, receiver_id):
 
     return redirect("message_center_with_id", receiver_id=receiver.id)
 
-from django.shortcuts import render, get_object_or_404, redirect
-from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from .models import CustomUser, Message
 
 @login_required
 def message_center(request, receiver_id=None):
@@ -544,19 +767,8 @@ def message_center(request, receiver_id=None):
     显示最近给当前用户发送信息的最新用户，并默认打开最新的聊天记录。
     """
 
-    # **获取最近的消息（按时间降序排列，最新的在前）**
-    conversations = Message.objects.filter(
-        Q(receiver=request.user)  # 只获取 “别人发送给自己” 的消息
-    ).order_by('-timestamp')
-
-    unique_users = []  # 存储最近与用户聊天的对象（按最新顺序）
-    seen_users = set()
-
-    for message in conversations:
-        sender = message.sender
-        if sender not in seen_users:
-            unique_users.append(sender)
-            seen_users.add(sender)  # 避免重复添加
+    # **最近给自己发消息的用户（按最新顺序），包括已归档的对话**
+    unique_users = archive.recent_senders(request.user)
 
     # **如果 receiver_id 为空，默认选择最新给自己发消息的用户**
     if receiver_id is None and unique_users:
@@ -568,11 +780,8 @@ def message_center(request, receiver_id=None):
     if receiver_id:
         receiver = get_object_or_404(CustomUser, id=receiver_id)
 
-        # **获取当前用户与 `receiver` 的所有聊天记录**
-        messages_list = Message.objects.filter(
-            Q(sender=request.user, receiver=receiver) |
-            Q(sender=receiver, receiver=request.user)
-        ).order_by("timestamp")  # 按时间升序排列（旧 → 新）
+        # **获取当前用户与 `receiver` 的所有聊天记录（含归档），按时间升序排列（旧 → 新）**
+        messages_list = archive.message_thread(request.user, receiver)
 
     return render(request, "marketplace/message_center.html", {
         "messages": messages_list,
@@ -0,0 +1,7 @@
+"""The admin site's URLconf, imported on first use (see student_trading.apps)."""
+from django.contrib import admin
+
+admin.autodiscover()
+
+app_name = 'admin'
+urlpatterns = admin.site.get_urls()
@@ -0,0 +1,73 @@
+"""
+django.contrib.admin without the import of every admin.py at startup.
+
+The stock AdminConfig runs admin.autodiscover() in ready(), so each web and
+task worker imports all ModelAdmins (and what they import) while booting,
+though few requests ever reach /admin/. Here the admin URLconf
+(student_trading.admin_urls) is only imported when a request to /admin/ or a
+reverse() of an admin URL first needs it, and it runs autodiscover() then.
+
+A plain include() would not be enough: the first reverse() of any URL,
+reverse('home') included, builds the root resolver's index, and that
+populates every included URLconf. The admin is mounted with
+LazyURLResolver instead, which the root index leaves alone.
+
+`manage.py check` (and so runserver and the test runner) still autodiscovers
+before the admin checks.
+"""
+from django.contrib.admin.apps import SimpleAdminConfig
+from django.contrib.admin.checks import check_admin_app, check_dependencies
+from django.core import checks
+from django.urls.resolvers import RoutePattern, URLResolver
+from django.utils.translation import get_language
+
+
+def check_registered_admins(app_configs, **kwargs):
+    """The stock admin check, once every ModelAdmin has been registered."""
+    from django.contrib import admin
+
+    admin.autodiscover()
+    return check_admin_app(app_configs, **kwargs)
+
+
+class LazyAdminConfig(SimpleAdminConfig):
+    def ready(self):
+        checks.register(check_dependencies, checks.Tags.admin)
+        checks.register(check_registered_admins, checks.Tags.admin)
+
+
+class LazyURLResolver(URLResolver):
+    """
+    A namespaced include whose URLconf is imported on its own first use.
+
+    The parent resolver calls _populate() on every child while it indexes its
+    own URLs, but only reads a namespaced child's app_name and namespace, so
+    here that call does nothing. The child's index is built when reverse()
+    first asks it for one; resolving a request imports the URLconf as usual.
+    """
+
+    def _populate(self):
+        pass
+
+    def _index(self, attribute):
+        if get_language() not in self._reverse_dict:
+            super()._populate()
+        return getattr(self, attribute)[get_language()]
+
+    @property
+    def reverse_dict(self):
+        return self._index('_reverse_dict')
+
+    @property
+    def namespace_dict(self):
+        return self._index('_namespace_dict')
+
+    @property
+    def app_dict(self):
+        return self._index('_app_dict')
+
+
+def lazy_include(route, urlconf_name, app_name, namespace):
+    """path(route, include((urlconf_name, app_name), namespace)) without importing the URLconf."""
+    return LazyURLResolver(RoutePattern(route, is_endpoint=False), urlconf_name,
+                           app_name=app_name, namespace=namespace)
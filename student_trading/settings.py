@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -20,31 +22,40 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
+# Development defaults; gunicorn.conf.py switches DEBUG off for the served
+# site, which then needs DJANGO_SECRET_KEY, DJANGO_ALLOWED_HOSTS and REDIS_URL.
+
 # SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = 'django-insecure-@59&cz@n+n!zh)8z(&-9&=g&0ixrmd%j(1ps+#ci*ht0&gbpjn'
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY',
+                            'django-insecure-@59&cz@n+n!zh)8z(&-9&=g&0ixrmd%j(1ps+#ci*ht0&gbpjn')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.environ.get('DJANGO_DEBUG', '1') == '1'
 
-ALLOWED_HOSTS = []
+# Comma-separated, e.g. DJANGO_ALLOWED_HOSTS=market.example.ac.uk,10.0.0.5
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
 
 
 # Application definition
 
 INSTALLED_APPS = [
-    'django.contrib.admin',
+    'student_trading.apps.LazyAdminConfig',  # django.contrib.admin, autodiscovered on first use
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'marketplace',  # Add our App
-    'rest_framework',  # Django REST Framework
-    'crispy_forms',  # Beautify forms
 ]
 
 MIDDLEWARE = [
+    # First: answers load-balancer probes before host validation, sessions or the database
+    'marketplace.middleware.HealthCheckMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # Before everything that produces a response body; skips pre-compressed static files
+    'marketplace.middleware.CompressionMiddleware',
+    'marketplace.middleware.StaticFilesMiddleware',
+    'marketplace.middleware.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -60,7 +71,6 @@ TEMPLATES = [
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         # 'DIRS': [os.path.join(BASE_DIR, 'marketplace/templates')],
         'DIRS': [BASE_DIR / "marketplace/templates"],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -68,6 +78,16 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Templates are read and compiled once per process; the autoreloader
+            # resets this cache when a template changes under runserver.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
+            # Skip collecting per-node debug info outside development
+            'debug': DEBUG,
         },
     },
 ]
@@ -78,15 +98,137 @@ WSGI_APPLICATION = 'student_trading.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# PRIMARY_DB=/srv/market/db.sqlite3 puts the database elsewhere (relative paths are from BASE_DIR)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'NAME': BASE_DIR / os.environ.get('PRIMARY_DB', 'db.sqlite3'),
+        # A file rather than shared-cache :memory:, so the threaded tests (task
+        # worker, concurrent confirmations) wait on locks (busy timeout) instead
+        # of failing with "table is locked". TestCase rolls each test back without
+        # a commit, so the file costs little outside those TransactionTestCases.
+        # Created and destroyed by the test runner; ignored by git.
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
+# Read replicas for catalogue traffic, e.g. DB_REPLICAS=db_replica.sqlite3
+# (comma-separated; two local SQLite files are enough to exercise the routing)
+for _n, _path in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{_n}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / _path.strip(),
+        # Under test a replica reads the primary's test database, like a replica that has caught up
+        'TEST': {'MIRROR': 'default'},
+    }
+
+REPLICA_DATABASES = [alias for alias in DATABASES if alias.startswith('replica')]
+if REPLICA_DATABASES:
+    # A replica with its own test database that is never written to, i.e. one
+    # that has not caught up yet. Only ReplicaDatabaseTests routes reads to it.
+    DATABASES['lagging_replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db_lagging_replica.sqlite3',
+    }
+
+# Cold storage for archived rows (marketplace.archive). Unset: archive tables
+# live in the main database. ARCHIVE_DB=db_archive.sqlite3 moves them to their
+# own file; create it with `manage.py migrate --database archive`.
+ARCHIVE_DATABASE = None
+if os.environ.get('ARCHIVE_DB'):
+    ARCHIVE_DATABASE = 'archive'
+    DATABASES['archive'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / os.environ['ARCHIVE_DB'],
+    }
+
+# Retention windows before rows are moved to the archive tables (manage.py archive_data)
+ARCHIVE_MESSAGES_AFTER_DAYS = 365  # read messages only
+ARCHIVE_TRANSACTIONS_AFTER_DAYS = 730  # finished (sold, cancelled or refunded) purchases
+ARCHIVE_SOLD_ITEMS_AFTER_DAYS = 365  # once no hot transaction, review or open report points at them
+DATABASE_ROUTERS = ['marketplace.routers.PrimaryReplicaRouter']
+
+# How long a user reads from the primary after their own write
+READ_YOUR_WRITES_SECONDS = 10
+
 AUTH_USER_MODEL = 'marketplace.CustomUser'
 
+# Caching: Redis when REDIS_URL is set, otherwise a per-process memory cache
+REDIS_URL = os.environ.get('REDIS_URL')
+# The cache, rate limits, view counters and live events are shared through
+# Redis. Per-process stand-ins would split them between gunicorn workers:
+# each worker would allow its own share of a rate limit, keep serving a user
+# another worker changed and only stream the events it published itself.
+# DJANGO_LOCAL_STATE=1 accepts that, e.g. for a single-worker trial run.
+if not DEBUG and not REDIS_URL and os.environ.get('DJANGO_LOCAL_STATE') != '1':
+    raise ImproperlyConfigured(
+        "REDIS_URL must be set when DEBUG is off (or set DJANGO_LOCAL_STATE=1 to keep per-process state)."
+    )
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Sessions are read from the cache and only fall back to the DB on a miss;
+# run `manage.py clear_expired_sessions` periodically to purge old rows.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+# Flash messages travel in a cookie instead of rewriting the session
+MESSAGE_STORAGE = 'django.contrib.messages.storage.cookie.CookieStorage'
+
+# The request user is served from the cache (see marketplace.backends), when
+# the cache is shared: invalidation only reaches the cache of the saving process
+AUTHENTICATION_BACKENDS = ['marketplace.backends.CachedModelBackend']
+USER_CACHE = bool(REDIS_URL)
+USER_CACHE_TIMEOUT = 300
+
+# Background tasks: 'database' (run `manage.py run_task_worker`) or 'memory' (tests)
+TASK_BACKEND = 'database'
+
+# Open reports after which a listing is hidden until a moderator reviews it
+REPORT_AUTO_HIDE_THRESHOLD = 5
+
+# Per-endpoint overrides for the @rate_limit defaults in views.py, e.g.
+# {'make_offer': '20/m'}; None switches a limit off (marketplace.ratelimit)
+RATE_LIMITS = {}
+# Seconds a rate-limit call waits on Redis, and seconds on per-process buckets after Redis fails
+RATE_LIMIT_REDIS_TIMEOUT = 0.25
+RATE_LIMIT_REDIS_BACKOFF = 30
+
+# Item view counters (marketplace.viewcounts): buffered, then flushed in batches
+VIEW_COUNTER_BACKEND = 'redis' if REDIS_URL else 'local'
+VIEW_FLUSH_INTERVAL = 30  # seconds
+VIEW_BUFFER_MAX_ITEMS = 1000
+VIEW_DEDUPE_SECONDS = 30 * 60
+
+# Live listing updates on home over server-sent events (marketplace.live)
+LIVE_EVENTS_BACKEND = 'redis' if REDIS_URL else 'memory'
+LIVE_BACKLOG = 1000  # events a reconnecting browser can catch up on
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_STREAM_SECONDS = 300  # then the browser reconnects, freeing the worker thread
+# Streams one worker holds open; keep it below GUNICORN_THREADS (see gunicorn.conf.py)
+LIVE_MAX_STREAMS = int(os.environ.get('LIVE_MAX_STREAMS', 4))
+LIVE_POLL_SECONDS = 10  # how often browsers over the limit poll instead
+
+# Re-posted listings (marketplace.duplicates): 'flag' for moderators, or 'hide' the re-post
+DUPLICATE_ACTION = 'hide'
+DUPLICATE_TEXT_SIMILARITY = 0.8  # estimated Jaccard similarity of name + description
+DUPLICATE_IMAGE_DISTANCE = 6  # bits between primary-image dHashes
+
+# Admin changelists of tables bigger than this show an estimated row count
+# instead of running COUNT(*) (marketplace.admin.EstimatedCountPaginator)
+ADMIN_EXACT_COUNT_LIMIT = 10_000
+# Deleting more rows than this skips the per-object confirmation listing
+ADMIN_DELETE_PREVIEW_LIMIT = 100
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -126,18 +268,34 @@ LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
 # Static files (CSS, JavaScript, Images)
+# marketplace/static is found by the app-directories finder, so no STATICFILES_DIRS.
+# Outside DEBUG, collectstatic writes content-hashed names plus .gz/.br variants
+# and StaticFilesMiddleware serves them with immutable caching.
 STATIC_URL = '/static/'
-STATICFILES_DIRS = [os.path.join(BASE_DIR, "static")]
-STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
+STATIC_ROOT = os.environ.get('STATIC_ROOT', os.path.join(BASE_DIR, "staticfiles"))
+# Cache lifetime for static files without a hashed name
+STATIC_MAX_AGE = 60
+
+# The admin's background CSV exports (marketplace.exports). Outside MEDIA_ROOT,
+# which is served to anyone at MEDIA_URL: only views.download_export, for staff.
+EXPORT_ROOT = os.environ.get('EXPORT_ROOT', os.path.join(BASE_DIR, 'private', 'exports'))
+
+STORAGES = {
+    'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+    'staticfiles': {
+        'BACKEND': ('django.contrib.staticfiles.storage.StaticFilesStorage' if DEBUG
+                    else 'marketplace.storage.CompressedManifestStaticFilesStorage'),
+    },
+    'exports': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': EXPORT_ROOT},
+    },
+}
 
 # Media files (user-uploaded content like images)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
-STATICFILES_DIRS = [
-    os.path.join(BASE_DIR, 'marketplace/static'),
-]
-
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
@@ -19,8 +19,11 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from .apps import lazy_include
+
 urlpatterns = [
-    path('admin/', admin.site.urls),
+    # Loaded on the first admin request or reverse('admin:...'), not at startup (see student_trading.apps)
+    lazy_include('admin/', 'student_trading.admin_urls', 'admin', admin.site.name),
     path('', include('marketplace.urls')),  # Main app routing
     path('accounts/', include('django.contrib.auth.urls')),  # Built-in auth system
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)